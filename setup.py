@@ -40,7 +40,7 @@ if sys.platform == 'darwin':
     py2app_opts = dict(
                        argv_emulation=False,
                        includes=['PySide', 'PySide.QtCore', 'PySide.QtGui',
-                                 'math'],
+                                 'math', 'numpy'],
                        excludes=['PySide.QtNetwork'],
                        plist=plist,
                        #iconfile=icons/plotliberator.icns',
@@ -61,7 +61,9 @@ else:
     extra_options = dict(
          # Normally unix-like platforms will use "setup.py install"
          # and install the main script as such
-         scripts=['src/plotliberator/main.py'],
+         scripts=['src/plotliberator/main.py',
+                  'src/plotliberator/batch.py',
+                  'src/plotliberator/sequence.py'],
      )
 
 setup(name='plotliberator',
@@ -0,0 +1,126 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+import numpy
+
+# Pixels with all channels below this are considered part of a line
+DARK_THRESHOLD = 128
+
+# A row (column) is part of a frame line if at least this fraction of the
+# fullest row (column) is dark
+LINE_FRACTION = 0.5
+
+
+def darkMask(rgb, threshold=DARK_THRESHOLD):
+    '''
+    Returns a boolean mask of the pixels of an (h, w, 3) array that are
+    dark in every channel, so that colored curves are excluded.
+    '''
+    return rgb.max(axis=2) < threshold
+
+
+def lineGroups(fill, threshold):
+    '''
+    Returns a list of (start, stop) index ranges of consecutive entries of
+    fill that are at least threshold.
+    '''
+    strong = (fill >= threshold).astype(numpy.int8)
+    edges = numpy.diff(numpy.concatenate(([0], strong, [0])))
+    starts = numpy.nonzero(edges == 1)[0]
+    stops = numpy.nonzero(edges == -1)[0]
+    return zip(starts.tolist(), stops.tolist())
+
+
+def groupCenter(fill, group):
+    '''
+    Returns the fill weighted center of a group of rows (columns), in pixel
+    coordinates, where a pixel's center is at index + 0.5.
+    '''
+    start, stop = group
+    weights = fill[start:stop]
+    return (weights * numpy.arange(start, stop)).sum() / weights.sum() + 0.5
+
+
+def _runStart(line, end):
+    '''
+    Returns the first index of the run of True values in line ending at end
+    '''
+    gaps = numpy.nonzero(~line[:end + 1])[0]
+    return gaps[-1] + 1 if len(gaps) else 0
+
+
+def _runStop(line, start):
+    '''
+    Returns the index after the run of True values in line starting at start
+    '''
+    gaps = numpy.nonzero(~line[start:])[0]
+    return start + gaps[0] if len(gaps) else len(line)
+
+
+def detectAxisBox(dark, lineFraction=LINE_FRACTION):
+    '''
+    Find the plot frame in a boolean mask of dark pixels, using the row and
+    column projection profiles.
+
+    The outermost strong rows and columns are taken as the frame, at the
+    sub-pixel center of each line. If there is only one horizontal (or
+    vertical) line, it's taken as the x (or y) axis, and the frame extends
+    to the end of the other axis line.
+
+    Returns the (x, y) positions of the corners c1 to c4 (top left, top
+    right, bottom right, bottom left), or None if no frame is found.
+    '''
+    height, width = dark.shape
+    rowFill = dark.sum(axis=1).astype(float)
+    columnFill = dark.sum(axis=0).astype(float)
+    if not rowFill.any():
+        return None
+    rows = lineGroups(rowFill, lineFraction * rowFill.max())
+    columns = lineGroups(columnFill, lineFraction * columnFill.max())
+    if len(rows) > 1 and len(columns) > 1:
+        # Recompute the profiles inside the frame, so that anything outside
+        # it (legends, labels, other panels) doesn't dilute the lines
+        left, right = columns[0][0], columns[-1][1]
+        top, bottom = rows[0][0], rows[-1][1]
+        rowFill = dark[:, left:right].sum(axis=1).astype(float)
+        columnFill = dark[top:bottom].sum(axis=0).astype(float)
+        rows = lineGroups(rowFill, lineFraction * rowFill.max())
+        columns = lineGroups(columnFill, lineFraction * columnFill.max())
+    if not rows or not columns:
+        return None
+
+    bottom = groupCenter(rowFill, rows[-1])
+    left = groupCenter(columnFill, columns[0])
+    if len(rows) > 1:
+        top = groupCenter(rowFill, rows[0])
+    else:
+        # Only an x axis, so the top is the end of the y axis line
+        line = dark[:, columns[0][0]:columns[0][1]].any(axis=1)
+        top = float(_runStart(line, rows[-1][0]))
+    if len(columns) > 1:
+        right = groupCenter(columnFill, columns[-1])
+    else:
+        # Only a y axis, so the right is the end of the x axis line
+        line = dark[rows[-1][0]:rows[-1][1]].any(axis=0)
+        right = float(_runStop(line, columns[0][1] - 1))
+    if right - left < 1. or bottom - top < 1.:
+        return None
+    return [(left, top), (right, top), (right, bottom), (left, bottom)]
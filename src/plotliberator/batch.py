@@ -0,0 +1,244 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import sys
+import os.path
+import argparse
+import glob
+import json
+import re
+import time
+from multiprocessing import Pool, cpu_count
+
+# third party imports
+
+# local imports
+
+# If being run as a script, make sure the plotliberator package is
+# is on the path
+if __name__ == '__main__':
+    try:
+        import plotliberator
+    except ImportError:
+        sys.path.append(
+            os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        import plotliberator
+from plotliberator.data_mapping import (calibrationTransform,
+                                        transformToArray, mapArray)
+from plotliberator.image_array import (iterImageBands, toArgb32,
+                                       bufferArray, RGB_CHANNELS)
+from plotliberator.extraction import columnTrace, dropMissing
+from plotliberator.tiled_image import openImageSource
+from plotliberator.refinement import refinePositions
+from plotliberator import export
+
+
+def loadCalibration(path):
+    '''
+    Load a calibration spec from a JSON file of the form:
+
+        {"corners": [[x, y], [x, y], [x, y], [x, y]],
+         "x1": 0., "x2": 1., "xLog": false,
+         "y1": 0., "y2": 1., "yLog": false,
+         "color": [r, g, b], "tolerance": 40}
+
+    The corners are the pixel positions of c1 to c4, as in PlotScene.
+    '''
+    with open(path) as f:
+        spec = json.load(f)
+    try:
+        calibration = dict(corners=[(float(x), float(y))
+                                    for x, y in spec['corners']],
+                           x1=float(spec['x1']),
+                           x2=float(spec['x2']),
+                           y1=float(spec['y1']),
+                           y2=float(spec['y2']),
+                           xLog=bool(spec.get('xLog', False)),
+                           yLog=bool(spec.get('yLog', False)),
+                           color=tuple(int(v) for v in spec['color']),
+                           tolerance=int(spec.get('tolerance', 40)))
+    except KeyError as e:
+        raise ValueError('missing calibration value: {}'.format(e))
+    if len(calibration['corners']) != 4:
+        raise ValueError('expected 4 corners')
+    if len(calibration['color']) != 3:
+        raise ValueError('expected an (r, g, b) color')
+    return calibration
+
+
+_DIGITS = re.compile(r'(\d+)')
+
+
+def naturalSortKey(path):
+    '''
+    Returns a key that sorts paths with the numbers in them in numeric
+    order, e.g. frame2.png before frame10.png.
+    '''
+    parts = _DIGITS.split(path)
+    parts[1::2] = [int(part) for part in parts[1::2]]
+    return parts
+
+
+def expandPaths(patterns):
+    '''
+    Expand glob patterns, keeping the order of the patterns, and skipping
+    duplicates. The matches of each pattern are sorted naturally.
+    '''
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = (sorted(glob.glob(pattern), key=naturalSortKey) or
+                   [pattern])
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def outputPath(imagePath, outputDir, fmt):
+    if outputDir == '-':
+        return '-'
+    name = os.path.splitext(os.path.basename(imagePath))[0]
+    if outputDir is None:
+        outputDir = os.path.dirname(imagePath)
+    extension = export.FORMATS[fmt][1]
+    return os.path.join(outputDir, '{}.{}'.format(name, extension))
+
+
+def digitize(imagePath, calibration, refineRadius=0):
+    '''
+    Extract the calibrated data of a curve from an image file. If
+    refineRadius is nonzero, each point is moved to the centroid of the
+    curve pixels within that many pixels of it.
+
+    Returns an Nx2 array of (x, y) data.
+    '''
+    image = openImageSource(imagePath).image()
+    if image.isNull():
+        raise IOError('cannot load {}'.format(imagePath))
+    transform = calibrationTransform(calibration['corners'],
+                                     calibration['x1'], calibration['x2'],
+                                     calibration['y1'], calibration['y2'],
+                                     calibration['xLog'], calibration['yLog'])
+    if transform is None:
+        raise ValueError('degenerate axis corners')
+    # The process pool already keeps every core busy
+    trace = columnTrace(iterImageBands(image), image.width(),
+                        calibration['color'], calibration['tolerance'],
+                        RGB_CHANNELS, threads=1)
+    positions = dropMissing(trace)
+    if refineRadius:
+        positions = refinePositions(bufferArray(toArgb32(image)), positions,
+                                    refineRadius, RGB_CHANNELS,
+                                    calibration['color'],
+                                    calibration['tolerance'])
+    return mapArray(transformToArray(transform), positions,
+                    calibration['xLog'], calibration['yLog'])
+
+
+def _digitizeJob(job):
+    '''
+    Process pool worker. Returns an (imagePath, npoints, data, seconds, error)
+    tuple. The data is only sent back when streaming to stdout (otherwise
+    it's None), so that the parent process writes it without interleaving.
+    '''
+    imagePath, savePath, calibration, fmt, refineRadius = job
+    start = time.time()
+    try:
+        data = digitize(imagePath, calibration, refineRadius)
+        if savePath != '-':
+            export.writeData(savePath, data, fmt)
+    except Exception as e:
+        return imagePath, 0, None, time.time() - start, str(e)
+    if savePath != '-':
+        return imagePath, len(data), None, time.time() - start, None
+    return imagePath, len(data), data, time.time() - start, None
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract curve data from plot images without the GUI.')
+    parser.add_argument('calibration',
+                        help='JSON calibration spec')
+    parser.add_argument('images', nargs='+',
+                        help='image files or glob patterns')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help="output directory (default: next to each "
+                             "image), or '-' to stream to stdout, with a "
+                             "'# IMAGE' line before each image's data")
+    parser.add_argument('-f', '--format', choices=list(export.FORMATS),
+                        default='txt', help='output format')
+    parser.add_argument('-j', '--jobs', type=int, default=cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('-r', '--refine', type=int, default=0,
+                        metavar='RADIUS',
+                        help='move each point to the centroid of the curve '
+                             'pixels within RADIUS pixels (default: off)')
+    args = parser.parse_args(argv)
+
+    try:
+        calibration = loadCalibration(args.calibration)
+    except (IOError, ValueError) as e:
+        parser.error('invalid calibration: {}'.format(e))
+    toStdout = args.output_dir == '-'
+    if toStdout and args.format not in export.STREAM_FORMATS:
+        parser.error('cannot stream {} to stdout'.format(args.format))
+    imagePaths = expandPaths(args.images)
+    if toStdout and args.format == 'npy' and len(imagePaths) > 1:
+        parser.error('cannot stream npy data of several images to stdout')
+    if (args.output_dir is not None and not toStdout and
+            not os.path.isdir(args.output_dir)):
+        os.makedirs(args.output_dir)
+    jobs = [(path, outputPath(path, args.output_dir, args.format),
+             calibration, args.format, args.refine)
+            for path in imagePaths]
+
+    # Keep stdout clean for the data when streaming
+    log = sys.stderr if toStdout else sys.stdout
+    start = time.time()
+    failures = 0
+    pool = Pool(max(args.jobs, 1))
+    # Streamed blocks are written in the order of the images, each after a
+    # header naming its image, so they can be told apart
+    imap = pool.imap if toStdout else pool.imap_unordered
+    try:
+        for path, npoints, data, seconds, error in imap(_digitizeJob, jobs):
+            if error is None:
+                if data is not None:
+                    if args.format != 'npy':
+                        sys.stdout.write('# {}\n'.format(path))
+                    export.writeData('-', data, args.format)
+                log.write('{}: {} points in {:.3f} s\n'.format(
+                                                path, npoints, seconds))
+            else:
+                failures += 1
+                log.write('{}: failed after {:.3f} s: {}\n'.format(
+                                                path, seconds, error))
+    finally:
+        pool.close()
+        pool.join()
+    log.write('Processed {} images in {:.3f} s ({} failed)\n'.format(
+                            len(jobs), time.time() - start, failures))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(run())
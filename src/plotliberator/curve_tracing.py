@@ -0,0 +1,284 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from math import atan2, cos, sin, pi
+
+# third party imports
+import numpy
+
+# Distance between traced points, in pixels
+TRACE_STEP = 3.
+
+# Largest turn between traced points
+MAX_TURN = pi / 3.
+
+# Longest gap in a curve that is bridged, in pixels
+MAX_GAP = 12.
+
+# Seeds snap to the nearest curve pixel within this many pixels
+SEED_RADIUS = 8
+
+# Pixels that differ from the background by more than this in any channel
+# are taken as curve pixels when seeding
+SEED_TOLERANCE = 40
+
+# Half the width of the line across the curve used to center traced points
+CENTER_RADIUS = 5
+
+_FAN_SAMPLES = 15
+_START_SAMPLES = 36
+
+
+def _runs(hits):
+    '''
+    Returns the (start, stop) indices of the runs of true values in hits
+    '''
+    runs = []
+    start = None
+    for i, hit in enumerate(hits):
+        if hit and start is None:
+            start = i
+        elif not hit and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(hits)))
+    return runs
+
+
+def findSeed(pixels, x, y, channels=(0, 1, 2), radius=SEED_RADIUS,
+             tolerance=SEED_TOLERANCE):
+    '''
+    Returns the (x, y) center and (r, g, b) color of the pixel nearest to
+    (x, y) that isn't background, or None if there is none within radius.
+    The background is the median color of the pixels within radius, so
+    that a curve is preferred over darker axes or gridlines further away.
+    '''
+    height, width = pixels.shape[:2]
+    left = max(int(x) - radius, 0)
+    top = max(int(y) - radius, 0)
+    right = min(int(x) + radius + 1, width)
+    bottom = min(int(y) + radius + 1, height)
+    if left >= right or top >= bottom:
+        return None
+    window = pixels[top:bottom, left:right][..., list(channels)]
+    window = window.astype(numpy.int16)
+    background = numpy.median(window.reshape(-1, window.shape[-1]), axis=0)
+    foreground = (numpy.abs(window - background) > tolerance).any(axis=-1)
+    if not foreground.any():
+        return None
+    rows, columns = numpy.ogrid[top:bottom, left:right]
+    distance = (rows + 0.5 - y) ** 2 + (columns + 0.5 - x) ** 2
+    distance = numpy.where(foreground, distance, numpy.inf)
+    row, column = numpy.unravel_index(distance.argmin(), distance.shape)
+    color = tuple(int(v) for v in window[row, column])
+    return (left + column + 0.5, top + row + 0.5), color
+
+
+class CurveTracer(object):
+    '''
+    Follows a curve through a mask of its pixels, predicting the direction
+    of each step from the previous ones so that it continues straight
+    through crossing curves, gridlines, and small gaps.
+
+    The mask is kept as a flat bytearray, since the tracer only reads a few
+    dozen pixels per step, and indexing it directly is much faster than
+    going through numpy.
+    '''
+
+    def __init__(self, mask, step=TRACE_STEP, maxGap=MAX_GAP):
+        '''
+        Parameters
+        ----------
+        mask : ndarray
+            (height, width) boolean array of the curve pixels
+        step : float
+            distance between traced points, in pixels
+        maxGap : float
+            longest gap in the curve that is bridged, in pixels
+        '''
+        self._height, self._width = mask.shape
+        self._step = step
+        self._maxGap = maxGap
+        self._turns = [-MAX_TURN + 2 * MAX_TURN * i / (_FAN_SAMPLES - 1)
+                       for i in xrange(_FAN_SAMPLES)]
+        self._orders = {}
+        # Traced points are always on the curve, so no sample is further
+        # outside the image than this, and padding the mask with it saves
+        # bounds checks.
+        self._pad = int(step) + CENTER_RADIUS + 2
+        padded = numpy.pad(numpy.asarray(mask, dtype=numpy.uint8),
+                           self._pad, 'constant')
+        self._paddedWidth = padded.shape[1]
+        self._mask = bytearray(padded.tostring())
+
+    def contains(self, x, y):
+        return 0 <= x < self._width and 0 <= y < self._height
+
+    def hit(self, x, y):
+        '''
+        Returns whether the pixel at (x, y) is part of the curve
+        '''
+        if 0 <= x < self._width and 0 <= y < self._height:
+            return self._mask[int(y + self._pad) * self._paddedWidth +
+                              int(x + self._pad)]
+        return 0
+
+    def runNear(self, sample, count):
+        '''
+        Returns the (start, stop) indices of the run of curve pixels nearest
+        the middle of a line of count samples, where sample(i) returns
+        whether the i-th sample is a curve pixel, or None if none are.
+        Samples are read from the middle out, and only as far as needed.
+        '''
+        order = self._orders.get(count)
+        if order is None:
+            middle = (count - 1) / 2.
+            order = sorted(xrange(count), key=lambda i: abs(i - middle))
+            self._orders[count] = order
+        for i in order:
+            if sample(i):
+                break
+        else:
+            return None
+        start = i
+        while start > 0 and sample(start - 1):
+            start -= 1
+        stop = i + 1
+        while stop < count and sample(stop):
+            stop += 1
+        return start, stop
+
+    def center(self, x, y, heading):
+        '''
+        Returns (x, y) moved to the middle of the curve, measured across the
+        heading. If the curve is too wide to measure there, for example at a
+        crossing, (x, y) is returned unchanged.
+        '''
+        mask = self._mask
+        width = self._paddedWidth
+        nx = -sin(heading)
+        ny = cos(heading)
+        # Padded coordinates of the first sample
+        x0 = x + self._pad - CENTER_RADIUS * nx
+        y0 = y + self._pad - CENTER_RADIUS * ny
+        count = 2 * CENTER_RADIUS + 1
+        run = self.runNear(lambda i: mask[int(y0 + i * ny) * width +
+                                          int(x0 + i * nx)], count)
+        if run is None or run[0] == 0 or run[1] == count:
+            return x, y
+        shift = (run[0] + run[1] - 1) / 2. - CENTER_RADIUS
+        return x + shift * nx, y + shift * ny
+
+    def startHeadings(self, x, y):
+        '''
+        Returns the headings in which the curve leaves (x, y): one for an end
+        of the curve, two otherwise, or none if (x, y) isn't on a curve.
+        '''
+        angleStep = 2 * pi / _START_SAMPLES
+        hits = [self.hit(x + self._step * cos(i * angleStep),
+                         y + self._step * sin(i * angleStep))
+                for i in xrange(_START_SAMPLES)]
+        if all(hits) or not any(hits):
+            return []
+        # Rotate a miss to the front, so that no run wraps around
+        roll = hits.index(0)
+        hits = hits[roll:] + hits[:roll]
+        runs = sorted(_runs(hits), key=lambda run: run[1] - run[0],
+                      reverse=True)
+        headings = [((start + stop - 1) / 2. + roll) * angleStep
+                    for start, stop in runs]
+        forward = headings[0]
+        # The heading back is the one most opposite the heading forward
+        best = None
+        for heading in headings[1:]:
+            turn = abs((heading - forward + pi) % (2 * pi) - pi)
+            if turn > pi / 2 and (best is None or turn > best[0]):
+                best = turn, heading
+        if best is None:
+            return [forward]
+        return [forward, best[1]]
+
+    def follow(self, x, y, heading, maxPoints):
+        '''
+        Returns the list of (x, y) points along the curve from (x, y),
+        starting in the given heading.
+        '''
+        step = self._step
+        mask = self._mask
+        width = self._paddedWidth
+        pad = self._pad
+        turnCos = [cos(turn) for turn in self._turns]
+        turnSin = [sin(turn) for turn in self._turns]
+        points = []
+        startX, startY = x, y
+        gap = 0.
+        while len(points) < maxPoints:
+            # Fan out samples around the predicted heading
+            dx = step * cos(heading)
+            dy = step * sin(heading)
+            px = x + pad
+            py = y + pad
+            run = self.runNear(lambda i: mask[
+                    int(py + dy * turnCos[i] + dx * turnSin[i]) * width +
+                    int(px + dx * turnCos[i] - dy * turnSin[i])], _FAN_SAMPLES)
+            if run is None:
+                # Coast across the gap in the predicted heading
+                x += dx
+                y += dy
+                gap += step
+                if gap > self._maxGap or not self.contains(x, y):
+                    break
+                continue
+            angle = heading + (self._turns[run[0]] +
+                               self._turns[run[1] - 1]) / 2.
+            nextX, nextY = self.center(x + step * cos(angle),
+                                       y + step * sin(angle), angle)
+            # Blend the new direction with the old one, so the prediction
+            # carries through crossings.
+            heading = atan2(nextY - y + dy, nextX - x + dx)
+            x, y = nextX, nextY
+            gap = 0.
+            points.append((x, y))
+            # Stop when a closed curve comes back around
+            if (len(points) > 2 and
+                    (x - startX) ** 2 + (y - startY) ** 2 < step ** 2):
+                break
+        return points
+
+    def trace(self, x, y, maxPoints=None):
+        '''
+        Trace the curve through (x, y) in both directions, and return an Nx2
+        array of the ordered points along it, or an empty array if (x, y)
+        isn't on a curve.
+        '''
+        if maxPoints is None:
+            maxPoints = int(4 * (self._width + self._height) / self._step)
+        headings = self.startHeadings(x, y)
+        if not headings:
+            return numpy.empty((0, 2))
+        forward = self.follow(x, y, headings[0], maxPoints)
+        if len(headings) > 1:
+            backward = self.follow(x, y, headings[1], maxPoints)
+        else:
+            backward = []
+        points = backward[::-1] + [(x, y)] + forward
+        return numpy.array(points, dtype=numpy.float64)
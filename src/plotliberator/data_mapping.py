@@ -0,0 +1,100 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from math import log
+
+# third party imports
+import numpy
+from PySide import QtGui, QtCore
+
+
+def calibrationTransform(corners, x1, x2, y1, y2, xLog=False, yLog=False):
+    '''
+    Returns the QTransform that maps the axis corners to the axis values,
+    or None if the corners are degenerate.
+
+    Parameters
+    ----------
+    corners : sequence
+        the (x, y) scene positions of the axis corners, ordered as:
+            c1  c2
+
+            c4  c3
+    x1, x2, y1, y2 : float
+        the axis values at the corners. x1 and y1 correspond to c4.
+    xLog, yLog : bool
+        if True, the corresponding axis is logarithmic
+    '''
+    inPolygon = QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in corners])
+    if xLog:
+        x1 = log(x1)
+        x2 = log(x2)
+    if yLog:
+        y1 = log(y1)
+        y2 = log(y2)
+    outPolygon = QtGui.QPolygonF((QtCore.QPointF(x1, y2),
+                                  QtCore.QPointF(x2, y2),
+                                  QtCore.QPointF(x2, y1),
+                                  QtCore.QPointF(x1, y1)))
+    return QtGui.QTransform.quadToQuad(inPolygon, outPolygon)
+
+
+def transformToArray(transform):
+    '''
+    Returns the 3x3 matrix of a QTransform as a numpy array.
+
+    The matrix uses the same row vector convention as QTransform, i.e.
+    [x', y', w'] = [x, y, 1] * M.
+    '''
+    return numpy.array([[transform.m11(), transform.m12(), transform.m13()],
+                        [transform.m21(), transform.m22(), transform.m23()],
+                        [transform.m31(), transform.m32(), transform.m33()]])
+
+
+def mapArray(matrix, points, xLog=False, yLog=False):
+    '''
+    Map an Nx2 array of scene coordinates to data coordinates.
+
+    Parameters
+    ----------
+    matrix : ndarray
+        3x3 projective matrix, as returned by `transformToArray`
+    points : array_like
+        Nx2 array of (x, y) scene coordinates
+    xLog, yLog : bool
+        if True, the corresponding axis is logarithmic, and the mapped
+        values are exponentiated
+
+    Returns
+    -------
+    data : ndarray
+        Nx2 array of (x, y) data coordinates
+    '''
+    points = numpy.asarray(points, dtype=float).reshape(-1, 2)
+    mapped = numpy.dot(points, matrix[:2]) + matrix[2]
+    data = mapped[:, :2]
+    if matrix[0, 2] != 0. or matrix[1, 2] != 0. or matrix[2, 2] != 1.:
+        data /= mapped[:, 2:]
+    if xLog:
+        numpy.exp(data[:, 0], out=data[:, 0])
+    if yLog:
+        numpy.exp(data[:, 1], out=data[:, 1])
+    return numpy.ascontiguousarray(data)
@@ -0,0 +1,172 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+import numpy
+from PySide import QtCore
+from PySide.QtCore import Qt
+
+COLUMNS = ('x', 'y', 'Pixel x', 'Pixel y')
+
+
+class DataTableModel(QtCore.QAbstractTableModel):
+    '''
+    A table of the data points of a PlotScene, with one row per row of its
+    PointStore, and columns for the data and scene coordinates.
+
+    Views only ask for the rows they show, and the mapped data is cached,
+    so formatting is the only per-row cost. Moved points remap just their
+    rows, removed points drop just their rows, and a calibration change
+    remaps the data columns all at once.
+    '''
+
+    def __init__(self, scene, parent=None):
+        super(DataTableModel, self).__init__(parent)
+        self._scene = scene
+        self._store = scene.dataPoints
+        self._rowCount = len(self._store)
+        self._data = None  # mapped lazily
+
+        scene.pointsAdded.connect(self.pointsAdded)
+        scene.pointRemoved.connect(self.pointRemoved)
+        scene.pointsMoved.connect(self.pointsMoved)
+        scene.pointsRemoved.connect(self.pointsRemoved)
+        scene.pointsReset.connect(self.pointsReset)
+        scene.calibrationChanged.connect(self.calibrationChanged)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rowCount
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return COLUMNS[section]
+        return section + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            if role == Qt.TextAlignmentRole:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            return None
+        row = index.row()
+        column = index.column()
+        if column < 2:
+            value = self.mappedData()[row, column]
+        else:
+            value = self._store.positions()[row, column - 2]
+        return '{:.6g}'.format(value)
+
+    def mappedData(self):
+        '''
+        Returns the Nx2 array of the data of every row, mapping it if needed
+        '''
+        if self._data is None:
+            self._data = self._scene.mapToDataArray(self._store.positions())
+        return self._data
+
+    def pointId(self, row):
+        '''
+        Returns the id of the point in a row
+        '''
+        return int(self._store.ids()[row])
+
+    def _columnsChanged(self, firstRow, lastRow, firstColumn, lastColumn):
+        self.dataChanged.emit(self.index(firstRow, firstColumn),
+                              self.index(lastRow, lastColumn))
+
+    @QtCore.Slot(int)
+    def pointsAdded(self, count):
+        # Apply a pending calibration change first, since it emits
+        # dataChanged for every row, which mustn't happen mid insert
+        self._scene.flushCalibration()
+        first = self._rowCount
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + count - 1)
+        self._rowCount += count
+        if self._data is not None:
+            added = self._scene.mapToDataArray(
+                                        self._store.positions()[first:])
+            self._data = numpy.concatenate((self._data, added))
+        self.endInsertRows()
+
+    @QtCore.Slot(int)
+    def pointRemoved(self, row):
+        last = self._rowCount - 1
+        self.beginRemoveRows(QtCore.QModelIndex(), last, last)
+        self._rowCount = last
+        if self._data is not None:
+            self._data[row] = self._data[last]
+            self._data = self._data[:last]
+        self.endRemoveRows()
+        if row < last:
+            self._columnsChanged(row, row, 0, len(COLUMNS) - 1)
+
+    @QtCore.Slot(object)
+    def pointsMoved(self, ids):
+        if not len(ids):
+            return
+        # Apply a pending calibration change first, which drops the cached
+        # data
+        self._scene.flushCalibration()
+        rows = self._store.rowsOf(ids)
+        if self._data is not None:
+            self._data[rows] = self._scene.mapToDataArray(
+                                                self._store.positions()[rows])
+        self._columnsChanged(int(rows.min()), int(rows.max()),
+                             0, len(COLUMNS) - 1)
+
+    @QtCore.Slot(object)
+    def pointsRemoved(self, rows):
+        # The store keeps the order of the other points, so each run of
+        # adjacent removed rows is one removal
+        if not len(rows):
+            return
+        if self._data is not None:
+            keep = numpy.ones(len(self._data), dtype=bool)
+            keep[rows] = False
+            self._data = self._data[keep]
+        breaks = numpy.flatnonzero(numpy.diff(rows) != 1) + 1
+        starts = rows[numpy.append(0, breaks)].tolist()
+        stops = rows[numpy.append(breaks - 1, len(rows) - 1)].tolist()
+        # Remove the last runs first, so the earlier rows keep their numbers
+        for first, last in reversed(zip(starts, stops)):
+            self.beginRemoveRows(QtCore.QModelIndex(), first, last)
+            self._rowCount -= last - first + 1
+            self.endRemoveRows()
+
+    @QtCore.Slot()
+    def pointsReset(self):
+        self.beginResetModel()
+        self._rowCount = len(self._store)
+        self._data = None
+        self.endResetModel()
+
+    @QtCore.Slot()
+    def calibrationChanged(self):
+        self._data = None
+        if self._rowCount:
+            self._columnsChanged(0, self._rowCount - 1, 0, 1)
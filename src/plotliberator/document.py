@@ -0,0 +1,125 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from collections import OrderedDict
+
+DOCUMENT_MEMORY_BUDGET = 1024 * 1024 * 1024  # bytes
+
+
+class Document(object):
+    '''
+    An open plot, with its own PlotScene and data table model. While the
+    document isn't shown, the main window's state for it is kept here, and
+    its image may be released to free memory. Its axes and data points
+    always stay in memory.
+    '''
+
+    def __init__(self, plotScene, dataTableModel):
+        self.plotScene = plotScene
+        self.dataTableModel = dataTableModel
+        self.filepath = ''
+        self.pagesPath = None
+        self.pageCount = 1
+        self.currentPage = 0
+        self.pageStates = {}
+        self.thumbnails = {}
+        self.sessionWriter = None
+        self.viewTransform = None
+
+        # Until the document is saved as a named session, it's autosaved to
+        # its own file, so it can be recovered after a crash
+        self.autosaveWriter = None
+        self.viewCenter = None
+
+        # Set if the image has to be loaded again when the document is
+        # shown, with the pending calibration and data points, if any
+        self.needsLoad = False
+        self.pendingSession = None
+
+    def isReloadable(self):
+        return self.pagesPath is not None
+
+    def imageMemory(self):
+        return self.plotScene.imageMemory()
+
+    def releaseImage(self):
+        '''
+        Drop the image, to be reloaded from its file the next time the
+        document is shown.
+        '''
+        self.plotScene.releaseImage()
+        self.needsLoad = True
+
+
+class DocumentCache(object):
+    '''
+    A least recently used set of documents, which releases the images of
+    the least recently used ones while their total memory is over budget.
+    '''
+
+    def __init__(self, budget=DOCUMENT_MEMORY_BUDGET):
+        self._documents = OrderedDict()  # least recently used first
+        self._budget = budget
+
+    def __len__(self):
+        return len(self._documents)
+
+    def __contains__(self, document):
+        return document in self._documents
+
+    def budget(self):
+        return self._budget
+
+    def setBudget(self, budget):
+        self._budget = budget
+
+    def nbytes(self):
+        return sum(document.imageMemory() for document in self._documents)
+
+    def touch(self, document):
+        '''
+        Add a document, or mark it as the most recently used.
+        '''
+        self._documents.pop(document, None)
+        self._documents[document] = None
+
+    def remove(self, document):
+        self._documents.pop(document, None)
+
+    def evict(self, active=None):
+        '''
+        Release the images of the least recently used documents, other than
+        the active one, until their total memory is within budget. Returns
+        a list of the released documents.
+        '''
+        sizes = [(document, document.imageMemory())
+                 for document in self._documents]
+        nbytes = sum(size for _document, size in sizes)
+        released = []
+        for document, size in sizes:
+            if nbytes <= self._budget:
+                break
+            if document is active or size == 0 or not document.isReloadable():
+                continue
+            document.releaseImage()
+            nbytes -= size
+            released.append(document)
+        return released
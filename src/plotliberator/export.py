@@ -0,0 +1,128 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import sys
+import os.path
+from collections import OrderedDict
+
+# third party imports
+import numpy
+try:
+    import h5py
+except ImportError:
+    h5py = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Rows formatted per write when writing text
+CHUNK_SIZE = 65536
+
+# name -> (description, extension). HDF5 and Parquet are only available
+# if h5py and pyarrow are installed.
+FORMATS = OrderedDict([
+    ('txt', ('Tab Delimited Text', 'txt')),
+    ('csv', ('Comma Separated Values', 'csv')),
+    ('npy', ('NumPy Array', 'npy')),
+    ('npz', ('NumPy Zipped Arrays', 'npz')),
+    ])
+if h5py is not None:
+    FORMATS['hdf5'] = ('HDF5', 'h5')
+if pyarrow is not None:
+    FORMATS['parquet'] = ('Parquet', 'parquet')
+
+# Formats that can be written to a non-seekable stream, e.g. stdout
+STREAM_FORMATS = ('txt', 'csv', 'npy')
+
+DELIMITERS = {'txt': '\t', 'csv': ','}
+
+
+def formatFromPath(path):
+    '''
+    Returns the name of the format with the path's extension, or None.
+    '''
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    for name, (_description, formatExtension) in FORMATS.iteritems():
+        if extension == formatExtension:
+            return name
+    return None
+
+
+def writeText(f, data, delimiter, chunkSize=CHUNK_SIZE):
+    '''
+    Write an Nx2 array to a file object as delimited text, formatting
+    chunkSize rows per write.
+    '''
+    row = '%E{}%E\n'.format(delimiter)
+    for start in xrange(0, len(data), chunkSize):
+        chunk = data[start:start + chunkSize]
+        f.write((row * len(chunk)) % tuple(chunk.ravel()))
+
+
+def writeData(path, data, fmt=None, chunkSize=CHUNK_SIZE):
+    '''
+    Write an Nx2 array of (x, y) data.
+
+    Parameters
+    ----------
+    path : str
+        the file path, or '-' to stream to stdout
+    data : ndarray
+        Nx2 array of data
+    fmt : str or None
+        the name of one of the FORMATS. If None, it's chosen from the
+        extension of path (or 'txt' for stdout).
+    chunkSize : int
+        rows formatted per write for text formats
+    '''
+    data = numpy.asarray(data, dtype=float).reshape(-1, 2)
+    if fmt is None:
+        fmt = 'txt' if path == '-' else formatFromPath(path)
+    if fmt not in FORMATS:
+        raise ValueError('unsupported format: {}'.format(fmt))
+    if path == '-':
+        if fmt not in STREAM_FORMATS:
+            raise ValueError('cannot stream {} to stdout'.format(fmt))
+        _writeStream(sys.stdout, data, fmt, chunkSize)
+        sys.stdout.flush()
+    elif fmt == 'hdf5':
+        with h5py.File(path, 'w') as f:
+            f.create_dataset('x', data=data[:, 0])
+            f.create_dataset('y', data=data[:, 1])
+    elif fmt == 'parquet':
+        table = pyarrow.Table.from_arrays([pyarrow.array(data[:, 0]),
+                                           pyarrow.array(data[:, 1])],
+                                          names=['x', 'y'])
+        pyarrow.parquet.write_table(table, path)
+    elif fmt == 'npz':
+        numpy.savez(path, x=data[:, 0], y=data[:, 1])
+    else:
+        with open(path, 'wb') as f:
+            _writeStream(f, data, fmt, chunkSize)
+
+
+def _writeStream(f, data, fmt, chunkSize):
+    if fmt == 'npy':
+        numpy.save(f, data)
+    else:
+        writeText(f, data, DELIMITERS[fmt], chunkSize)
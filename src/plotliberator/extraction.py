@@ -0,0 +1,134 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+# third party imports
+import numpy
+
+
+def colorMask(pixels, color, tolerance, channels=(0, 1, 2)):
+    '''
+    Returns a boolean mask of the pixels whose color is within tolerance of
+    the given color.
+
+    Parameters
+    ----------
+    pixels : ndarray
+        (..., nchannels) uint8 array of pixels
+    color : tuple
+        the target (r, g, b) color
+    tolerance : int
+        the maximum difference allowed in each of the r, g, and b channels
+    channels : tuple
+        the indices of the r, g, and b channels in pixels
+    '''
+    mask = None
+    for value, channel in zip(color, channels):
+        low = max(int(value) - tolerance, 0)
+        span = min(int(value) + tolerance, 255) - low
+        # The uint8 subtraction wraps around, so values below low become
+        # large, and a single comparison checks both bounds.
+        inRange = numpy.subtract(pixels[..., channel], low,
+                                 dtype=numpy.uint8) <= span
+        if mask is None:
+            mask = inRange
+        else:
+            mask &= inRange
+    return mask
+
+
+def _bandColumnSums(band, color, tolerance, channels):
+    mask = colorMask(band, color, tolerance, channels).astype(numpy.float32)
+    rows = numpy.arange(mask.shape[0], dtype=numpy.float32)
+    counts = numpy.ones(mask.shape[0], dtype=numpy.float32).dot(mask)
+    rowSums = rows.dot(mask)
+    return counts, rowSums
+
+
+def columnTrace(bands, width, color, tolerance, channels=(0, 1, 2),
+                minCount=1, threads=None):
+    '''
+    Reduces the pixels matching a color to one point per image column, at
+    the mean height of the matching pixels.
+
+    Parameters
+    ----------
+    bands : iterable
+        (y0, band) tuples, as yielded by `image_array.iterImageBands`
+    width : int
+        the image width
+    color, tolerance, channels :
+        passed on to `colorMask`
+    minCount : int
+        the minimum number of matching pixels for a column to be traced
+    threads : int or None
+        number of bands to process concurrently. Defaults to the number of
+        CPUs.
+
+    Returns
+    -------
+    trace : ndarray
+        (width, 2) array of (x, y) pixel center positions in scene
+        coordinates. The y value is NaN for columns without a match.
+    '''
+    if threads is None:
+        threads = cpu_count()
+    counts = numpy.zeros(width)
+    rowSums = numpy.zeros(width)
+
+    def reduceBand(item):
+        y0, band = item
+        return (y0,) + _bandColumnSums(band, color, tolerance, channels)
+
+    def accumulate(y0, bandCounts, bandRowSums):
+        # The band sums are relative to the band's first row, which keeps
+        # them exact in float32
+        counts[:] += bandCounts
+        rowSums[:] += bandRowSums
+        rowSums[:] += y0 * bandCounts.astype(float)
+
+    if threads > 1:
+        pool = ThreadPool(threads)
+        try:
+            for result in pool.imap_unordered(reduceBand, bands):
+                accumulate(*result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for item in bands:
+            accumulate(*reduceBand(item))
+
+    trace = numpy.empty((width, 2))
+    trace[:, 0] = numpy.arange(width) + 0.5
+    trace[:, 1] = numpy.nan
+    traced = counts >= minCount
+    trace[traced, 1] = rowSums[traced] / counts[traced] + 0.5
+    return trace
+
+
+def dropMissing(trace):
+    '''
+    Returns the rows of an Nx2 trace that don't contain NaNs.
+    '''
+    return trace[~numpy.isnan(trace).any(axis=1)]
@@ -19,6 +19,7 @@
 #############################################################################
 
 # third party imports
+import numpy
 from PySide import QtGui, QtCore
 from PySide.QtCore import Qt
 
@@ -51,6 +52,10 @@ class PenItemBase(QtGui.QGraphicsObject):
 class MovableItemBase(PenItemBase):
     posChanged = QtCore.Signal(QtCore.QPointF)
 
+    # If set, called with each new position, and returns the position to
+    # move to instead
+    snapFunction = None
+
     def __init__(self, parent=None, scene=None):
         super(MovableItemBase, self).__init__(parent, scene)
 
@@ -58,9 +63,13 @@ class MovableItemBase(PenItemBase):
         self.setAcceptTouchEvents(True)
         self.setFlag(QtGui.QGraphicsItem.ItemIsMovable)
         self.setFlag(QtGui.QGraphicsItem.ItemSendsScenePositionChanges)
+        self.setFlag(QtGui.QGraphicsItem.ItemSendsGeometryChanges)
         self.setCursor(Qt.CrossCursor)
 
     def itemChange(self, change, value):
+        if (change == QtGui.QGraphicsItem.ItemPositionChange and
+                self.snapFunction is not None):
+            return self.snapFunction(value)
         if change == QtGui.QGraphicsItem.ItemPositionHasChanged:
             self.posChanged.emit(value)
         return super(MovableItemBase, self).itemChange(change, value)
@@ -244,8 +253,9 @@ class MovableLineItem(MovableItemBase):
 class GuideLineItem(PenItemBase):
     '''
     A guide line passing through the c1 and c2 MovableCursorItems,
-    and extending across the entire scene. When c1 and c2 are changed,
-    it will update.
+    and extending across the entire scene. If track is True, it will update
+    whenever c1 or c2 move. Otherwise, handleChange must be called after
+    they move.
     '''
 
     _length = 0.
@@ -257,7 +267,7 @@ class GuideLineItem(PenItemBase):
     _line12 = QtCore.QLineF()
     _line = QtCore.QLineF()
 
-    def __init__(self, c1, c2, parent=None, scene=None):
+    def __init__(self, c1, c2, track=True, parent=None, scene=None):
         '''
         c1 and c2 must have the same parent (or, if there is no parent,
         the same scene) as this object.
@@ -269,8 +279,9 @@ class GuideLineItem(PenItemBase):
         self.handleChange()
 
         # Connect signals and slots
-        self._c1.posChanged.connect(self.handleChange)
-        self._c2.posChanged.connect(self.handleChange)
+        if track:
+            self._c1.posChanged.connect(self.handleChange)
+            self._c2.posChanged.connect(self.handleChange)
 
     def handleChange(self):
         if (self._line12.p1() == self._c1.pos() and
@@ -368,6 +379,326 @@ class GuideLineItem(PenItemBase):
         painter.drawLine(0, 0, self._length, 0)
 
 
+class PointCollectionItem(PenItemBase):
+    '''
+    Draws every point of a PointStore as a cursor marker in a single paint()
+    call. Only the points in the exposed area are drawn. When zoomed out,
+    points are merged, so at most one marker is drawn per marker-sized cell
+    of the screen, and past maxMarkers they are drawn as plain points.
+
+    Call pointsChanged() after modifying the store in bulk, and
+    forgetPoints() first if points were removed. After adding or
+    moving a few points, includePoints() only looks at those points, and
+    after removing one, updatePoint() before the removal redraws its area;
+    the bounds may then be larger than needed. Individual points can
+    be hidden, e.g. while a movable item stands in for them, and groups of
+    points can be drawn with their own pen. The selected points are drawn
+    on top with the selection pen, shifted by the selection offset while
+    they're dragged.
+    '''
+
+    size = 6.
+    style = 'CircleCross'
+    maxMarkers = 20000
+
+    def __init__(self, store, size=6., style='CircleCross', parent=None,
+                 scene=None):
+        '''
+        Parameters
+        ----------
+        store : PointStore
+            the points to draw
+        size : float
+            the size of the cursors
+        style : str
+            The cursor style ('Cross', 'Circle', or 'CircleCross')
+        '''
+        super(PointCollectionItem, self).__init__(parent, scene)
+        self._store = store
+        self._hidden = set()
+        self._bounds = QtCore.QRectF()
+        # Pens, and the sorted ids of the points drawn with each
+        self._groupPens = []
+        self._groupIds = []
+        # Sorted ids of the selected points, their positions, and the
+        # offset they're drawn at
+        self._selected = numpy.empty(0, dtype=numpy.int64)
+        self._selectedPositions = numpy.empty((0, 2))
+        self._selectionOffset = (0., 0.)
+        self._selectionPen = QtGui.QPen(QtGui.QColor(255, 128, 0), 2.,
+                                        Qt.SolidLine)
+        self.size = size
+        self.style = style
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def margin(self):
+        '''
+        Returns the distance the markers extend past the point positions
+        '''
+        halfWidths = [self.penHalfWidth(),
+                      self._selectionPen.widthF() / 2.]
+        halfWidths.extend(pen.widthF() / 2. for pen in self._groupPens)
+        return self.size / 2. + max(halfWidths)
+
+    def pointsChanged(self):
+        '''
+        Recompute the bounds from all the points, and redraw.
+        '''
+        self.prepareGeometryChange()
+        positions = self._store.positions()
+        if len(positions):
+            left, top = positions.min(axis=0)
+            right, bottom = positions.max(axis=0)
+            self._bounds = QtCore.QRectF(left, top, right - left,
+                                         bottom - top)
+        else:
+            self._bounds = QtCore.QRectF()
+        if len(self._selected):
+            # Removed points were dropped from the selection by forgetPoints
+            self._selectedPositions = self._store.positions()[
+                                        self._store.rowsOf(self._selected)]
+        self.update()
+
+    def includePoints(self, positions):
+        '''
+        Grow the bounds to include points at the positions of an Nx2 array,
+        e.g. of newly added points, and redraw them.
+        '''
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+        if not len(positions):
+            return
+        left, top = positions.min(axis=0)
+        right, bottom = positions.max(axis=0)
+        m = self.margin()
+        self.update(QtCore.QRectF(left - m, top - m, right - left + 2 * m,
+                                  bottom - top + 2 * m))
+        if len(self._store) > len(positions):
+            # The other points are within the current bounds
+            bounds = self._bounds
+            left = min(left, bounds.left())
+            top = min(top, bounds.top())
+            right = max(right, bounds.right())
+            bottom = max(bottom, bounds.bottom())
+        bounds = QtCore.QRectF(left, top, right - left, bottom - top)
+        if bounds != self._bounds:
+            self.prepareGeometryChange()
+            self._bounds = bounds
+
+    def updatePoint(self, pointId):
+        '''
+        Redraw the area around a point.
+        '''
+        x, y = self._store.position(pointId)
+        m = self.margin()
+        self.update(QtCore.QRectF(x - m, y - m, 2 * m, 2 * m))
+
+    def hidePoint(self, pointId):
+        self._hidden.add(pointId)
+        self.updatePoint(pointId)
+
+    def showPoint(self, pointId):
+        '''
+        Draw a hidden point again, at its position in the store.
+        '''
+        self._hidden.discard(pointId)
+        if pointId not in self._store:
+            return
+        x, y = self._store.position(pointId)
+        index = numpy.searchsorted(self._selected, pointId)
+        if index < len(self._selected) and self._selected[index] == pointId:
+            self._selectedPositions[index] = x, y
+        self.includePoints([(x, y)])
+
+    def setPointsPen(self, ids, pen):
+        '''
+        Draw the points with the given ids with pen. Pass None to draw them
+        with the item's pen again.
+        '''
+        ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        self.forgetPoints(ids)
+        if pen is not None:
+            for index, groupPen in enumerate(self._groupPens):
+                if groupPen == pen:
+                    self._groupIds[index] = numpy.union1d(
+                                                self._groupIds[index], ids)
+                    break
+            else:
+                self._groupPens.append(QtGui.QPen(pen))
+                self._groupIds.append(ids)
+        self.prepareGeometryChange()
+        self.update()
+
+    def forgetPoints(self, ids):
+        '''
+        Drop any pens and selection of the points with the given ids, e.g.
+        after they're removed from the store.
+        '''
+        ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        for index in reversed(xrange(len(self._groupIds))):
+            groupIds = numpy.setdiff1d(self._groupIds[index], ids,
+                                       assume_unique=True)
+            if len(groupIds):
+                self._groupIds[index] = groupIds
+            else:
+                del self._groupPens[index]
+                del self._groupIds[index]
+        self._hidden.difference_update(ids.tolist())
+        if len(self._selected):
+            keep = ~numpy.in1d(self._selected, ids)
+            self._selected = self._selected[keep]
+            self._selectedPositions = self._selectedPositions[keep]
+
+    def selectionPen(self):
+        return QtGui.QPen(self._selectionPen)
+
+    def setSelectionPen(self, pen):
+        self.prepareGeometryChange()
+        self._selectionPen = QtGui.QPen(pen)
+        self.update()
+
+    def selection(self):
+        '''
+        Returns a sorted array of the ids of the selected points.
+        '''
+        return self._selected.copy()
+
+    def setSelection(self, ids):
+        '''
+        Select the points with the given ids, replacing the selection.
+        '''
+        self.prepareGeometryChange()
+        self._selected = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        self._selectedPositions = self._store.positions()[
+                                        self._store.rowsOf(self._selected)]
+        self._selectionOffset = (0., 0.)
+        self.update()
+
+    def selectionOffset(self):
+        return self._selectionOffset
+
+    def setSelectionOffset(self, dx, dy):
+        '''
+        Draw the selected points shifted by (dx, dy), without moving them in
+        the store. Used to preview dragging the selection, which is then
+        applied with a single move.
+        '''
+        self.prepareGeometryChange()
+        self._selectionOffset = (dx, dy)
+        self.update()
+
+    def selectionRect(self):
+        '''
+        Returns the bounds of the selected points, as they're drawn.
+        '''
+        if not len(self._selected):
+            return QtCore.QRectF()
+        dx, dy = self._selectionOffset
+        left, top = self._selectedPositions.min(axis=0)
+        right, bottom = self._selectedPositions.max(axis=0)
+        return QtCore.QRectF(left + dx, top + dy, right - left, bottom - top)
+
+    def boundingRect(self):
+        if len(self._store) == 0:
+            return QtCore.QRectF()
+        m = self.margin()
+        bounds = self._bounds
+        if len(self._selected) and self._selectionOffset != (0., 0.):
+            bounds = bounds.united(self.selectionRect())
+        return bounds.adjusted(-m, -m, m, m)
+
+    def mergePositions(self, positions, levelOfDetail):
+        '''
+        Returns the positions in an Nx2 array, keeping one per half-marker
+        sized cell of the screen.
+        '''
+        cellSize = self.size / 2. / levelOfDetail
+        cells = numpy.floor(positions / cellSize).astype(numpy.int64)
+        keys = (cells[:, 0] << 32) ^ (cells[:, 1] & 0xFFFFFFFF)
+        _keys, first = numpy.unique(keys, return_index=True)
+        return positions[first]
+
+    def visibleIds(self, rect):
+        '''
+        Returns an array of the ids of the unselected points to draw in rect.
+        '''
+        m = self.margin()
+        ids = self._store.inRect(rect.left() - m, rect.top() - m,
+                                 rect.right() + m, rect.bottom() + m)
+        if self._hidden and len(ids):
+            ids = ids[~numpy.in1d(ids, list(self._hidden))]
+        if len(self._selected) and len(ids):
+            ids = ids[~numpy.in1d(ids, self._selected)]
+        return ids
+
+    def visiblePositions(self, rect, levelOfDetail):
+        '''
+        Returns an Nx2 array of the positions to draw in rect, with nearby
+        points merged.
+        '''
+        ids = self.visibleIds(rect)
+        if not len(ids):
+            return numpy.empty((0, 2))
+        positions = self._store.positions()[self._store.rowsOf(ids)]
+        return self.mergePositions(positions, levelOfDetail)
+
+    def paint(self, painter, option, widget=None):
+        levelOfDetail = option.levelOfDetailFromTransform(
+                                                    painter.worldTransform())
+        rect = option.exposedRect
+        ids = self.visibleIds(rect)
+        if len(ids):
+            positions = self._store.positions()[self._store.rowsOf(ids)]
+            # Draw the points of each pen group with its own pen
+            grouped = numpy.zeros(len(ids), dtype=bool)
+            groups = []
+            for pen, groupIds in zip(self._groupPens, self._groupIds):
+                inGroup = numpy.in1d(ids, groupIds, assume_unique=True)
+                grouped |= inGroup
+                groups.append((pen, positions[inGroup]))
+            groups.insert(0, (self.pen(), positions[~grouped]))
+            for pen, groupPositions in groups:
+                self.paintMarkers(painter, pen,
+                                  self.mergePositions(groupPositions,
+                                                      levelOfDetail),
+                                  levelOfDetail)
+        if len(self._selected):
+            dx, dy = self._selectionOffset
+            positions = self._selectedPositions + (dx, dy)
+            m = self.margin()
+            visible = ((positions[:, 0] >= rect.left() - m) &
+                       (positions[:, 0] <= rect.right() + m) &
+                       (positions[:, 1] >= rect.top() - m) &
+                       (positions[:, 1] <= rect.bottom() + m))
+            self.paintMarkers(painter, self._selectionPen,
+                              self.mergePositions(positions[visible],
+                                                  levelOfDetail),
+                              levelOfDetail)
+
+    def paintMarkers(self, painter, pen, positions, levelOfDetail):
+        '''
+        Draw a marker with pen at each of the positions in an Nx2 array.
+        '''
+        if not len(positions):
+            return
+        painter.setPen(pen)
+        if (self.size * levelOfDetail < 2. or
+                len(positions) > self.maxMarkers):
+            painter.drawPoints(QtGui.QPolygonF(
+                [QtCore.QPointF(x, y) for x, y in positions.tolist()]))
+            return
+        r = self.size / 2.
+        if self.style in ['Cross', 'CircleCross']:
+            lines = []
+            for x, y in positions.tolist():
+                lines.append(QtCore.QLineF(x - r, y - r, x + r, y + r))
+                lines.append(QtCore.QLineF(x - r, y + r, x + r, y - r))
+            painter.drawLines(lines)
+        if self.style in ['Circle', 'CircleCross']:
+            for x, y in positions.tolist():
+                painter.drawEllipse(QtCore.QPointF(x, y), r, r)
+
+
 def testMovableCursorItemAndMovableLineItem():
     app = QtGui.QApplication([])
     scene = QtGui.QGraphicsScene()
@@ -0,0 +1,102 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import sys
+
+# third party imports
+import numpy
+from PySide import QtGui
+
+# Indices of the (r, g, b) channels in the bytes of a 32-bit QImage pixel,
+# which is stored as a native-endian 0xAARRGGBB integer.
+if sys.byteorder == 'little':
+    RGB_CHANNELS = (2, 1, 0)
+else:
+    RGB_CHANNELS = (1, 2, 3)
+
+
+def toArgb32(image):
+    '''
+    Returns the image in a 32-bit (A)RGB format, converting it if necessary.
+    '''
+    if image.format() in (QtGui.QImage.Format_RGB32,
+                          QtGui.QImage.Format_ARGB32):
+        return image
+    return image.convertToFormat(QtGui.QImage.Format_ARGB32)
+
+
+def bufferArray(image):
+    '''
+    Returns a (height, width, 4) uint8 array sharing memory with a 32-bit
+    QImage. The image must be kept alive while the array is in use.
+    '''
+    width = image.width()
+    height = image.height()
+    bytesPerLine = image.bytesPerLine()
+    buf = numpy.frombuffer(image.constBits(), dtype=numpy.uint8,
+                           count=height * bytesPerLine)
+    return buf.reshape(height, bytesPerLine)[:, :width * 4].reshape(
+                                                        height, width, 4)
+
+
+def iterImageBands(image, bandHeight=256):
+    '''
+    Yields (y0, band) tuples covering the image from top to bottom, where
+    band is a (rows, width, 4) uint8 view of the pixels starting at row y0.
+    Use RGB_CHANNELS to index the color channels.
+    '''
+    image = toArgb32(image)
+    pixels = bufferArray(image)
+    for y0 in xrange(0, image.height(), bandHeight):
+        yield y0, pixels[y0:y0 + bandHeight]
+
+
+def imageToArray(image):
+    '''
+    Returns a (height, width, 3) uint8 array with a copy of the image's
+    (r, g, b) channels.
+    '''
+    image = toArgb32(image)
+    return bufferArray(image)[..., list(RGB_CHANNELS)]
+
+
+def arrayToImage(pixels):
+    '''
+    Returns a new RGB32 QImage with a copy of a (height, width) grayscale or
+    (height, width, 3 or 4) RGB(A) uint8 array.
+    '''
+    pixels = numpy.asarray(pixels, dtype=numpy.uint8)
+    if pixels.ndim == 2:
+        r = g = b = pixels
+    else:
+        r = pixels[..., 0]
+        g = pixels[..., 1]
+        b = pixels[..., 2]
+    height, width = pixels.shape[:2]
+    packed = numpy.empty((height, width), dtype=numpy.uint32)
+    packed[:] = 0xFF000000
+    packed |= r.astype(numpy.uint32) << 16
+    packed |= g.astype(numpy.uint32) << 8
+    packed |= b
+    data = packed.tostring()
+    # QImage doesn't take ownership of data, so detach with a copy
+    return QtGui.QImage(data, width, height, width * 4,
+                        QtGui.QImage.Format_RGB32).copy()
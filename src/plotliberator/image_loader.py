@@ -0,0 +1,145 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os.path
+
+# third party imports
+from PySide import QtGui, QtCore
+
+# local imports
+from plotliberator.tiled_image import FileImageSource, ArrayImageSource
+from plotliberator.svg_import import SvgImageSource, SVG_EXTENSIONS
+from plotliberator.pages import readPage, PageFile
+from plotliberator.templates import imageHash
+
+
+class _ProgressFile(PageFile):
+    '''
+    A PageFile that reports the read position to an ImageLoader, and reads
+    as end of file once the loader is canceled, so the decoder stops early.
+    '''
+
+    def __init__(self, path, page, loader):
+        super(_ProgressFile, self).__init__(path, page)
+        self._loader = loader
+
+    def readData(self, maxlen):
+        if self._loader.isCanceled():
+            return ''
+        pos = self.pos()
+        data = super(_ProgressFile, self).readData(maxlen)
+        if data:
+            self._loader.reportProgress(pos + len(data), self.size())
+        return data
+
+
+class ImageLoader(QtCore.QThread):
+    '''
+    Opens an image file as an ImageSource in the background.
+
+    Formats that can be decoded a region at a time are opened lazily.
+    Other formats are fully decoded in this thread, and progress is
+    estimated from the position in the file. The image's hash, for looking
+    up calibration templates, is computed here too. Each signal passes the
+    loader as its first argument, so stale signals from a canceled loader
+    can be ignored.
+    '''
+    progress = QtCore.Signal(object, int)  # percent
+    loaded = QtCore.Signal(object, object)  # ImageSource
+    failed = QtCore.Signal(object, unicode)  # message
+
+    def __init__(self, path, page=0, parent=None):
+        '''
+        page is the page to load from a multi-page file, e.g. a TIFF.
+        '''
+        super(ImageLoader, self).__init__(parent)
+        self._path = path
+        self._page = page
+        self._canceled = False
+        self._percent = -1
+        self._imageHash = None
+
+    def path(self):
+        return self._path
+
+    def page(self):
+        return self._page
+
+    def imageHash(self):
+        '''
+        Returns the loaded image's difference hash, or None until it's
+        loaded.
+        '''
+        return self._imageHash
+
+    def cancel(self):
+        self._canceled = True
+
+    def isCanceled(self):
+        return self._canceled
+
+    def reportProgress(self, pos, size):
+        if size <= 0:
+            return
+        # Only emit when the percentage changes
+        percent = min(100 * pos // size, 100)
+        if percent > self._percent:
+            self._percent = percent
+            self.progress.emit(self, percent)
+
+    def run(self):
+        try:
+            source = self.load()
+        except (IOError, ValueError) as e:
+            source = None
+            message = unicode(e)
+        else:
+            message = u'Cannot load {}.'.format(self._path)
+        if self._canceled:
+            return
+        if source is None or source.isNull():
+            self.failed.emit(self, message)
+        else:
+            self._imageHash = imageHash(source)
+            self.loaded.emit(self, source)
+
+    def load(self):
+        extension = os.path.splitext(self._path)[1].lower()
+        if extension == '.npy':
+            return ArrayImageSource(self._path)
+        if extension in SVG_EXTENSIONS:
+            return SvgImageSource(self._path,
+                                  lambda percent: self.reportProgress(percent,
+                                                                      100),
+                                  self.isCanceled)
+        # Only the first page can be decoded lazily, since regions are
+        # always read from the first page
+        if (self._page == 0 and
+                FileImageSource.isLazy(QtGui.QImageReader(self._path))):
+            return FileImageSource(self._path)
+        f = _ProgressFile(self._path, self._page, self)
+        if not f.open(QtCore.QIODevice.ReadOnly):
+            return None
+        try:
+            image = readPage(self._path, self._page, f)
+        finally:
+            f.close()
+        return FileImageSource(self._path, image)
@@ -20,8 +20,12 @@
 
 # std lib imports
 import os.path
+import glob
+import uuid
+from collections import OrderedDict
 
 # third party imports
+import numpy
 from PySide import QtCore, QtGui
 from PySide.QtCore import Qt
 
@@ -29,12 +33,33 @@ from PySide.QtCore import Qt
 from plotliberator.version import __version__
 from plotliberator.plot_scene import PlotScene
 from plotliberator.plot_view import PlotView
+from plotliberator.image_loader import ImageLoader
+from plotliberator import export
+from plotliberator.session import SessionWriter, loadSession
+from plotliberator.marker_detection import MAX_MARKER_SIZE
+from plotliberator.preprocess_widget import PreprocessWidget
+from plotliberator.data_table import DataTableModel
+from plotliberator.sequence import SequenceWorker
+from plotliberator.batch import naturalSortKey
+from plotliberator.pages import pageCount, ThumbnailLoader, THUMBNAIL_SIZE
+from plotliberator.document import Document, DocumentCache
+from plotliberator.templates import TemplateLibrary, imageHash
 
 IMAGE_FILTER = ('Image (*.bmp *.gif *.jpg *.jpeg *.png *.pbm '
                        '*.pgm *.ppm *.tiff *.xbm *.xpm)')
-TXT_FILTER = 'Tab Delimited Text (*.txt)'
-CSV_FILTER = 'Comma Separated Values (*.csv)'
+SVG_FILTER = 'SVG Vector Plot (*.svg *.svgz)'
+ARRAY_FILTER = 'Raw Image Array (*.npy)'
+# data format name -> file dialog filter
+DATA_FILTERS = OrderedDict(
+    (name, '{} (*.{})'.format(description, extension))
+    for name, (description, extension) in export.FORMATS.iteritems())
+SESSION_FILTER = 'Plot Liberator Session (*.plsession)'
+SEQUENCE_FILTER = 'Stacked NumPy Array (*.npy)'
+AUTOSAVE_INTERVAL = 5000  # ms
+AUTOSAVE_PATTERN = 'autosave*.plsession'
+PREPROCESS_DELAY = 200  # ms
 QLABEL_COLOR_RED = 'QLabel{color: red;}'
+DEFAULT_COLOR_TOLERANCE = 40
 
 
 def floatOrNone(s):
@@ -48,24 +73,78 @@ class MainWindow(QtGui.QMainWindow):
 
     filepath = ''
     plotScene = None
+    dataTableModel = None
+    document = None
 
     def __init__(self):
         super(MainWindow, self).__init__()
 
         self._settings = QtCore.QSettings()
+        self._loader = None
+        self._retiredLoaders = set()
+        self._sequenceWorker = None
+        self._retiredSequenceWorkers = set()
+        self._sequenceStart = QtCore.QTime()
+        self._pendingSession = None
+
+        # Pages of a multi-page image, e.g. a TIFF. While another page is
+        # shown, each page keeps its calibration and data points, as a
+        # pending session, but not its pixels.
+        self._pagesPath = None
+        self._pageCount = 1
+        self._currentPage = 0
+        self._pageStates = {}
+        self._thumbnails = {}
+        self._thumbnailLoader = None
+        self._retiredThumbnailLoaders = set()
+
+        # Session writers. Until a document's session is saved with a name,
+        # it is autosaved to a file of its own in the data location.
+        self._sessionWriter = None
+        dataDir = (QtGui.QDesktopServices.storageLocation(
+                                        QtGui.QDesktopServices.DataLocation)
+                   or os.path.join(QtCore.QDir.homePath(), '.plotliberator'))
+        if not os.path.isdir(dataDir):
+            os.makedirs(dataDir)
+        self._autosaveDir = dataDir
+
+        # Calibrations saved as templates, which are applied to similar
+        # plots when they're opened
+        self._templates = TemplateLibrary(
+                                os.path.join(dataDir, 'templates.txt'))
+
+        # Open documents, in tab order. The state above belongs to the
+        # current document, and is kept in its Document while another one
+        # is shown. The images of the least recently used documents are
+        # released when they take more memory than the budget.
+        self.documents = []
+        budget = int(self._settings.value('document_memory_budget_mb', 1024))
+        self._documentCache = DocumentCache(budget * 1024 * 1024)
 
         # Initialize GUI stuff
         self.initUI()
 
+        self.autosaveTimer = QtCore.QTimer(self)
+        self.autosaveTimer.setInterval(AUTOSAVE_INTERVAL)
+        self.autosaveTimer.timeout.connect(self.autosave)
+        self.autosaveTimer.start()
+        QtCore.QTimer.singleShot(0, self.recoverAutosave)
+
     def initUI(self):
         self.setWindowTitle('Plot Liberator')
 #         self.resize(1280, 800)
         self.resize(600, 500)
         self.moveTopLeft()
 
-        # PlotScene, PlotView, etc.
-        self.plotScene = PlotScene(parent=self)
-        self.view = PlotView(scene=self.plotScene, parent=self)
+        # PlotView, which shows the PlotScene of the current document, and
+        # a tab for each document
+        self.view = PlotView(parent=self)
+        self.documentTabs = QtGui.QTabBar()
+        self.documentTabs.setDocumentMode(True)
+        self.documentTabs.setTabsClosable(True)
+        self.documentTabs.setExpanding(False)
+        self.documentTabs.currentChanged.connect(self.documentTabChanged)
+        self.documentTabs.tabCloseRequested.connect(self.closeDocument)
 
         # Actions and menus
         self.aboutAction = QtGui.QAction('&About', self)
@@ -77,6 +156,48 @@ class MainWindow(QtGui.QMainWindow):
         self.openAction.setShortcut('Ctrl+O')
         self.openAction.triggered.connect(self.open)
 
+        self.newDocumentAction = QtGui.QAction('&New Tab', self)
+        self.newDocumentAction.setStatusTip('Open an empty document tab')
+        self.newDocumentAction.setToolTip('Open an empty document tab')
+        self.newDocumentAction.setShortcut('Ctrl+N')
+        self.newDocumentAction.triggered.connect(
+                    lambda: self.activateDocument(self.addDocument()))
+
+        self.closeDocumentAction = QtGui.QAction('Close &Tab', self)
+        self.closeDocumentAction.setStatusTip('Close the current document')
+        self.closeDocumentAction.setToolTip('Close the current document')
+        self.closeDocumentAction.setShortcut(QtGui.QKeySequence.Close)
+        self.closeDocumentAction.triggered.connect(
+                    lambda: self.closeDocument(
+                                        self.documentTabs.currentIndex()))
+
+        self.cancelLoadAction = QtGui.QAction('Cancel Loading', self)
+        self.cancelLoadAction.setStatusTip('Stop loading the plot')
+        self.cancelLoadAction.setToolTip('Stop loading the plot')
+        self.cancelLoadAction.setShortcut('Esc')
+        self.cancelLoadAction.setEnabled(False)
+        self.cancelLoadAction.triggered.connect(self.cancelLoad)
+
+        self.openSessionAction = QtGui.QAction('Open Session...', self)
+        self.openSessionAction.setStatusTip('Open a saved session')
+        self.openSessionAction.setToolTip('Open a saved session')
+        self.openSessionAction.triggered.connect(self.openSession)
+
+        self.saveSessionAction = QtGui.QAction('Save Session', self)
+        self.saveSessionAction.setStatusTip(
+                            'Save the plot, axes and data points')
+        self.saveSessionAction.setToolTip(
+                            'Save the plot, axes and data points')
+        self.saveSessionAction.setShortcut('Ctrl+Shift+S')
+        self.saveSessionAction.triggered.connect(self.saveSession)
+
+        self.saveSessionAsAction = QtGui.QAction('Save Session As...', self)
+        self.saveSessionAsAction.setStatusTip(
+                            'Save the plot, axes and data points')
+        self.saveSessionAsAction.setToolTip(
+                            'Save the plot, axes and data points')
+        self.saveSessionAsAction.triggered.connect(self.saveSessionAs)
+
         self.actualSizeAction = QtGui.QAction('Actual Size', self)
         self.actualSizeAction.setShortcut('Ctrl+0')
         self.actualSizeAction.triggered.connect(self.view.actualSize)
@@ -87,41 +208,327 @@ class MainWindow(QtGui.QMainWindow):
         self.zoomOutAction.setShortcut('Ctrl+-')
         self.zoomOutAction.triggered.connect(self.view.zoomOut)
 
+        self.previousPageAction = QtGui.QAction('Pre&vious Page', self)
+        self.previousPageAction.setStatusTip(
+                                    'Show the previous page of the image')
+        self.previousPageAction.setToolTip(
+                                    'Show the previous page of the image')
+        self.previousPageAction.setShortcut(
+                                    QtGui.QKeySequence.MoveToPreviousPage)
+        self.previousPageAction.setEnabled(False)
+        self.previousPageAction.triggered.connect(
+                        lambda: self.showPage(self._currentPage - 1))
+        self.nextPageAction = QtGui.QAction('&Next Page', self)
+        self.nextPageAction.setStatusTip('Show the next page of the image')
+        self.nextPageAction.setToolTip('Show the next page of the image')
+        self.nextPageAction.setShortcut(QtGui.QKeySequence.MoveToNextPage)
+        self.nextPageAction.setEnabled(False)
+        self.nextPageAction.triggered.connect(
+                        lambda: self.showPage(self._currentPage + 1))
+
+        self.mipmapsAction = QtGui.QAction('Use Mipmaps', self)
+        self.mipmapsAction.setStatusTip(
+                        'Draw zoomed out plots from pre-scaled images')
+        self.mipmapsAction.setCheckable(True)
+        self.mipmapsAction.setChecked(True)
+        self.mipmapsAction.toggled.connect(self.setMipmapsEnabled)
+        self.frameTimesAction = QtGui.QAction('Show Frame Times', self)
+        self.frameTimesAction.setStatusTip(
+                        'Show the time taken to paint the plot')
+        self.frameTimesAction.setCheckable(True)
+        self.frameTimesAction.toggled.connect(self.view.setShowFrameTimes)
+
         self.saveDataAction = QtGui.QAction('&Save', self)
         self.saveDataAction.setStatusTip('Save data')
         self.saveDataAction.setToolTip('Save data')
         self.saveDataAction.setShortcut('Ctrl+S')
         self.saveDataAction.triggered.connect(self.saveData)
 
+        self.extractCurveAction = QtGui.QAction('&Extract Curve...', self)
+        self.extractCurveAction.setStatusTip(
+                                    'Add data points along a colored curve')
+        self.extractCurveAction.setToolTip(
+                                    'Add data points along a colored curve')
+        self.extractCurveAction.triggered.connect(self.extractCurve)
+
+        self.extractMarkersAction = QtGui.QAction('Extract &Markers...',
+                                                  self)
+        self.extractMarkersAction.setStatusTip(
+                            'Add a data point at each marker of a color')
+        self.extractMarkersAction.setToolTip(
+                            'Add a data point at each marker of a color')
+        self.extractMarkersAction.triggered.connect(self.extractMarkers)
+
+        self.exportCurveAction = QtGui.QAction('E&xport Curve...', self)
+        self.exportCurveAction.setStatusTip('Save the data of a colored curve')
+        self.exportCurveAction.setToolTip('Save the data of a colored curve')
+        self.exportCurveAction.triggered.connect(self.exportCurve)
+
+        self.refineAction = QtGui.QAction('Re&fine Points', self)
+        self.refineAction.setStatusTip(
+                'Center each data point on the ink around it')
+        self.refineAction.setToolTip(
+                'Center each data point on the ink around it')
+        self.refineAction.triggered.connect(self.refinePoints)
+
+        self.digitizeSequenceAction = QtGui.QAction('Digitize Se&quence...',
+                                                    self)
+        self.digitizeSequenceAction.setStatusTip(
+                'Extract a colored curve from frames of this plot, with '
+                'this calibration, into one stacked array')
+        self.digitizeSequenceAction.setToolTip(
+                'Extract a colored curve from a sequence of frames')
+        self.digitizeSequenceAction.triggered.connect(self.digitizeSequence)
+
+        self.cancelSequenceAction = QtGui.QAction('Cancel Sequence', self)
+        self.cancelSequenceAction.setStatusTip(
+                                        'Stop digitizing the frame sequence')
+        self.cancelSequenceAction.setToolTip(
+                                        'Stop digitizing the frame sequence')
+        self.cancelSequenceAction.setEnabled(False)
+        self.cancelSequenceAction.triggered.connect(self.cancelSequence)
+
         self.clearDataAction = QtGui.QAction('&Clear', self)
         self.clearDataAction.setStatusTip('Clear data')
         self.clearDataAction.setToolTip('Clear data')
         self.clearDataAction.triggered.connect(self.clearData)
 
+        self.selectAllAction = QtGui.QAction('Select &All Points', self)
+        self.selectAllAction.setStatusTip(
+                'Select all data points. Shift or control drag to select '
+                'points in a rectangle or lasso.')
+        self.selectAllAction.setToolTip('Select all data points')
+        self.selectAllAction.setShortcut(QtGui.QKeySequence.SelectAll)
+        self.selectAllAction.triggered.connect(
+                                lambda: self.plotScene.selectAllPoints())
+
+        self.deleteSelectedAction = QtGui.QAction('Delete Selected Po&ints',
+                                                  self)
+        self.deleteSelectedAction.setStatusTip(
+                                        'Remove the selected data points')
+        self.deleteSelectedAction.setToolTip(
+                                        'Remove the selected data points')
+        self.deleteSelectedAction.setShortcut(QtGui.QKeySequence.Delete)
+        self.deleteSelectedAction.setEnabled(False)
+        self.deleteSelectedAction.triggered.connect(
+                                                self.deleteSelectedPoints)
+
+        self.colorSelectedAction = QtGui.QAction('C&olor Selected Points...',
+                                                 self)
+        self.colorSelectedAction.setStatusTip(
+                                'Draw the selected data points in a color')
+        self.colorSelectedAction.setToolTip(
+                                'Draw the selected data points in a color')
+        self.colorSelectedAction.setEnabled(False)
+        self.colorSelectedAction.triggered.connect(self.colorSelectedPoints)
+
+        self.detectAxesAction = QtGui.QAction('&Detect Axes', self)
+        self.detectAxesAction.setStatusTip(
+                            'Move the axis corners to the plot frame')
+        self.detectAxesAction.setToolTip(
+                            'Move the axis corners to the plot frame')
+        self.detectAxesAction.triggered.connect(self.detectAxes)
+
+        self.detectAxesOnOpenAction = QtGui.QAction('Detect Axes on Open',
+                                                    self)
+        self.detectAxesOnOpenAction.setStatusTip(
+                    'Move the axis corners to the plot frame on open')
+        self.detectAxesOnOpenAction.setCheckable(True)
+        # Depending on the platform, QSettings may return bools as strings
+        self.detectAxesOnOpenAction.setChecked(
+            self._settings.value('detect_axes_on_open', True) in (True,
+                                                                  'true'))
+        self.detectAxesOnOpenAction.toggled.connect(
+            lambda checked: self._settings.setValue('detect_axes_on_open',
+                                                    checked))
+
+        self.traceAction = QtGui.QAction('&Trace Curve', self)
+        self.traceAction.setStatusTip(
+                    'Place a seed to trace the curve it is dragged onto')
+        self.traceAction.setToolTip(
+                    'Place a seed to trace the curve it is dragged onto')
+        self.traceAction.setShortcut('Ctrl+T')
+        self.traceAction.setCheckable(True)
+        self.traceAction.toggled.connect(self.setTracing)
+
+        self.addTraceAction = QtGui.QAction('&Add Traced Points', self)
+        self.addTraceAction.setStatusTip(
+                                    'Add data points along the traced curve')
+        self.addTraceAction.setToolTip(
+                                    'Add data points along the traced curve')
+        self.addTraceAction.setShortcut('Ctrl+Shift+T')
+        self.addTraceAction.setEnabled(False)
+        self.addTraceAction.triggered.connect(self.addTracedPoints)
+
+        self.pickPathAction = QtGui.QAction('Pick SVG &Path', self)
+        self.pickPathAction.setStatusTip(
+                'Click a path of an SVG plot to extract its exact vertices')
+        self.pickPathAction.setToolTip('Pick a path of an SVG plot')
+        self.pickPathAction.setCheckable(True)
+        self.pickPathAction.setEnabled(False)
+        self.pickPathAction.toggled.connect(
+                        lambda picking: self.plotScene.setPathPicking(picking))
+
+        self.addPathAction = QtGui.QAction('Add Pat&h Points', self)
+        self.addPathAction.setStatusTip(
+                    'Add a data point at each vertex of the picked SVG path')
+        self.addPathAction.setToolTip(
+                    'Add a data point at each vertex of the picked SVG path')
+        self.addPathAction.setEnabled(False)
+        self.addPathAction.triggered.connect(self.addPathPoints)
+
+        self.snapAction = QtGui.QAction('S&nap to Curve', self)
+        self.snapAction.setStatusTip(
+                    'Snap new and dragged data points to the nearest curve')
+        self.snapAction.setToolTip(
+                    'Snap new and dragged data points to the nearest curve')
+        self.snapAction.setCheckable(True)
+        self.snapAction.toggled.connect(
+                        lambda enabled: self.plotScene.setSnapEnabled(enabled))
+
+        self.snapColorAction = QtGui.QAction('Snap Co&lor...', self)
+        self.snapColorAction.setStatusTip('Snap to the curve of a color')
+        self.snapColorAction.setToolTip('Snap to the curve of a color')
+        self.snapColorAction.triggered.connect(self.setSnapColor)
+
         self.resetAxesAction = QtGui.QAction('&Reset Axes', self)
         self.resetAxesAction.setStatusTip('Reset the axes')
         self.resetAxesAction.setToolTip('Reset the axes')
         self.resetAxesAction.triggered.connect(self.resetAxes)
 
+        self.saveTemplateAction = QtGui.QAction('Save Calibration &Template',
+                                                self)
+        self.saveTemplateAction.setStatusTip(
+                'Apply the axes to similar plots when they are opened')
+        self.saveTemplateAction.setToolTip(
+                'Save the axes as a template for similar plots')
+        self.saveTemplateAction.triggered.connect(self.saveTemplate)
+
+        self.applyTemplatesOnOpenAction = QtGui.QAction(
+                                            'Apply Templates on Open', self)
+        self.applyTemplatesOnOpenAction.setStatusTip(
+                'Set the axes of opened plots from the nearest template')
+        self.applyTemplatesOnOpenAction.setCheckable(True)
+        self.applyTemplatesOnOpenAction.setChecked(
+            self._settings.value('apply_templates_on_open', True) in (True,
+                                                                      'true'))
+        self.applyTemplatesOnOpenAction.toggled.connect(
+            lambda checked: self._settings.setValue('apply_templates_on_open',
+                                                    checked))
+
+        # Preprocessing dock. Changes are coalesced, so that dragging a
+        # spin box only reruns the pipeline once it settles.
+        self.preprocessWidget = PreprocessWidget()
+        self.preprocessDock = QtGui.QDockWidget('Preprocessing', self)
+        self.preprocessDock.setObjectName('preprocessDock')
+        self.preprocessDock.setWidget(self.preprocessWidget)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.preprocessDock)
+        self.preprocessDock.hide()
+        self.preprocessTimer = QtCore.QTimer(self)
+        self.preprocessTimer.setSingleShot(True)
+        self.preprocessTimer.setInterval(PREPROCESS_DELAY)
+        self.preprocessTimer.timeout.connect(self.preprocess)
+        self.preprocessWidget.changed.connect(self.preprocessTimer.start)
+
+        # Data table dock. Rows have a fixed height, so the view never
+        # measures rows it doesn't show.
+        self.dataTableView = QtGui.QTableView()
+        self.dataTableView.setSelectionBehavior(
+                                        QtGui.QAbstractItemView.SelectRows)
+        self.dataTableView.setEditTriggers(
+                                        QtGui.QAbstractItemView.NoEditTriggers)
+        self.dataTableView.verticalHeader().setResizeMode(
+                                                    QtGui.QHeaderView.Fixed)
+        self.dataTableView.verticalHeader().setDefaultSectionSize(
+                    self.dataTableView.fontMetrics().height() + 4)
+        self.dataTableView.doubleClicked.connect(self.showDataPoint)
+        self.dataTableDock = QtGui.QDockWidget('Data', self)
+        self.dataTableDock.setObjectName('dataTableDock')
+        self.dataTableDock.setWidget(self.dataTableView)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.dataTableDock)
+        self.dataTableDock.hide()
+
+        # Page navigator dock, with thumbnails of the pages of a multi-page
+        # image. It's shown when such an image is opened.
+        self.pageList = QtGui.QListWidget()
+        self.pageList.setIconSize(QtCore.QSize(THUMBNAIL_SIZE,
+                                               THUMBNAIL_SIZE))
+        self.pageList.setUniformItemSizes(True)
+        self.pageList.currentRowChanged.connect(self.showPage)
+        self.pagesDock = QtGui.QDockWidget('Pages', self)
+        self.pagesDock.setObjectName('pagesDock')
+        self.pagesDock.setWidget(self.pageList)
+        self.addDockWidget(Qt.LeftDockWidgetArea, self.pagesDock)
+        self.pagesDock.hide()
+
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
         fileMenu.addAction(self.openAction)
+        fileMenu.addAction(self.cancelLoadAction)
+        fileMenu.addSeparator()
+        fileMenu.addAction(self.newDocumentAction)
+        fileMenu.addAction(self.closeDocumentAction)
+        fileMenu.addSeparator()
+        fileMenu.addAction(self.openSessionAction)
+        fileMenu.addAction(self.saveSessionAction)
+        fileMenu.addAction(self.saveSessionAsAction)
 
         viewMenu = menubar.addMenu('&View')
         viewMenu.addAction(self.actualSizeAction)
         viewMenu.addAction(self.zoomInAction)
         viewMenu.addAction(self.zoomOutAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(self.previousPageAction)
+        viewMenu.addAction(self.nextPageAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(self.mipmapsAction)
+        viewMenu.addAction(self.frameTimesAction)
+        viewMenu.addSeparator()
+        viewMenu.addAction(self.dataTableDock.toggleViewAction())
+        viewMenu.addAction(self.preprocessDock.toggleViewAction())
+        viewMenu.addAction(self.pagesDock.toggleViewAction())
 
         dataMenu = menubar.addMenu('&Data')
         dataMenu.addAction(self.saveDataAction)
+        dataMenu.addAction(self.extractCurveAction)
+        dataMenu.addAction(self.extractMarkersAction)
+        dataMenu.addAction(self.exportCurveAction)
+        dataMenu.addAction(self.refineAction)
         dataMenu.addAction(self.clearDataAction)
+        dataMenu.addSeparator()
+        dataMenu.addAction(self.digitizeSequenceAction)
+        dataMenu.addAction(self.cancelSequenceAction)
+        dataMenu.addSeparator()
+        dataMenu.addAction(self.selectAllAction)
+        dataMenu.addAction(self.deleteSelectedAction)
+        dataMenu.addAction(self.colorSelectedAction)
+        dataMenu.addSeparator()
+        dataMenu.addAction(self.traceAction)
+        dataMenu.addAction(self.addTraceAction)
+        dataMenu.addAction(self.pickPathAction)
+        dataMenu.addAction(self.addPathAction)
+        dataMenu.addAction(self.snapAction)
+        dataMenu.addAction(self.snapColorAction)
+        dataMenu.addSeparator()
+        dataMenu.addAction(self.detectAxesAction)
+        dataMenu.addAction(self.detectAxesOnOpenAction)
         dataMenu.addAction(self.resetAxesAction)
+        dataMenu.addSeparator()
+        dataMenu.addAction(self.saveTemplateAction)
+        dataMenu.addAction(self.applyTemplatesOnOpenAction)
 
         aboutMenu = menubar.addMenu('&About')
         aboutMenu.addAction(self.aboutAction)
 
-        # Create a status bar
-        self.statusBar()
+        # Create a status bar, with load progress widgets
+        self.loadProgressBar = QtGui.QProgressBar()
+        self.loadProgressBar.setMaximumWidth(150)
+        self.loadProgressBar.hide()
+        self.cancelLoadButton = QtGui.QToolButton()
+        self.cancelLoadButton.setDefaultAction(self.cancelLoadAction)
+        self.cancelLoadButton.hide()
+        self.statusBar().addPermanentWidget(self.loadProgressBar)
+        self.statusBar().addPermanentWidget(self.cancelLoadButton)
 
         # Axis value line edits
         self.x1LineEdit = QtGui.QLineEdit('0.')
@@ -189,7 +596,12 @@ class MainWindow(QtGui.QMainWindow):
         grid.addWidget(self.x2Label, 5, 3, Qt.AlignHCenter)
         grid.addWidget(self.xLogLabel, 5, 4, Qt.AlignHCenter)
 
-        grid.addWidget(self.view, 0, 2, 4, 4)
+        plotLayout = QtGui.QVBoxLayout()
+        plotLayout.setContentsMargins(0, 0, 0, 0)
+        plotLayout.setSpacing(0)
+        plotLayout.addWidget(self.documentTabs)
+        plotLayout.addWidget(self.view)
+        grid.addLayout(plotLayout, 0, 2, 4, 4)
         grid.setRowStretch(0, 1)
         grid.setColumnStretch(5, 1)
 
@@ -205,6 +617,206 @@ class MainWindow(QtGui.QMainWindow):
         self.y2LineEdit.textChanged.connect(self.yValueChanged)
         self.yLogCheckBox.stateChanged.connect(self.yValueChanged)
 
+        self.activateDocument(self.addDocument())
+
+    def addDocument(self):
+        '''
+        Add an empty document, with a new tab, and return it.
+        '''
+        scene = PlotScene(parent=self)
+        budget = int(self._settings.value('tile_cache_budget_mb', 256))
+        scene.setTileCacheBudget(budget * 1024 * 1024)
+        scene.setMipmapsEnabled(self.mipmapsAction.isChecked())
+        document = Document(scene, DataTableModel(scene, self))
+        document.autosaveWriter = SessionWriter(self.newAutosavePath())
+        self.documents.append(document)
+        self.documentTabs.blockSignals(True)
+        self.documentTabs.addTab('Untitled')
+        self.documentTabs.blockSignals(False)
+        return document
+
+    def newAutosavePath(self):
+        '''
+        Returns the path of a new autosave file, for a new document
+        '''
+        name = 'autosave-{}.plsession'.format(uuid.uuid4().hex)
+        return os.path.join(self._autosaveDir, name)
+
+    @QtCore.Slot(int)
+    def documentTabChanged(self, index):
+        if 0 <= index < len(self.documents):
+            self.activateDocument(self.documents[index])
+
+    def activateDocument(self, document):
+        '''
+        Show another document. If its image was released to free memory,
+        it's reloaded in the background, keeping its axes and data points.
+        '''
+        if document is self.document:
+            return
+        if self.document is not None:
+            self.autosave()
+            # A load in progress is restarted when the document is shown
+            # again, and its pending axes and data points are applied then
+            self.document.needsLoad = self._loader is not None
+            self.document.pendingSession = self._pendingSession
+            self._pendingSession = None
+            self.cancelLoad()
+            self.cancelThumbnails()
+            self.storeDocument()
+            self.connectPlotScene(False)
+        self.document = document
+        self.restoreDocument()
+        self.connectPlotScene(True)
+        self._documentCache.touch(document)
+
+        if document.needsLoad:
+            pendingSession = document.pendingSession
+            if pendingSession is None and self.filepath:
+                # Keep the axes and data points
+                pendingSession = self.plotScene.calibration(), None
+            document.needsLoad = False
+            document.pendingSession = None
+            self.loadImage(self._pagesPath, self._currentPage)
+            self._pendingSession = pendingSession
+        self._documentCache.evict(document)
+
+    def storeDocument(self):
+        '''
+        Keep the current document's state in its Document.
+        '''
+        document = self.document
+        document.filepath = self.filepath
+        document.pagesPath = self._pagesPath
+        document.pageCount = self._pageCount
+        document.currentPage = self._currentPage
+        document.pageStates = self._pageStates
+        document.thumbnails = self._thumbnails
+        document.sessionWriter = self._sessionWriter
+        document.viewTransform = self.view.transform()
+        document.viewCenter = self.view.mapToScene(
+                                        self.view.viewport().rect().center())
+
+    def restoreDocument(self):
+        '''
+        Show the current document's PlotScene, and restore its state.
+        '''
+        document = self.document
+        self.plotScene = document.plotScene
+        self.dataTableModel = document.dataTableModel
+        self.filepath = document.filepath
+        self._pagesPath = document.pagesPath
+        self._pageCount = document.pageCount
+        self._currentPage = document.currentPage
+        self._pageStates = document.pageStates
+        self._thumbnails = document.thumbnails
+        self._sessionWriter = document.sessionWriter
+
+        self.view.setPlotScene(self.plotScene)
+        if document.viewTransform is None:
+            self.view.setTransform(QtGui.QTransform())
+        else:
+            self.view.setTransform(document.viewTransform)
+            self.view.centerOn(document.viewCenter)
+        self.dataTableView.setModel(self.dataTableModel)
+        self.documentTabs.blockSignals(True)
+        self.documentTabs.setCurrentIndex(self.documents.index(document))
+        self.documentTabs.blockSignals(False)
+        self.updateDocumentTitle()
+        self.updatePageList()
+        self.updatePageActions()
+
+        # Update the actions and axis values to the document's
+        scene = self.plotScene
+        for action, checked in ((self.snapAction, scene.isSnapEnabled()),
+                                (self.traceAction,
+                                 scene.traceSeed is not None),
+                                (self.pickPathAction, scene.pathPicking)):
+            action.blockSignals(True)
+            action.setChecked(checked)
+            action.blockSignals(False)
+        self.addTraceAction.setEnabled(scene.traceSeed is not None)
+        self.pickPathAction.setEnabled(bool(scene.svgPaths))
+        self.addPathAction.setEnabled(scene.pickedPath is not None)
+        self.updateSelectionActions()
+        self.setCalibration(scene.calibration())
+
+    def connectPlotScene(self, connected=True):
+        '''
+        Connect or disconnect the current PlotScene's signals.
+        '''
+        for signal, slot in ((self.plotScene.pointSelectionChanged,
+                              self.updateSelectionActions),
+                             (self.plotScene.pathPicked, self.pathPicked),
+                             (self.plotScene.preprocessed,
+                              self.statusBar().clearMessage)):
+            if connected:
+                signal.connect(slot)
+            else:
+                signal.disconnect(slot)
+
+    @QtCore.Slot(int)
+    def closeDocument(self, index):
+        '''
+        Close the document of a tab. Changes to the current document are
+        autosaved first. Closing the last document leaves an empty one.
+        '''
+        if not 0 <= index < len(self.documents):
+            return
+        if len(self.documents) == 1:
+            self.addDocument()
+        document = self.documents[index]
+        if document is self.document:
+            self.cancelLoad()
+            self.cancelThumbnails()
+            self.autosave()
+            self.connectPlotScene(False)
+            self.document = None
+        self.removeAutosave(document)
+        self._documentCache.remove(document)
+        del self.documents[index]
+        self.documentTabs.removeTab(index)
+        if self.document is None:
+            self.activateDocument(
+                        self.documents[self.documentTabs.currentIndex()])
+        document.plotScene.releaseImage()
+        document.plotScene.deleteLater()
+        document.dataTableModel.deleteLater()
+
+    def newDocumentIfInUse(self):
+        '''
+        Switch to a new document, unless the current one is empty.
+        '''
+        if self._pagesPath is not None or len(self.plotScene.dataPoints):
+            self.activateDocument(self.addDocument())
+
+    def updateDocumentTitle(self):
+        '''
+        Show the current document's file name in the window title and its
+        tab.
+        '''
+        index = self.documents.index(self.document)
+        if not self.filepath:
+            self.setWindowTitle('Plot Liberator')
+            self.documentTabs.setTabText(index, 'Untitled')
+            self.documentTabs.setTabToolTip(index, '')
+            return
+        _dirpath, filename = os.path.split(self.filepath)
+        self.documentTabs.setTabText(index, filename)
+        self.documentTabs.setTabToolTip(index, self.filepath)
+        if self._pageCount > 1:
+            filename = u'{} (page {} of {})'.format(
+                                filename, self._currentPage + 1,
+                                self._pageCount)
+        self.setWindowTitle(u'Plot Liberator - {}'.format(filename))
+
+    @QtCore.Slot(bool)
+    def setMipmapsEnabled(self, enabled):
+        for document in self.documents:
+            document.plotScene.setMipmapsEnabled(enabled)
+        # Only time the frames drawn with the new setting
+        self.view.resetFrameTimes()
+
     def xValueChanged(self):
         x1 = floatOrNone(self.x1LineEdit.text())
         x2 = floatOrNone(self.x2LineEdit.text())
@@ -264,32 +876,199 @@ class MainWindow(QtGui.QMainWindow):
         dialog = QtGui.QFileDialog(parent=self,
                                    caption='Open a plot image',
                                    directory=openpath,
-                                   filter=IMAGE_FILTER)
+                                   filter=';;'.join([IMAGE_FILTER, SVG_FILTER,
+                                                     ARRAY_FILTER]))
         dialog.selectFile(openpath)
         dialog.setFileMode(dialog.ExistingFile)
         if not dialog.exec_():
             return
 
         filepath = dialog.selectedFiles()[0]
-        _dirpath, filename = os.path.split(filepath)
         self._settings.setValue('last_open_path', filepath)
-        self.setWindowTitle(u'Plot Liberator - {}'.format(filename))
+        self.newDocumentIfInUse()
+        self.loadImage(filepath)
 
-        image = QtGui.QImage(filepath)
-        if image.isNull():
-            QtGui.QMessageBox.information(self, "Plot Liberator",
-                    "Cannot load %s." % filepath)
+    def loadImage(self, filepath, page=0):
+        '''
+        Start loading a page of an image file in the background. The plot
+        is replaced once the image is ready.
+        '''
+        if filepath != self._pagesPath:
+            self.openPages(filepath)
+        self.cancelLoad()
+        self._currentPage = page
+        self.pageList.blockSignals(True)
+        self.pageList.setCurrentRow(page)
+        self.pageList.blockSignals(False)
+        self.updatePageActions()
+        self._loader = ImageLoader(filepath, page)
+        self._loader.progress.connect(self.loadProgress)
+        self._loader.loaded.connect(self.loadFinished)
+        self._loader.failed.connect(self.loadFailed)
+        self._loader.start()
+        self.loadProgressBar.setRange(0, 0)  # busy until the first progress
+        self.loadProgressBar.show()
+        self.cancelLoadButton.show()
+        self.cancelLoadAction.setEnabled(True)
+        if self._pageCount > 1:
+            self.statusBar().showMessage(u'Loading page {} of {}...'.format(
+                                                page + 1, self._pageCount))
+        else:
+            self.statusBar().showMessage(u'Loading {}...'.format(filepath))
+
+    def openPages(self, filepath):
+        '''
+        Set up the page navigator for a newly opened file, and start
+        decoding thumbnails of its pages.
+        '''
+        self._pagesPath = filepath
+        self._pageCount = pageCount(filepath)
+        self._pageStates = {}
+        self._thumbnails = {}
+        self.updatePageList()
+
+    def updatePageList(self):
+        '''
+        Fill the page navigator with the current document's pages, and
+        start decoding any missing thumbnails.
+        '''
+        self.cancelThumbnails()
+        self.pageList.blockSignals(True)
+        self.pageList.clear()
+        for page in xrange(self._pageCount):
+            self.pageList.addItem(u'Page {}'.format(page + 1))
+            if page in self._thumbnails:
+                self.pageList.item(page).setIcon(QtGui.QIcon(
+                        QtGui.QPixmap.fromImage(self._thumbnails[page])))
+        self.pageList.setCurrentRow(self._currentPage)
+        self.pageList.blockSignals(False)
+        self.pagesDock.setVisible(self._pageCount > 1)
+        if 1 < self._pageCount and len(self._thumbnails) < self._pageCount:
+            self._thumbnailLoader = ThumbnailLoader(self._pagesPath,
+                                                    self._pageCount)
+            self._thumbnailLoader.thumbnailReady.connect(self.thumbnailReady)
+            self._thumbnailLoader.start(QtCore.QThread.LowPriority)
+
+    def cancelThumbnails(self):
+        if self._thumbnailLoader is None:
+            return
+        loader = self._thumbnailLoader
+        loader.cancel()
+        self._retiredThumbnailLoaders.add(loader)
+        loader.finished.connect(
+                        lambda: self._retiredThumbnailLoaders.discard(loader))
+        self._thumbnailLoader = None
+
+    def thumbnailReady(self, loader, page, image):
+        if loader is not self._thumbnailLoader:
+            return
+        self._thumbnails[page] = image
+        self.pageList.item(page).setIcon(
+                                QtGui.QIcon(QtGui.QPixmap.fromImage(image)))
+
+    def updatePageActions(self):
+        self.previousPageAction.setEnabled(self._currentPage > 0)
+        self.nextPageAction.setEnabled(
+                                self._currentPage < self._pageCount - 1)
+
+    @QtCore.Slot(int)
+    def showPage(self, page):
+        '''
+        Switch to another page of a multi-page image. The current page's
+        calibration and data points are kept, and the other page's are
+        restored once it's loaded. A page that hasn't been shown yet starts
+        with the current axis values and no data points.
+        '''
+        if (self._pagesPath is None or page == self._currentPage or
+                not 0 <= page < self._pageCount):
+            return
+        if self._loader is None:
+            state = (self.plotScene.calibration(),
+                     self.plotScene.getPositions())
+        else:
+            # The current page is still loading, so its state is pending
+            state = self._pendingSession
+        if state is not None:
+            self._pageStates[self._currentPage] = state
+        self._pendingSession = None
+        self.cancelLoad()
+        self._pendingSession = self._pageStates.pop(
+                                    page, (None, numpy.empty((0, 2))))
+        self.loadImage(self._pagesPath, page)
+
+    def cancelLoad(self):
+        if self._loader is None:
             return
+        # Keep a reference until the thread finishes
+        loader = self._loader
+        loader.cancel()
+        self._retiredLoaders.add(loader)
+        loader.finished.connect(lambda: self._retiredLoaders.discard(loader))
+        self._loader = None
+        self.endLoad()
+        self.applyPendingSession()
+
+    def endLoad(self):
+        self.loadProgressBar.hide()
+        self.cancelLoadButton.hide()
+        self.cancelLoadAction.setEnabled(False)
+        self.statusBar().clearMessage()
+
+    def loadProgress(self, loader, percent):
+        if loader is not self._loader:
+            return
+        self.loadProgressBar.setRange(0, 100)
+        self.loadProgressBar.setValue(percent)
+
+    def loadFinished(self, loader, source):
+        if loader is not self._loader:
+            return
+        self._loader = None
+        self.endLoad()
 
         # Replace the old plot with the new one
-        self.plotScene.setPlotImage(image)
+        self.filepath = loader.path()
+        self.updateDocumentTitle()
+        self.plotScene.setImageSource(source, loader.imageHash())
+        if not self.plotScene.svgPaths:
+            self.pickPathAction.setChecked(False)
+        self.pickPathAction.setEnabled(bool(self.plotScene.svgPaths))
+        if self._pendingSession is None or self._pendingSession[0] is None:
+            # Use the nearest template's axes, or else look for the frame
+            calibration = None
+            if self.applyTemplatesOnOpenAction.isChecked():
+                calibration = self._templates.match(
+                                    self.plotScene.templateHash,
+                                    (source.width(), source.height()))
+            if calibration is not None:
+                self.setCalibration(calibration)
+                self.statusBar().showMessage(
+                                'Applied a calibration template', 5000)
+            elif self.detectAxesOnOpenAction.isChecked():
+                self.plotScene.detectAxisCorners()
+        self.applyPendingSession()
+        self._documentCache.evict(self.document)
+
+    def loadFailed(self, loader, message):
+        if loader is not self._loader:
+            return
+        self._loader = None
+        self.endLoad()
+        QtGui.QMessageBox.information(self, "Plot Liberator", message)
+        self.applyPendingSession()
 
     def saveData(self):
+        self.writeData(self.plotScene.getData())
+
+    def writeData(self, data):
+        '''
+        Ask for a file path, and write the Nx2 data array to it.
+        '''
         savepath = self._settings.value('last_save_path', '')
         dialog = QtGui.QFileDialog(parent=self,
                                    caption='Save data',
                                    directory=savepath,
-                                   filter=TXT_FILTER + ';;' + CSV_FILTER)
+                                   filter=';;'.join(DATA_FILTERS.values()))
         dialog.selectFile(savepath)
         dialog.setAcceptMode(dialog.AcceptSave)
         if not dialog.exec_():
@@ -299,18 +1078,208 @@ class MainWindow(QtGui.QMainWindow):
         filt = dialog.selectedFilter()
         self._settings.setValue('last_save_path', filepath)
 
-        if filt == TXT_FILTER:
-            delimiter = '\t'
-        elif filt == CSV_FILTER:
-            delimiter = ','
+        for fmt, dataFilter in DATA_FILTERS.iteritems():
+            if filt == dataFilter:
+                break
         else:
             raise RuntimeError('unexpected execution path')
-        with open(filepath, 'w') as f:
-            for x, y in self.plotScene.getData():
-                f.write('%E%s%E\n' % (x, delimiter, y))
+        export.writeData(filepath, data, fmt)
+
+    def getCurveColor(self):
+        '''
+        Ask for a curve color and tolerance. Returns an ((r, g, b), tolerance)
+        tuple, or None if canceled.
+        '''
+        color = QtGui.QColorDialog.getColor(parent=self)
+        if not color.isValid():
+            return None
+        tolerance, ok = QtGui.QInputDialog.getInt(self, 'Plot Liberator',
+                'Color tolerance (0-255):', DEFAULT_COLOR_TOLERANCE, 0, 255)
+        if not ok:
+            return None
+        return (color.red(), color.green(), color.blue()), tolerance
+
+    def extractCurve(self):
+        result = self.getCurveColor()
+        if result is None:
+            return
+        color, tolerance = result
+        positions = self.plotScene.extractTrace(color, tolerance)
+        self.plotScene.addDataPoints(positions)
+        self.statusBar().showMessage(
+                            'Extracted {} data points'.format(len(positions)))
+
+    def extractMarkers(self):
+        result = self.getCurveColor()
+        if result is None:
+            return
+        color, tolerance = result
+        maxSize, ok = QtGui.QInputDialog.getInt(self, 'Plot Liberator',
+                'Largest marker size (pixels):', MAX_MARKER_SIZE, 1, 1000)
+        if not ok:
+            return
+        positions = self.plotScene.extractMarkers(color, tolerance, maxSize)
+        self.plotScene.addDataPoints(positions)
+        self.statusBar().showMessage(
+                            'Extracted {} markers'.format(len(positions)))
+
+    def exportCurve(self):
+        result = self.getCurveColor()
+        if result is None:
+            return
+        color, tolerance = result
+        positions = self.plotScene.extractTrace(color, tolerance)
+        self.writeData(self.plotScene.mapToDataArray(positions))
+
+    def digitizeSequence(self):
+        '''
+        Ask for frames of the plot and an output file, and extract a curve
+        from every frame in the background, with the current calibration.
+        '''
+        openpath = self._settings.value('last_open_path', '')
+        imagePaths, _filt = QtGui.QFileDialog.getOpenFileNames(self,
+                                'Open the frames of a plot', openpath,
+                                IMAGE_FILTER)
+        if not imagePaths:
+            return
+        result = self.getCurveColor()
+        if result is None:
+            return
+        color, tolerance = result
+        savepath = self._settings.value('last_save_path', '')
+        savepath, _filt = QtGui.QFileDialog.getSaveFileName(self,
+                                'Save the stacked data', savepath,
+                                SEQUENCE_FILTER)
+        if not savepath:
+            return
+        self._settings.setValue('last_save_path', savepath)
+
+        calibration = self.plotScene.calibration()
+        calibration.update(color=color, tolerance=tolerance)
+        self.cancelSequence()
+        worker = SequenceWorker(sorted(imagePaths, key=naturalSortKey),
+                                calibration, savepath)
+        worker.progress.connect(self.sequenceProgress)
+        worker.done.connect(self.sequenceDone)
+        worker.failed.connect(self.sequenceFailed)
+        self._sequenceWorker = worker
+        self._sequenceStart.start()
+        self.cancelSequenceAction.setEnabled(True)
+        worker.start()
+
+    def cancelSequence(self):
+        if self._sequenceWorker is None:
+            return
+        worker = self._sequenceWorker
+        worker.cancel()
+        self._retiredSequenceWorkers.add(worker)
+        worker.finished.connect(
+                        lambda: self._retiredSequenceWorkers.discard(worker))
+        self._sequenceWorker = None
+        self.cancelSequenceAction.setEnabled(False)
+        self.statusBar().clearMessage()
+
+    def sequenceProgress(self, worker, frames, count):
+        if worker is not self._sequenceWorker:
+            return
+        seconds = self._sequenceStart.elapsed() / 1000.
+        self.statusBar().showMessage(
+                'Digitized frame {} of {} ({:.1f} fps)'.format(
+                                frames, count, frames / max(seconds, 1e-3)))
+
+    def sequenceDone(self, worker, frames, seconds, failures):
+        if worker is not self._sequenceWorker:
+            return
+        self._sequenceWorker = None
+        self.cancelSequenceAction.setEnabled(False)
+        self.statusBar().showMessage(
+                'Digitized {} frames in {:.1f} s ({:.1f} fps, {} failed)'
+                .format(frames, seconds, frames / max(seconds, 1e-3),
+                        failures))
+
+    def sequenceFailed(self, worker, message):
+        if worker is not self._sequenceWorker:
+            return
+        self._sequenceWorker = None
+        self.cancelSequenceAction.setEnabled(False)
+        self.statusBar().clearMessage()
+        QtGui.QMessageBox.warning(self, 'Plot Liberator',
+                                  'Digitizing the sequence failed:\n{}'
+                                  .format(message))
+
+    def setTracing(self, tracing):
+        if tracing:
+            viewport = self.view.viewport().rect()
+            self.plotScene.setTraceSeed(
+                                self.view.mapToScene(viewport.center()))
+        else:
+            self.plotScene.clearTraceSeed()
+        self.addTraceAction.setEnabled(tracing)
+
+    def addTracedPoints(self):
+        ids = self.plotScene.addTracedPoints()
+        self.statusBar().showMessage(
+                                'Added {} data points'.format(len(ids)))
+        self.traceAction.setChecked(False)
+
+    def pathPicked(self, index):
+        self.addPathAction.setEnabled(index >= 0)
+        if index >= 0:
+            self.statusBar().showMessage(u'Picked {}'.format(
+                                    self.plotScene.svgPaths[index].label()))
+
+    def addPathPoints(self):
+        ids = self.plotScene.addPickedPathPoints()
+        self.statusBar().showMessage(
+                                'Added {} data points'.format(len(ids)))
+        self.pickPathAction.setChecked(False)
+
+    def showDataPoint(self, index):
+        '''
+        Center the view on the data point in a row of the data table.
+        '''
+        pointId = self.dataTableModel.pointId(index.row())
+        x, y = self.plotScene.dataPoints.position(pointId)
+        self.view.centerOn(x, y)
+
+    def preprocess(self):
+        self.plotScene.preprocess(self.preprocessWidget.parameters(),
+                                  self.preprocessWidget.shownStage())
+        if self.plotScene.isPreprocessing():
+            self.statusBar().showMessage('Preprocessing...')
+
+    def setSnapColor(self):
+        result = self.getCurveColor()
+        if result is None:
+            return
+        color, tolerance = result
+        self.plotScene.setSnapColor(color, tolerance)
+        self.snapAction.setChecked(True)
+
+    def refinePoints(self):
+        count = self.plotScene.refineDataPoints()
+        self.statusBar().showMessage('Refined {} data points'.format(count))
 
     def clearData(self):
-        self.plotScene.clearDataPointItems()
+        self.plotScene.clearDataPoints()
+        self.updateSelectionActions()
+
+    def deleteSelectedPoints(self):
+        count = self.plotScene.deleteSelectedPoints()
+        self.statusBar().showMessage('Deleted {} data points'.format(count))
+
+    def colorSelectedPoints(self):
+        color = QtGui.QColorDialog.getColor(parent=self)
+        if not color.isValid():
+            return
+        self.plotScene.setSelectedPointsPen(QtGui.QPen(color, 1.,
+                                                       Qt.SolidLine))
+
+    @QtCore.Slot()
+    def updateSelectionActions(self):
+        selected = len(self.plotScene.selectedPoints()) > 0
+        self.deleteSelectedAction.setEnabled(selected)
+        self.colorSelectedAction.setEnabled(selected)
 
     def resetAxes(self):
         self.plotScene.resetAxisCorners()
@@ -321,6 +1290,190 @@ class MainWindow(QtGui.QMainWindow):
         self.xLogCheckBox.setChecked(False)
         self.yLogCheckBox.setChecked(False)
 
+    def detectAxes(self):
+        if not self.plotScene.detectAxisCorners():
+            self.statusBar().showMessage('No plot frame found', 5000)
+
+    def setCalibration(self, calibration):
+        '''
+        Set the axis corners and values from a calibration dict, as returned
+        by PlotScene.calibration.
+        '''
+        self.x1LineEdit.setText(repr(float(calibration['x1'])))
+        self.x2LineEdit.setText(repr(float(calibration['x2'])))
+        self.xLogCheckBox.setChecked(bool(calibration['xLog']))
+        self.y1LineEdit.setText(repr(float(calibration['y1'])))
+        self.y2LineEdit.setText(repr(float(calibration['y2'])))
+        self.yLogCheckBox.setChecked(bool(calibration['yLog']))
+        self.plotScene.setCorners(calibration['corners'])
+
+    def saveTemplate(self):
+        '''
+        Save the axes as a calibration template, which is applied to similar
+        plots when they're opened.
+        '''
+        source = self.plotScene.imageSource
+        if source is None:
+            return
+        if self.plotScene.templateHash is None:
+            self.plotScene.templateHash = imageHash(source)
+        try:
+            self._templates.add(self.plotScene.templateHash,
+                                (source.width(), source.height()),
+                                self.plotScene.calibration())
+        except (IOError, OSError) as e:
+            self.statusBar().showMessage(
+                    u'Cannot save template {}: {}'.format(
+                                            self._templates.path(), e))
+            return
+        self.statusBar().showMessage('Saved the calibration template', 5000)
+
+    def sessionMetadata(self):
+        return dict(imagePath=self.filepath or None,
+                    page=self._currentPage,
+                    calibration=self.plotScene.calibration())
+
+    def openSession(self):
+        openpath = self._settings.value('last_session_path', '')
+        dialog = QtGui.QFileDialog(parent=self,
+                                   caption='Open a session',
+                                   directory=openpath,
+                                   filter=SESSION_FILTER)
+        dialog.selectFile(openpath)
+        dialog.setFileMode(dialog.ExistingFile)
+        if not dialog.exec_():
+            return
+
+        filepath = dialog.selectedFiles()[0]
+        self._settings.setValue('last_session_path', filepath)
+        self.newDocumentIfInUse()
+        if self.restoreSession(filepath):
+            self._sessionWriter = SessionWriter(filepath)
+
+    def restoreSession(self, filepath):
+        '''
+        Restore the plot image, axes and data points from a session file.
+        The image is loaded in the background, and the axes and data points
+        are applied once it's ready. Returns True on success.
+        '''
+        try:
+            metadata, positions = loadSession(filepath)
+        except (IOError, ValueError, KeyError) as e:
+            QtGui.QMessageBox.information(self, "Plot Liberator",
+                    "Cannot open session %s: %s" % (filepath, e))
+            return False
+        calibration = metadata['calibration']
+        imagePath = metadata.get('imagePath')
+        if imagePath and os.path.exists(imagePath):
+            self.loadImage(imagePath, metadata.get('page', 0))
+            self._pendingSession = calibration, positions
+        else:
+            self._pendingSession = calibration, positions
+            self.applyPendingSession()
+        return True
+
+    def applyPendingSession(self):
+        if self._pendingSession is None:
+            return
+        calibration, positions = self._pendingSession
+        self._pendingSession = None
+        if calibration is not None:
+            self.setCalibration(calibration)
+        if positions is not None:
+            # Rebuild the data points in bulk
+            self.plotScene.clearDataPoints()
+            self.plotScene.addDataPoints(positions)
+
+    def saveSession(self):
+        if self._sessionWriter is None:
+            self.saveSessionAs()
+        else:
+            self.writeSession(self._sessionWriter)
+
+    def saveSessionAs(self):
+        savepath = self._settings.value('last_session_path', '')
+        dialog = QtGui.QFileDialog(parent=self,
+                                   caption='Save session',
+                                   directory=savepath,
+                                   filter=SESSION_FILTER)
+        dialog.selectFile(savepath)
+        dialog.setAcceptMode(dialog.AcceptSave)
+        dialog.setDefaultSuffix('plsession')
+        if not dialog.exec_():
+            return
+
+        filepath = dialog.selectedFiles()[0]
+        self._settings.setValue('last_session_path', filepath)
+        writer = SessionWriter(filepath)
+        if self.writeSession(writer):
+            self._sessionWriter = writer
+            self.removeAutosave()
+
+    def writeSession(self, writer):
+        '''
+        Save the session with a SessionWriter. Returns True on success.
+        '''
+        try:
+            writer.save(self.sessionMetadata(), self.plotScene.dataPoints)
+        except (IOError, OSError) as e:
+            self.statusBar().showMessage(
+                    u'Cannot save session {}: {}'.format(writer.path(), e))
+            return False
+        return True
+
+    def autosave(self):
+        '''
+        Incrementally save any changes to the current document, to the named
+        session if there is one, or to its autosave file otherwise.
+        '''
+        autosaveWriter = self.document.autosaveWriter
+        writer = self._sessionWriter or autosaveWriter
+        if (writer is autosaveWriter and not self.filepath and
+                not len(self.plotScene.dataPoints)):
+            # Nothing worth recovering
+            return
+        if self._pendingSession is None and writer.needsSave(
+                        self.sessionMetadata(), self.plotScene.dataPoints):
+            self.writeSession(writer)
+
+    def recoverAutosave(self):
+        '''
+        Offer to restore the autosaved sessions left from last time, if
+        there are any, each in its own document.
+        '''
+        paths = sorted(glob.glob(os.path.join(self._autosaveDir,
+                                              AUTOSAVE_PATTERN)))
+        if not paths:
+            return
+        if len(paths) == 1:
+            question = 'Recover the unsaved plot from last time?'
+        else:
+            question = 'Recover the {} unsaved plots from last time?'.format(
+                                                                len(paths))
+        reply = QtGui.QMessageBox.question(self, 'Recover?', question,
+                QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
+                QtGui.QMessageBox.Yes)
+        for i, path in enumerate(paths):
+            if reply == QtGui.QMessageBox.Yes:
+                if i == 0:
+                    self.newDocumentIfInUse()
+                else:
+                    self.activateDocument(self.addDocument())
+                if self.restoreSession(path):
+                    # Keep autosaving the recovered document to its file
+                    self.document.autosaveWriter = SessionWriter(path)
+                    continue
+            os.remove(path)
+
+    def removeAutosave(self, document=None):
+        '''
+        Remove the autosave file of a document, by default the current one.
+        '''
+        document = document or self.document
+        path = document.autosaveWriter.path()
+        if os.path.exists(path):
+            os.remove(path)
+
     def about(self):
         title = 'About Plot Liberator'
         text = ('Plot Liberator\n'
@@ -356,13 +1509,34 @@ class MainWindow(QtGui.QMainWindow):
         p = QtGui.QDesktopWidget().availableGeometry().topLeft()
         self.move(p)
 
+    def hasUnnamedDocuments(self):
+        '''
+        Returns True if a document with an image or data points hasn't been
+        saved as a named session.
+        '''
+        self.storeDocument()
+        return any(document.sessionWriter is None and
+                   (document.pagesPath is not None or
+                    len(document.plotScene.dataPoints))
+                   for document in self.documents)
+
     def closeEvent(self, event):
-        reply = QtGui.QMessageBox.question(self, 'Quit?',
-                'Are you sure you want to quit?',
+        if self.hasUnnamedDocuments():
+            question = ('Quit without saving? Plots that were not saved as '
+                        'a session will be lost.')
+        else:
+            question = 'Are you sure you want to quit?'
+        reply = QtGui.QMessageBox.question(self, 'Quit?', question,
                 QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,
                 QtGui.QMessageBox.No)
 
         if reply == QtGui.QMessageBox.Yes:
+            # Save any last changes to the named session. The autosave file
+            # is only for recovering from a crash.
+            if self._sessionWriter is not None:
+                self.autosave()
+            for document in self.documents:
+                self.removeAutosave(document)
             event.accept()
         else:
             event.ignore()
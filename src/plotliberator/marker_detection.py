@@ -0,0 +1,143 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+import numpy
+
+# Markers smaller than this many pixels are taken to be noise
+MIN_MARKER_AREA = 3
+
+# Markers larger than this many pixels across are taken to be something else
+MAX_MARKER_SIZE = 20
+
+# Blobs more elongated than this, or filling less of their bounding box, are
+# taken to be pieces of lines rather than markers
+MAX_MARKER_ASPECT = 3.
+MIN_MARKER_FILL = 0.25
+
+
+def maskRuns(mask):
+    '''
+    Returns (rows, starts, stops) arrays of the horizontal runs of True in a
+    2D boolean mask, ordered by row and then by start column. Each run
+    covers columns start to stop - 1.
+    '''
+    height, width = mask.shape
+    padded = numpy.zeros((height, width + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = mask
+    edges = numpy.diff(padded, axis=1)
+    rows, starts = numpy.nonzero(edges == 1)
+    stops = numpy.nonzero(edges == -1)[1]
+    return rows, starts, stops
+
+
+def _overlaps(rows, starts, stops, width):
+    '''
+    Returns (a, b) arrays of the indices of each pair of 8-connected runs,
+    where run a is in the row above run b.
+    '''
+    # Keys sort the runs by row, then column
+    stride = width + 2
+    startKeys = rows * stride + starts
+    stopKeys = rows * stride + stops
+    # Runs in the row above that end at or after b's start - 1, and begin
+    # at or before b's stop.
+    above = (rows - 1) * stride
+    lo = numpy.searchsorted(stopKeys, above + starts, 'left')
+    hi = numpy.searchsorted(startKeys, above + stops + 1, 'left')
+    counts = (hi - lo).clip(0)
+    b = numpy.repeat(numpy.arange(len(rows)), counts)
+    offsets = numpy.arange(counts.sum()) - numpy.repeat(counts.cumsum() -
+                                                        counts, counts)
+    a = numpy.repeat(lo, counts) + offsets
+    return a, b
+
+
+def labelRuns(rows, starts, stops, width):
+    '''
+    Label the 8-connected components of a set of runs, as returned by
+    maskRuns. Returns an array with the label of each run, where labels are
+    the index of the first run in each component.
+    '''
+    a, b = _overlaps(rows, starts, stops, width)
+    labels = numpy.arange(len(rows))
+    while True:
+        # Hook the root of each pair's larger label onto the smaller label
+        la = labels[a]
+        lb = labels[b]
+        unmerged = la != lb
+        if not unmerged.any():
+            return labels
+        a = a[unmerged]
+        b = b[unmerged]
+        low = numpy.minimum(la[unmerged], lb[unmerged])
+        numpy.minimum.at(labels, la[unmerged], low)
+        numpy.minimum.at(labels, lb[unmerged], low)
+        # Then point every run directly at its root
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+
+
+def detectMarkers(mask, minArea=MIN_MARKER_AREA, maxSize=MAX_MARKER_SIZE,
+                  maxAspect=MAX_MARKER_ASPECT, minFill=MIN_MARKER_FILL):
+    '''
+    Find the markers in a boolean mask of the marker pixels, and return an
+    Nx2 array of their centroids in pixel coordinates.
+
+    Parameters
+    ----------
+    mask : ndarray
+        (height, width) boolean array of the marker pixels
+    minArea : int
+        smaller blobs are ignored
+    maxSize : int
+        blobs wider or taller than this are ignored
+    maxAspect : float
+        blobs with a larger bounding box aspect ratio are ignored
+    minFill : float
+        blobs that fill less of their bounding box are ignored
+    '''
+    rows, starts, stops = maskRuns(mask)
+    if not len(rows):
+        return numpy.empty((0, 2))
+    labels = labelRuns(rows, starts, stops, mask.shape[1])
+    # Sum over the runs of each component
+    components, index = numpy.unique(labels, return_inverse=True)
+    lengths = (stops - starts).astype(numpy.float64)
+    area = numpy.bincount(index, lengths)
+    # Pixel centers are at +0.5
+    sumX = numpy.bincount(index, lengths * (starts + stops) / 2.)
+    sumY = numpy.bincount(index, lengths * (rows + 0.5))
+    order = numpy.argsort(index, kind='mergesort')
+    first = numpy.searchsorted(index[order], numpy.arange(len(components)))
+    left = numpy.minimum.reduceat(starts[order], first)
+    right = numpy.maximum.reduceat(stops[order], first)
+    top = numpy.minimum.reduceat(rows[order], first)
+    bottom = numpy.maximum.reduceat(rows[order], first) + 1
+    w = (right - left).astype(numpy.float64)
+    h = (bottom - top).astype(numpy.float64)
+    keep = ((area >= minArea) & (w <= maxSize) & (h <= maxSize) &
+            (numpy.maximum(w, h) <= maxAspect * numpy.minimum(w, h)) &
+            (area >= minFill * w * h))
+    return numpy.column_stack((sumX[keep] / area[keep],
+                               sumY[keep] / area[keep]))
@@ -0,0 +1,208 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import struct
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+# third party imports
+from PySide import QtGui, QtCore
+from PySide.QtCore import Qt
+
+# local imports
+
+# Largest thumbnail dimension, in pixels
+THUMBNAIL_SIZE = 128
+
+
+# The byte orders of TIFF files, by the start of their header
+_TIFF_BYTE_ORDERS = {'II*\x00': '<', 'MM\x00*': '>'}
+_TIFF_MAGIC = dict((order, magic)
+                   for magic, order in _TIFF_BYTE_ORDERS.iteritems())
+
+
+def tiffDirectories(path):
+    '''
+    Returns the byte order ('<' or '>') of a TIFF file and a list of the
+    file offsets of its image directories, one per page, or None if it
+    isn't a (classic) TIFF file.
+
+    The directories are read here because Qt's TIFF plugin only reads the
+    first page of a file.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(8)
+            order = _TIFF_BYTE_ORDERS.get(header[:4])
+            if order is None or len(header) < 8:
+                return None
+            offsets = []
+            offset, = struct.unpack(order + 'I', header[4:])
+            # Each directory is a count of 12 byte entries, the entries,
+            # and the offset of the next directory, or 0 after the last
+            while offset and offset not in offsets:
+                f.seek(offset)
+                data = f.read(2)
+                if len(data) < 2:
+                    break
+                offsets.append(offset)
+                count, = struct.unpack(order + 'H', data)
+                f.seek(offset + 2 + 12 * count)
+                data = f.read(4)
+                if len(data) < 4:
+                    break
+                offset, = struct.unpack(order + 'I', data)
+    except IOError:
+        return None
+    return order, offsets
+
+
+def pageCount(path):
+    '''
+    Returns the number of pages (frames) in an image file, e.g. a
+    multi-page TIFF. Files that aren't readable as images have one page.
+    '''
+    directories = tiffDirectories(path)
+    if directories is not None:
+        return max(len(directories[1]), 1)
+    return max(QtGui.QImageReader(path).imageCount(), 1)
+
+
+class PageFile(QtCore.QFile):
+    '''
+    A QFile of an image file that reads as if one of its pages were the
+    first. For a TIFF file, the offset of the first image directory in the
+    header is replaced by that of the page, which lets Qt's TIFF plugin
+    decode any page.
+    '''
+
+    def __init__(self, path, page=0):
+        super(PageFile, self).__init__(path)
+        self._page = page
+        self._header = None
+        if not page:
+            return
+        directories = tiffDirectories(path)
+        if directories is None:
+            return
+        order, offsets = directories
+        if page >= len(offsets):
+            raise IOError(u'Cannot find page {} of {}.'.format(page + 1,
+                                                                 path))
+        self._header = _TIFF_MAGIC[order] + struct.pack(order + 'I',
+                                                        offsets[page])
+
+    def page(self):
+        return self._page
+
+    def isPatched(self):
+        '''
+        Returns True if the page reads as the first page of the file
+        '''
+        return self._header is not None or not self._page
+
+    def readData(self, maxlen):
+        pos = self.pos()
+        data = super(PageFile, self).readData(maxlen)
+        if data and self._header is not None and pos < len(self._header):
+            end = min(len(self._header), pos + len(data))
+            data = self._header[pos:end] + data[end - pos:]
+        return data
+
+
+def readPage(path, page=0, device=None):
+    '''
+    Decode one page of an image file as a QImage. Pass an open PageFile of
+    the page to read from it instead of opening path.
+    '''
+    f = device
+    if f is None:
+        f = PageFile(path, page)
+        if not f.open(QtCore.QIODevice.ReadOnly):
+            raise IOError(u'Cannot open {}.'.format(path))
+    try:
+        reader = QtGui.QImageReader(f, QtGui.QImageReader.imageFormat(path))
+        # Other multi-frame formats, e.g. GIF, can jump to a frame
+        if not f.isPatched() and not reader.jumpToImage(page):
+            raise IOError(u'Cannot find page {} of {}.'.format(page + 1,
+                                                                path))
+        image = reader.read()
+        if image.isNull():
+            raise IOError(u'Cannot load page {} of {}: {}'.format(
+                                    page + 1, path, reader.errorString()))
+    finally:
+        if device is None:
+            f.close()
+    return image
+
+
+class ThumbnailLoader(QtCore.QThread):
+    '''
+    Decodes thumbnails of the pages of an image file in the background,
+    several pages at a time. Each page is decoded at full resolution in a
+    worker thread and scaled down, so only one full page per worker is held
+    at a time. Emits thumbnailReady(loader, page, image) as each one is
+    finished, in no particular order.
+    '''
+    thumbnailReady = QtCore.Signal(object, int, object)
+
+    def __init__(self, path, count, size=THUMBNAIL_SIZE, threads=None,
+                 parent=None):
+        super(ThumbnailLoader, self).__init__(parent)
+        self._path = path
+        self._count = count
+        self._size = size
+        self._threads = threads or cpu_count()
+        self._canceled = False
+
+    def path(self):
+        return self._path
+
+    def cancel(self):
+        self._canceled = True
+
+    def thumbnail(self, page):
+        '''
+        Returns a (page, image) tuple, where image is None if the page
+        can't be read, or the loader was canceled.
+        '''
+        if self._canceled:
+            return page, None
+        try:
+            image = readPage(self._path, page)
+        except IOError:
+            return page, None
+        return page, image.scaled(self._size, self._size,
+                                  Qt.KeepAspectRatio,
+                                  Qt.SmoothTransformation)
+
+    def run(self):
+        pool = ThreadPool(min(self._threads, self._count))
+        try:
+            for page, image in pool.imap_unordered(self.thumbnail,
+                                                   xrange(self._count)):
+                if self._canceled:
+                    break
+                if image is not None:
+                    self.thumbnailReady.emit(self, page, image)
+        finally:
+            pool.close()
+            pool.join()
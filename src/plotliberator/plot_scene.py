@@ -19,20 +19,85 @@
 #############################################################################
 
 # std lib imports
-from math import exp, log
+from math import exp, sqrt
 
 # third party imports
+import numpy
 from PySide import QtGui, QtCore
 from PySide.QtCore import Qt
 
 # local imports
-from plotliberator.graphics_items import MovableCursorItem, GuideLineItem
+from plotliberator.graphics_items import (MovableCursorItem, GuideLineItem,
+                                          PointCollectionItem)
+from plotliberator.data_mapping import (calibrationTransform,
+                                         transformToArray, mapArray)
+from plotliberator.image_array import (iterImageBands, imageToArray,
+                                       arrayToImage, toArgb32, bufferArray,
+                                       RGB_CHANNELS)
+from plotliberator.axis_detection import detectAxisBox, darkMask
+from plotliberator.extraction import columnTrace, dropMissing, colorMask
+from plotliberator.curve_tracing import CurveTracer, findSeed
+from plotliberator.marker_detection import detectMarkers, MAX_MARKER_SIZE
+from plotliberator.refinement import refinePositions, REFINE_RADIUS
+from plotliberator.preprocessing import Pipeline, PreprocessWorker
+from plotliberator.tiled_image import (TiledImageItem, MemoryImageSource,
+                                       TileCache)
+from plotliberator.point_store import PointStore
+from plotliberator.snapping import SnapMapBuilder
+from plotliberator.svg_import import SvgImageSource
+
+# Larger images are downscaled to about this many pixels for axis detection
+AXIS_DETECTION_PIXELS = 4000000
+
+# Snapping is disabled for larger images, to bound the snap map's memory
+SNAP_MAP_PIXELS = 50000000
+
+# Memory budget for the snap maps of recent snap colors, in bytes
+SNAP_MAP_CACHE_BUDGET = 128 * 1024 * 1024
+
+# Memory budget for cached extraction results, in bytes
+EXTRACTION_CACHE_BUDGET = 64 * 1024 * 1024
+
+# Distance from an SVG path that still picks it, in screen pixels
+PATH_PICK_DISTANCE = 4.
+
+# Longer picked paths are highlighted with a subset of their vertices
+MAX_HIGHLIGHT_VERTICES = 100000
 
 
 class PlotScene(QtGui.QGraphicsScene):
 
-    dataPointItems = []
+    # Emitted when a preprocessed image is shown
+    preprocessed = QtCore.Signal()
+
+    # Emitted after the data transform is rebuilt, so that everything
+    # mapped through it can be refreshed together
+    calibrationChanged = QtCore.Signal()
+
+    # Emitted after the data points change. Points are added at the end of
+    # the store's rows, and a removed point's row is filled by the last one.
+    pointsAdded = QtCore.Signal(int)  # count
+    pointRemoved = QtCore.Signal(int)  # row
+    pointsMoved = QtCore.Signal(object)  # array of ids
+    pointsRemoved = QtCore.Signal(object)  # sorted array of former rows
+    pointsReset = QtCore.Signal()
+
+    # Emitted when data points are selected or deselected
+    pointSelectionChanged = QtCore.Signal()
+
+    # Emitted when an SVG path is picked, or -1 when it's unpicked
+    pathPicked = QtCore.Signal(int)  # path index
+
+    dataPoints = None
+    dataPointSize = 6.
     dataTransform = None
+    dataMatrix = None
+    snapMap = None
+    processedImage = None
+    templateHash = None
+    traceTolerance = 40
+    tracePositions = None
+    pickedPath = None
 
     _x1 = 0.
     _x2 = 1.
@@ -44,7 +109,66 @@ class PlotScene(QtGui.QGraphicsScene):
     def __init__(self, parent=None):
         super(PlotScene, self).__init__(parent)
 
-        self.image = None
+        self.imageSource = None
+
+        # Data point positions, and the movable item standing in for the
+        # point being dragged, if any
+        self.dataPoints = PointStore()
+        self._dragItem = None
+
+        # Selecting data points with a rubber band or lasso, which is
+        # resolved with a spatial query when the mouse is released, and
+        # dragging the selection, which moves the points once when dropped
+        self._bandOrigin = None
+        self._lassoPoints = None
+        self._selectionDragOrigin = None
+
+        # The paths of an SVG plot, which are picked with the mouse and
+        # added as data points with their exact vertices. All the vertices
+        # are kept in one array in scene coordinates, with the index of
+        # each vertex's path, and NaN rows between paths and subpaths.
+        self.svgPaths = []
+        self.pathPicking = False
+        self._pathVertices = numpy.empty((0, 2))
+        self._pathIndexes = numpy.empty(0, dtype=numpy.int64)
+
+        # Snapping to curves. The snap map is rebuilt in the background when
+        # the image or snap color changes, and the old one is used until the
+        # new one is ready. The maps of recent snap colors are cached until
+        # the image changes.
+        self._snapMaps = TileCache(SNAP_MAP_CACHE_BUDGET)
+        self._snapEnabled = False
+        self._snapColor = None
+        self._snapTolerance = 0
+        self._snapBuilder = None
+        self._retiredSnapBuilders = set()
+
+        # Curve tracing. The pixel array and the tracer for the last curve
+        # color are kept, so that retracing while the seed is dragged only
+        # follows the curve.
+        self._pixelImage = None
+        self._pixels = None
+        self._tracer = None
+        self._tracerKey = None
+        self.traceSeed = None
+
+        # The full image of a lazily decoded source, decoded the first time
+        # it's needed and kept until the image changes
+        self._sourceImage = None
+
+        # Extraction results, in scene coordinates, by extraction parameters.
+        # They don't depend on the calibration, so calibration edits only
+        # remap them. They're dropped when the plot image changes.
+        self._extractionCache = TileCache(EXTRACTION_CACHE_BUDGET)
+
+        # Preprocessing. The pipeline caches the output of each stage, and
+        # the shown stage stands in for the plot image until it changes.
+        self.preprocessPipeline = Pipeline()
+        self._preprocessParameters = {}
+        self._shownStage = None
+        self._preprocessWorker = None
+        self._retiredPreprocessWorkers = set()
+        self._imageHash = None
 
         # Initialize axis corners:
         # c1  c2
@@ -65,11 +189,15 @@ class PlotScene(QtGui.QGraphicsScene):
         self.c3.setZValue(2.)
         self.c4.setZValue(2.)
 
-        # Initialize guide lines
-        self.gl1 = GuideLineItem(self.c1, self.c2, scene=self)
-        self.gl2 = GuideLineItem(self.c2, self.c3, scene=self)
-        self.gl3 = GuideLineItem(self.c3, self.c4, scene=self)
-        self.gl4 = GuideLineItem(self.c4, self.c1, scene=self)
+        # Initialize guide lines. They're rebuilt along with the transform.
+        self.gl1 = GuideLineItem(self.c1, self.c2, track=False,
+                                 scene=self)
+        self.gl2 = GuideLineItem(self.c2, self.c3, track=False,
+                                 scene=self)
+        self.gl3 = GuideLineItem(self.c3, self.c4, track=False,
+                                 scene=self)
+        self.gl4 = GuideLineItem(self.c4, self.c1, track=False,
+                                 scene=self)
 
         self.gl1.setPen(QtGui.QPen(Qt.red, 1., Qt.DashLine))
         self.gl2.setPen(QtGui.QPen(Qt.red, 1., Qt.DashLine))
@@ -81,21 +209,51 @@ class PlotScene(QtGui.QGraphicsScene):
         self.gl3.setZValue(1.)
         self.gl4.setZValue(1.)
 
-        # Initialize the data tranform
+        # Initialize data points item
+        self.dataPointsItem = PointCollectionItem(self.dataPoints,
+                                                  size=self.dataPointSize,
+                                                  scene=self)
+        self.dataPointsItem.setPen(QtGui.QPen(Qt.darkGreen, 1., Qt.SolidLine))
+        self.dataPointsItem.setZValue(3.)
+
+        # Initialize the selection rubber band
+        self.selectionBandItem = QtGui.QGraphicsPathItem(scene=self)
+        bandPen = QtGui.QPen(QtGui.QColor(255, 128, 0), 1., Qt.DashLine)
+        bandPen.setCosmetic(True)
+        self.selectionBandItem.setPen(bandPen)
+        self.selectionBandItem.setBrush(QtGui.QColor(255, 128, 0, 32))
+        self.selectionBandItem.setAcceptedMouseButtons(Qt.NoButton)
+        self.selectionBandItem.setZValue(4.)
+
+        # Initialize the traced curve preview
+        self.tracePathItem = QtGui.QGraphicsPathItem(scene=self)
+        self.tracePathItem.setPen(QtGui.QPen(Qt.blue, 1., Qt.DashLine))
+        self.tracePathItem.setZValue(1.)
+
+        # Initialize the picked SVG path highlight
+        self.pickedPathItem = QtGui.QGraphicsPathItem(scene=self)
+        pathPen = QtGui.QPen(QtGui.QColor(255, 0, 255, 160), 3.,
+                             Qt.SolidLine)
+        pathPen.setCosmetic(True)
+        self.pickedPathItem.setPen(pathPen)
+        self.pickedPathItem.setAcceptedMouseButtons(Qt.NoButton)
+        self.pickedPathItem.setZValue(1.)
+
+        # Initialize the data tranform. Calibration changes only mark it
+        # dirty, and it's rebuilt once they've all been made.
+        self._calibrationDirty = False
         self.updateTransform()
 
-        # Initialize pixmap item
-        self.pixmapItem = QtGui.QGraphicsPixmapItem(scene=self)
-        self.pixmapItem.setAcceptTouchEvents(False)
-        # Make pixmap zooming look pretty
-        self.pixmapItem.setTransformationMode(Qt.SmoothTransformation)
-        self.pixmapItem.setZValue(0.)
+        # Initialize image item
+        self.imageItem = TiledImageItem(scene=self)
+        self.imageItem.setAcceptTouchEvents(False)
+        self.imageItem.setZValue(0.)
 
         # Connect signals and slots
-        self.c1.posChanged.connect(self.updateTransform)
-        self.c2.posChanged.connect(self.updateTransform)
-        self.c3.posChanged.connect(self.updateTransform)
-        self.c4.posChanged.connect(self.updateTransform)
+        self.c1.posChanged.connect(self.scheduleCalibrationUpdate)
+        self.c2.posChanged.connect(self.scheduleCalibrationUpdate)
+        self.c3.posChanged.connect(self.scheduleCalibrationUpdate)
+        self.c4.posChanged.connect(self.scheduleCalibrationUpdate)
 
     def x1(self):
         return self._x1
@@ -113,88 +271,383 @@ class PlotScene(QtGui.QGraphicsScene):
         self._x1 = x1
         self._x2 = x2
         self._xLog = xLog
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     def setYValues(self, y1, y2, yLog):
         self._y1 = y1
         self._y2 = y2
         self._yLog = yLog
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(float)
     def setX1(self, v):
         print v
         self._x1 = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(float)
     def setX2(self, v):
         print v
         self._x2 = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(float)
     def setY1(self, v):
         print v
         self._y1 = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(float)
     def setY2(self, v):
         print v
         self._y2 = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(bool)
     def setXLog(self, v):
         self._xLog = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
 
     @QtCore.Slot(bool)
     def setYLog(self, v):
         self._yLog = v
-        self.updateTransform()
+        self.scheduleCalibrationUpdate()
+
+    def corners(self):
+        '''
+        Returns the (x, y) positions of the axis corners, c1 to c4.
+        '''
+        return [(c.x(), c.y()) for c in (self.c1, self.c2, self.c3, self.c4)]
+
+    def setCorners(self, corners):
+        '''
+        Move the axis corners, c1 to c4, to the given (x, y) positions.
+        '''
+        for c, (x, y) in zip((self.c1, self.c2, self.c3, self.c4), corners):
+            c.setPos(x, y)
+
+    def calibration(self):
+        '''
+        Returns the axis corners and values as a dict, with the same keys as
+        the calibration spec of the batch script.
+        '''
+        self.flushCalibration()
+        return dict(corners=self.corners(),
+                    x1=self._x1, x2=self._x2, xLog=self._xLog,
+                    y1=self._y1, y2=self._y2, yLog=self._yLog)
+
+    @QtCore.Slot()
+    def scheduleCalibrationUpdate(self):
+        '''
+        Mark the calibration dirty, and rebuild the transform and guide lines
+        once, after the pending events have been processed. Dragging a
+        corner or resetting all four then costs one rebuild per frame,
+        rather than one per change.
+        '''
+        if not self._calibrationDirty:
+            self._calibrationDirty = True
+            QtCore.QTimer.singleShot(0, self.flushCalibration)
 
     @QtCore.Slot()
+    def flushCalibration(self):
+        '''
+        Apply a scheduled calibration update now, if there is one. Anything
+        that maps through the data transform calls this first, so it never
+        sees a stale transform.
+        '''
+        if not self._calibrationDirty:
+            return
+        self._calibrationDirty = False
+        for guideLine in (self.gl1, self.gl2, self.gl3, self.gl4):
+            guideLine.handleChange()
+        self.updateTransform()
+        self.calibrationChanged.emit()
+
     def updateTransform(self):
-        p1 = self.c1.pos()
-        p2 = self.c2.pos()
-        p3 = self.c3.pos()
-        p4 = self.c4.pos()
-        inPolygon = QtGui.QPolygonF((p1, p2, p3, p4))
-        if self._xLog:
-            x1 = log(self._x1)
-            x2 = log(self._x2)
-        else:
-            x1 = self._x1
-            x2 = self._x2
-        if self._yLog:
-            y1 = log(self._y1)
-            y2 = log(self._y2)
-        else:
-            y1 = self._y1
-            y2 = self._y2
-        outPolygon = QtGui.QPolygonF((QtCore.QPointF(x1, y2),
-                                      QtCore.QPointF(x2, y2),
-                                      QtCore.QPointF(x2, y1),
-                                      QtCore.QPointF(x1, y1)))
-        dataTransform = QtGui.QTransform.quadToQuad(inPolygon, outPolygon)
+        dataTransform = calibrationTransform(self.corners(),
+                                             self._x1, self._x2,
+                                             self._y1, self._y2,
+                                             self._xLog, self._yLog)
         if dataTransform is not None:
             self.dataTransform = dataTransform
+            self.dataMatrix = transformToArray(dataTransform)
 
     def setPlotImage(self, image):
-        self.image = image
-        pixmap = QtGui.QPixmap.fromImage(image)
-        self.pixmapItem.setPixmap(pixmap)
+        self.setImageSource(MemoryImageSource(image))
+
+    def setImageSource(self, source, templateHash=None):
+        '''
+        Set the plot image to an ImageSource, which is decoded lazily as
+        tiles are drawn. templateHash is the image's hash for calibration
+        templates, if it's already known.
+        '''
+        self.imageSource = source
+        self.templateHash = templateHash
+        self._sourceImage = None
+        self._imageHash = None
+        self.processedImage = None
+        self.imageItem.setSource(source)
+        self.updateSvgPaths()
         self.resetAxisCorners()
+        self.plotImageChanged()
+        self.preprocess(self._preprocessParameters, self._shownStage)
+
+    def plotImageChanged(self):
+        '''
+        Drop everything derived from the plot image's pixels.
+        '''
+        self._extractionCache.clear()
+        self._snapMaps.clear()
+        self.snapMap = None
+        self.rebuildSnapMap()
+        self._pixelImage = None
+        self._pixels = None
+        self._tracer = None
+        self._tracerKey = None
+        self.updateTrace()
+
+    def sourceImage(self):
+        '''
+        Returns the full, unprocessed plot image as a QImage, or None if
+        there is no image. A lazily decoded source is only decoded in full
+        once, the first time this is called.
+        '''
+        if self._sourceImage is None and self.imageSource is not None:
+            self._sourceImage = self.imageSource.image()
+        return self._sourceImage
+
+    def plotImage(self):
+        '''
+        Returns the full plot image as a QImage, or None if there is no image.
+        '''
+        if self.processedImage is not None:
+            return self.processedImage
+        return self.sourceImage()
+
+    def pixelArray(self):
+        '''
+        Returns a (height, width, 4) array of the plot image's 32-bit pixels,
+        or None if there is no image. The array is kept until the image
+        changes.
+        '''
+        if self._pixels is None and self.imageSource is not None:
+            self._pixelImage = toArgb32(self.plotImage())
+            self._pixels = bufferArray(self._pixelImage)
+        return self._pixels
+
+    def imageMemory(self):
+        '''
+        Returns an estimate of the memory held by the plot image and
+        everything derived from its pixels, in bytes. Nothing is decoded,
+        so this is cheap enough to call for every document.
+        '''
+        nbytes = (self.imageItem.nbytes() + self._extractionCache.nbytes() +
+                  self.preprocessPipeline.cache().nbytes() +
+                  self._pathVertices.nbytes)
+        if self.imageSource is not None:
+            nbytes += self.imageSource.nbytes()
+            if (self._sourceImage is not None and
+                    not self.imageSource.isDecoded()):
+                # A full decode of a lazy source
+                nbytes += self._sourceImage.byteCount()
+        if self.processedImage is not None:
+            nbytes += self.processedImage.byteCount()
+        if (self._pixelImage is not None and
+                self._pixelImage is not self._sourceImage and
+                self._pixelImage is not self.processedImage):
+            # A converted copy of the plot image
+            nbytes += self._pixelImage.byteCount()
+        # The current snap map is the most recently used one in the cache
+        nbytes += self._snapMaps.nbytes()
+        return nbytes
+
+    def releaseImage(self):
+        '''
+        Drop the plot image and everything derived from its pixels, to free
+        their memory, but keep the axes and data points. Set the image
+        source again to reload it.
+        '''
+        self.imageSource = None
+        self.templateHash = None
+        self._sourceImage = None
+        self._imageHash = None
+        self.processedImage = None
+        self.imageItem.setSource(None)
+        self.updateSvgPaths()
+        self.plotImageChanged()
+        self.preprocess(self._preprocessParameters, self._shownStage)
+        self.preprocessPipeline.clear()
+
+    @QtCore.Slot(bool)
+    def setMipmapsEnabled(self, enabled):
+        '''
+        Enable or disable drawing the image from pre-scaled mipmap levels.
+        '''
+        self.imageItem.setMipmapsEnabled(enabled)
+
+    def setTileCacheBudget(self, nbytes):
+        '''
+        Set the memory budget for decoded image tiles, in bytes.
+        '''
+        self.imageItem.cache().setBudget(nbytes)
+
+    def preprocess(self, parameters, shownStage):
+        '''
+        Run the preprocessing pipeline in the background, and then show the
+        output of one of its stages in place of the plot image.
+
+        Parameters
+        ----------
+        parameters : dict
+            keyword arguments of the enabled stages, by name, as taken by
+            `preprocessing.Pipeline.run`
+        shownStage : str or None
+            'grayscale', the name of a stage, or None to show the original
+            image
+        '''
+        self._preprocessParameters = parameters
+        self._shownStage = shownStage
+        if self._preprocessWorker is not None:
+            # Keep a reference until the thread finishes
+            worker = self._preprocessWorker
+            worker.cancel()
+            self._retiredPreprocessWorkers.add(worker)
+            worker.finished.connect(
+                    lambda: self._retiredPreprocessWorkers.discard(worker))
+            self._preprocessWorker = None
+        if shownStage is None or self.imageSource is None:
+            self.setProcessedImage(None)
+            return
+        # A lazy source is decoded by the worker rather than here
+        if self._sourceImage is not None:
+            image = self._sourceImage
+        else:
+            image = self.imageSource
+        worker = PreprocessWorker(self.preprocessPipeline, image, parameters,
+                                  self._imageHash)
+        worker.ready.connect(self._preprocessReady)
+        self._preprocessWorker = worker
+        worker.start(QtCore.QThread.LowPriority)
+
+    def isPreprocessing(self):
+        return self._preprocessWorker is not None
+
+    @QtCore.Slot(object, object, object)
+    def _preprocessReady(self, worker, imageHash, outputs):
+        if worker is not self._preprocessWorker:
+            return
+        self._preprocessWorker = None
+        self._imageHash = imageHash
+        if self._sourceImage is None:
+            # Keep the worker's decode of the plot image
+            self._sourceImage = worker.image()
+        self.setProcessedImage(arrayToImage(outputs[self._shownStage]))
+        self.preprocessed.emit()
+
+    def setProcessedImage(self, image):
+        '''
+        Show a processed QImage in place of the plot image, or the plot
+        image itself if image is None.
+        '''
+        if image is None and self.processedImage is None:
+            return
+        self.processedImage = image
+        if image is None:
+            self.imageItem.setSource(self.imageSource)
+        else:
+            self.imageItem.setSource(MemoryImageSource(image))
+        self.plotImageChanged()
+
+    @QtCore.Slot(bool)
+    def setSnapEnabled(self, enabled):
+        '''
+        Enable or disable snapping new and dragged data points to the
+        nearest curve pixel.
+        '''
+        self._snapEnabled = enabled
+        if enabled and self.snapMap is None:
+            self.rebuildSnapMap()
+
+    def isSnapEnabled(self):
+        return self._snapEnabled
+
+    def setSnapColor(self, color, tolerance):
+        '''
+        Snap to the pixels within tolerance of color, an (r, g, b) tuple, or
+        to dark pixels if color is None.
+        '''
+        self._snapColor = color
+        self._snapTolerance = tolerance
+        self.rebuildSnapMap()
+
+    def rebuildSnapMap(self):
+        '''
+        Start building the snap map for the current image and snap color,
+        if snapping is enabled and it isn't cached. The plot image is
+        decoded by the builder, if needed, rather than here.
+        '''
+        if self._snapBuilder is not None:
+            # Keep a reference until the thread finishes
+            builder = self._snapBuilder
+            builder.cancel()
+            self._retiredSnapBuilders.add(builder)
+            builder.finished.connect(
+                    lambda: self._retiredSnapBuilders.discard(builder))
+            self._snapBuilder = None
+        if not self._snapEnabled or self.imageSource is None:
+            return
+        if (self.imageSource.width() * self.imageSource.height() >
+                SNAP_MAP_PIXELS):
+            self.snapMap = None
+            return
+        snapMap = self._snapMaps.get(self.snapKey())
+        if snapMap is not None:
+            self.snapMap = snapMap
+            return
+        if self.processedImage is not None:
+            image = self.processedImage
+        elif self._sourceImage is not None:
+            image = self._sourceImage
+        else:
+            image = self.imageSource
+        builder = SnapMapBuilder(image, self._snapColor,
+                                 self._snapTolerance)
+        builder.ready.connect(self._snapMapReady)
+        self._snapBuilder = builder
+        builder.start(QtCore.QThread.LowPriority)
+
+    @QtCore.Slot(object, object)
+    def _snapMapReady(self, builder, snapMap):
+        if builder is self._snapBuilder:
+            self.snapMap = snapMap
+            self._snapMaps.put(self.snapKey(), snapMap, snapMap.nbytes())
+            self._snapBuilder = None
+            if self._sourceImage is None and self.processedImage is None:
+                # Keep the builder's decode of the plot image
+                self._sourceImage = builder.image()
+
+    def snapKey(self):
+        return self._snapColor, self._snapTolerance
+
+    def snapPosition(self, pos):
+        '''
+        Returns pos snapped to the nearest curve pixel, or pos if snapping
+        is disabled or there's no curve pixel nearby.
+        '''
+        if not self._snapEnabled or self.snapMap is None:
+            return pos
+        snapped = self.snapMap.snap(pos.x(), pos.y())
+        if snapped is None:
+            return pos
+        return QtCore.QPointF(*snapped)
 
     def resetAxisCorners(self):
         '''
         Move the axis corners to the image corners.
         '''
-        if self.image:
-            w = self.image.width()
-            h = self.image.height()
+        if self.imageSource is not None:
+            w = self.imageSource.width()
+            h = self.imageSource.height()
             self.c1.setPos(0, 0)
             self.c2.setPos(w, 0)
             self.c3.setPos(w, h)
@@ -205,20 +658,280 @@ class PlotScene(QtGui.QGraphicsScene):
             self.c3.setPos(300, 300)
             self.c4.setPos(0, 300)
 
+    def detectAxisCorners(self):
+        '''
+        Move the axis corners to the plot frame detected in the image.
+        Returns True if a frame was found.
+        '''
+        if self.imageSource is None:
+            return False
+        w = self.imageSource.width()
+        h = self.imageSource.height()
+        scale = sqrt(AXIS_DETECTION_PIXELS / float(w * h))
+        if scale < 1.:
+            image = self.imageSource.scaled(QtCore.QSize(
+                    max(int(w * scale), 1), max(int(h * scale), 1)))
+        else:
+            image = self.sourceImage()
+        corners = detectAxisBox(darkMask(imageToArray(image)))
+        if corners is None:
+            return False
+        sx = w / float(image.width())
+        sy = h / float(image.height())
+        self.setCorners([(x * sx, y * sy) for x, y in corners])
+        return True
+
+    def traceCurve(self, x, y):
+        '''
+        Follow the curve nearest to (x, y) in both directions, and return an
+        Nx2 array of the ordered positions along it, or an empty array if
+        there is no curve there. The curve color is taken from the nearest
+        pixel to (x, y) that isn't background.
+        '''
+        pixels = self.pixelArray()
+        if pixels is None:
+            return numpy.empty((0, 2))
+        seed = findSeed(pixels, x, y, RGB_CHANNELS,
+                        tolerance=self.traceTolerance)
+        if seed is None:
+            return numpy.empty((0, 2))
+        (x, y), color = seed
+        # Reuse the mask while dragging along a curve, whose pixels vary
+        # slightly in color due to antialiasing
+        key = color, self.traceTolerance
+        if not self._matchesTracerKey(key):
+            mask = colorMask(pixels, color, self.traceTolerance,
+                             RGB_CHANNELS)
+            self._tracer = CurveTracer(mask)
+            self._tracerKey = key
+        return self._tracer.trace(x, y)
+
+    def _matchesTracerKey(self, key):
+        '''
+        Returns True if the cached tracer was built for the same tolerance,
+        and a color within that tolerance of the key's.
+        '''
+        if self._tracerKey is None:
+            return False
+        color, tolerance = key
+        tracerColor, tracerTolerance = self._tracerKey
+        return (tolerance == tracerTolerance and
+                max(abs(a - b) for a, b in zip(color, tracerColor)) <=
+                tolerance)
+
+    def setTraceSeed(self, pos):
+        '''
+        Place a movable seed for tracing a curve at pos. The traced curve is
+        previewed, and updated as the seed is dragged.
+        '''
+        if self.traceSeed is None:
+            self.traceSeed = MovableCursorItem(pos, size=10., style='Circle',
+                                               scene=self)
+            self.traceSeed.setPen(QtGui.QPen(Qt.blue, 1., Qt.SolidLine))
+            self.traceSeed.setZValue(2.)
+            self.traceSeed.posChanged.connect(self.updateTrace)
+        else:
+            self.traceSeed.setPos(pos)
+        self.updateTrace()
+
+    def clearTraceSeed(self):
+        '''
+        Remove the trace seed and the traced curve.
+        '''
+        if self.traceSeed is not None:
+            self.removeItem(self.traceSeed)
+            self.traceSeed = None
+        self.updateTrace()
+
+    @QtCore.Slot()
+    def updateTrace(self):
+        '''
+        Retrace the curve at the trace seed.
+        '''
+        if self.traceSeed is None:
+            self.tracePositions = None
+            self.tracePathItem.setPath(QtGui.QPainterPath())
+            return
+        pos = self.traceSeed.pos()
+        self.tracePositions = self.traceCurve(pos.x(), pos.y())
+        path = QtGui.QPainterPath()
+        path.addPolygon(QtGui.QPolygonF([QtCore.QPointF(x, y)
+                                         for x, y in self.tracePositions]))
+        self.tracePathItem.setPath(path)
+
+    def addTracedPoints(self):
+        '''
+        Add data points along the traced curve, and return an array of their
+        ids.
+        '''
+        if self.tracePositions is None:
+            return numpy.empty(0, dtype=numpy.int64)
+        return self.addDataPoints(self.tracePositions)
+
+    def updateSvgPaths(self):
+        '''
+        Index the paths of an SVG plot image for picking.
+        '''
+        self.setPickedPath(None)
+        source = self.imageSource
+        if isinstance(source, SvgImageSource):
+            self.svgPaths = source.paths()
+        else:
+            self.svgPaths = []
+        gap = numpy.array([[numpy.nan, numpy.nan]])
+        vertices = []
+        indexes = []
+        for path in self.svgPaths:
+            vertices.append(source.mapToImage(path.vertices))
+            vertices.append(gap)
+            indexes.append(numpy.repeat(path.index, len(path.vertices) + 1))
+        if vertices:
+            self._pathVertices = numpy.concatenate(vertices)
+            self._pathIndexes = numpy.concatenate(indexes)
+        else:
+            self._pathVertices = numpy.empty((0, 2))
+            self._pathIndexes = numpy.empty(0, dtype=numpy.int64)
+
+    def setPathPicking(self, picking):
+        '''
+        While picking, clicks pick the nearest SVG path instead of adding
+        data points.
+        '''
+        self.pathPicking = picking
+        if not picking:
+            self.setPickedPath(None)
+
+    def pathAt(self, pos, distance):
+        '''
+        Returns the index of the SVG path nearest to pos, if it's within
+        distance, or None.
+        '''
+        x, y = pos.x(), pos.y()
+        vertices = self._pathVertices
+        x1, y1 = vertices[:-1, 0], vertices[:-1, 1]
+        x2, y2 = vertices[1:, 0], vertices[1:, 1]
+        # Only measure the segments with bounds near pos. Segments with a
+        # NaN end, which join subpaths, always fail the test.
+        with numpy.errstate(invalid='ignore'):
+            near = numpy.flatnonzero(
+                        (numpy.minimum(x1, x2) <= x + distance) &
+                        (numpy.maximum(x1, x2) >= x - distance) &
+                        (numpy.minimum(y1, y2) <= y + distance) &
+                        (numpy.maximum(y1, y2) >= y - distance))
+        if not len(near):
+            return None
+        x1, y1, x2, y2 = x1[near], y1[near], x2[near], y2[near]
+        dx = x2 - x1
+        dy = y2 - y1
+        lengths = numpy.maximum(dx * dx + dy * dy, 1e-12)
+        t = numpy.clip(((x - x1) * dx + (y - y1) * dy) / lengths, 0., 1.)
+        distances = numpy.hypot(x1 + t * dx - x, y1 + t * dy - y)
+        nearest = distances.argmin()
+        if distances[nearest] > distance:
+            return None
+        return int(self._pathIndexes[near[nearest]])
+
+    def pickPath(self, pos, distance):
+        '''
+        Pick the SVG path nearest to pos, within distance, and return its
+        index, or None.
+        '''
+        index = self.pathAt(pos, distance)
+        self.setPickedPath(index)
+        return index
+
+    def setPickedPath(self, index):
+        '''
+        Highlight the SVG path with the given index, or none if it's None.
+        '''
+        self.pickedPath = index
+        path = QtGui.QPainterPath()
+        if index is not None:
+            vertices = self.pickedPathPositions(keepBreaks=True)
+            step = max(len(vertices) // MAX_HIGHLIGHT_VERTICES, 1)
+            shown = vertices[::step]
+            for subpath in numpy.split(shown, numpy.flatnonzero(
+                                                numpy.isnan(shown[:, 0]))):
+                subpath = subpath[~numpy.isnan(subpath[:, 0])]
+                if len(subpath):
+                    path.addPolygon(QtGui.QPolygonF(
+                        [QtCore.QPointF(x, y) for x, y in subpath.tolist()]))
+        self.pickedPathItem.setPath(path)
+        self.pathPicked.emit(-1 if index is None else index)
+
+    def pickedPathPositions(self, keepBreaks=False):
+        '''
+        Returns an Nx2 array of the vertices of the picked SVG path, in
+        scene coordinates. Unless keepBreaks is True, the NaN rows between
+        subpaths are dropped.
+        '''
+        if self.pickedPath is None:
+            return numpy.empty((0, 2))
+        path = self.svgPaths[self.pickedPath]
+        vertices = self.imageSource.mapToImage(path.vertices)
+        if not keepBreaks:
+            vertices = dropMissing(vertices)
+        return vertices
+
+    def addPickedPathPoints(self):
+        '''
+        Add data points at the vertices of the picked SVG path, and return
+        an array of their ids.
+        '''
+        return self.addDataPoints(self.pickedPathPositions())
+
+    def viewScale(self, event):
+        '''
+        Returns the scale of the view a mouse event came from, in screen
+        pixels per scene unit.
+        '''
+        if event.widget() is not None:
+            view = event.widget().parent()
+            if isinstance(view, QtGui.QGraphicsView):
+                return view.transform().m11()
+        return 1.
+
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
-            # First, try to dispatch the event to any other items that might
-            # want to accept it for movement purposes.
-            super(PlotScene, self).mousePressEvent(event)
-            if event.isAccepted():
+            if self._dragItem is not None:
+                # This is the event dispatched below for the drag item
+                super(PlotScene, self).mousePressEvent(event)
                 return
-            # The event wasn't accepted, so we should add a data point,
-            # then dispatch a new event, so that it gets grabbed.
-            dataPointItem = MovableCursorItem(event.scenePos(),
-                                              style='CircleCross')
-            dataPointItem.setPen(QtGui.QPen(Qt.darkGreen, 1., Qt.SolidLine))
-            dataPointItem.setZValue(3.)
-            self.addDataPointItem(dataPointItem)
+            pos = event.scenePos()
+            if self.pathPicking:
+                self.pickPath(pos, PATH_PICK_DISTANCE / self.viewScale(event))
+                event.accept()
+                return
+            # Shift starts a rubber band, and control starts a lasso
+            if event.modifiers() & (Qt.ShiftModifier | Qt.ControlModifier):
+                self._bandOrigin = pos
+                if event.modifiers() & Qt.ControlModifier:
+                    self._lassoPoints = [pos]
+                self.updateSelectionBand(pos)
+                event.accept()
+                return
+            # Data points are drawn on top, so check for them first
+            pointId = self.dataPointAt(pos)
+            selection = self.dataPointsItem.selection()
+            if (pointId is not None and len(selection) > 1 and
+                    pointId in selection):
+                self._selectionDragOrigin = pos
+                event.accept()
+                return
+            if len(selection):
+                self.clearPointSelection()
+            if pointId is None:
+                # Next, try to dispatch the event to any other items that
+                # might want to accept it for movement purposes.
+                super(PlotScene, self).mousePressEvent(event)
+                if event.isAccepted():
+                    return
+                # The event wasn't accepted, so we should add a data point
+                pos = self.snapPosition(pos)
+                pointId = self.addDataPoint(pos.x(), pos.y())
+            # Stand in a movable item for the point, then dispatch a new
+            # event, so that it gets grabbed.
+            self.beginDataPointDrag(pointId)
             event.ignore()
             e = QtGui.QGraphicsSceneMouseEvent(event.GraphicsSceneMousePress)
             e.setScenePos(event.scenePos())
@@ -228,50 +941,317 @@ class PlotScene(QtGui.QGraphicsScene):
             e.setModifiers(event.modifiers())
             self.event(e)
         elif event.button() == Qt.RightButton:
-            # First, check if the right click was on a dataPointItem.
-            # If it was, remove that item and accept the event.
-            item = self.itemAt(event.scenePos())
-            if item in self.dataPointItems:
-                self.removeDataPointItem(item)
+            # First, check if the right click was on a data point.
+            # If it was, remove that point and accept the event.
+            pointId = self.dataPointAt(event.scenePos())
+            if pointId is not None:
+                self.removeDataPoint(pointId)
                 event.accept()
             # Otherwise, dispatch the event.
             super(PlotScene, self).mousePressEvent(event)
         else:
             super(PlotScene, self).mousePressEvent(event)
 
-    def addDataPointItem(self, item):
+    def mouseMoveEvent(self, event):
+        pos = event.scenePos()
+        if self._bandOrigin is not None:
+            if self._lassoPoints is not None:
+                # Skip vertices closer than a couple of screen pixels
+                last = self._lassoPoints[-1]
+                if (max(abs(pos.x() - last.x()), abs(pos.y() - last.y())) *
+                        self.viewScale(event) >= 2.):
+                    self._lassoPoints.append(pos)
+            self.updateSelectionBand(pos)
+            event.accept()
+        elif self._selectionDragOrigin is not None:
+            offset = pos - self._selectionDragOrigin
+            self.dataPointsItem.setSelectionOffset(offset.x(), offset.y())
+            event.accept()
+        else:
+            super(PlotScene, self).mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton and self._bandOrigin is not None:
+            self.finishSelectionBand(event.scenePos(), event.modifiers())
+            event.accept()
+            return
+        if (event.button() == Qt.LeftButton and
+                self._selectionDragOrigin is not None):
+            offset = event.scenePos() - self._selectionDragOrigin
+            self._selectionDragOrigin = None
+            self.moveSelectedPoints(offset.x(), offset.y())
+            event.accept()
+            return
+        super(PlotScene, self).mouseReleaseEvent(event)
+        if event.button() == Qt.LeftButton and self._dragItem is not None:
+            self.endDataPointDrag()
+
+    def updateSelectionBand(self, pos):
+        '''
+        Show the rubber band from its origin to pos, or the lasso so far.
+        '''
+        path = QtGui.QPainterPath()
+        if self._lassoPoints is not None:
+            path.addPolygon(QtGui.QPolygonF(self._lassoPoints + [pos]))
+            path.closeSubpath()
+        else:
+            path.addRect(QtCore.QRectF(self._bandOrigin, pos).normalized())
+        self.selectionBandItem.setPath(path)
+
+    def finishSelectionBand(self, pos, modifiers=Qt.NoModifier):
+        '''
+        Select the data points in the rubber band or lasso, and remove it.
+        With alt held, the points are added to the selection.
+        '''
+        if self._lassoPoints is not None:
+            polygon = numpy.array([(p.x(), p.y())
+                                   for p in self._lassoPoints + [pos]])
+            ids = self.dataPoints.inPolygon(polygon)
+        else:
+            rect = QtCore.QRectF(self._bandOrigin, pos).normalized()
+            ids = self.dataPoints.inRect(rect.left(), rect.top(),
+                                         rect.right(), rect.bottom())
+        self._bandOrigin = None
+        self._lassoPoints = None
+        self.selectionBandItem.setPath(QtGui.QPainterPath())
+        if modifiers & Qt.AltModifier:
+            ids = numpy.union1d(self.dataPointsItem.selection(), ids)
+        self.setSelectedPoints(ids)
+
+    def selectedPoints(self):
+        '''
+        Returns a sorted array of the ids of the selected data points.
+        '''
+        return self.dataPointsItem.selection()
+
+    def setSelectedPoints(self, ids):
+        '''
+        Select the data points with the given ids.
         '''
-        Add a data point item.
+        self.dataPointsItem.setSelection(ids)
+        self.pointSelectionChanged.emit()
+
+    def clearPointSelection(self):
+        self.setSelectedPoints(numpy.empty(0, dtype=numpy.int64))
+
+    def selectAllPoints(self):
+        self.setSelectedPoints(self.dataPoints.ids())
+
+    def deleteSelectedPoints(self):
+        '''
+        Remove the selected data points, and return the number removed.
+        '''
+        ids = self.selectedPoints()
+        if len(ids):
+            self.removeDataPoints(ids)
+            self.pointSelectionChanged.emit()
+        return len(ids)
+
+    def moveSelectedPoints(self, dx, dy):
+        '''
+        Move the selected data points by (dx, dy), as one change.
+        '''
+        self.dataPointsItem.setSelectionOffset(0., 0.)
+        ids = self.selectedPoints()
+        if not len(ids) or (dx == 0. and dy == 0.):
+            return
+        positions = self.dataPoints.positions()[self.dataPoints.rowsOf(ids)]
+        self.dataPoints.moveMany(ids, positions + (dx, dy))
+        self.dataPointsItem.pointsChanged()
+        self.pointsMoved.emit(ids)
+
+    def setSelectedPointsPen(self, pen):
         '''
-        self.dataPointItems.append(item)
+        Draw the selected data points with pen from now on. Pass None to
+        draw them with the default pen again.
+        '''
+        self.dataPointsItem.setPointsPen(self.selectedPoints(), pen)
+
+    def createDataPointItem(self, pos):
+        '''
+        Create a data point item at the given position.
+        '''
+        dataPointItem = MovableCursorItem(pos, size=self.dataPointSize,
+                                          style='CircleCross')
+        dataPointItem.setPen(QtGui.QPen(Qt.darkGreen, 1., Qt.SolidLine))
+        dataPointItem.setZValue(3.)
+        return dataPointItem
+
+    def beginDataPointDrag(self, pointId):
+        '''
+        Replace a data point with a movable item until endDataPointDrag.
+        '''
+        x, y = self.dataPoints.position(pointId)
+        item = self.createDataPointItem(QtCore.QPointF(x, y))
+        item.pointId = pointId
+        item.snapFunction = self.snapPosition
+        item.posChanged.connect(self._dragItemMoved)
         self.addItem(item)
+        self.dataPointsItem.hidePoint(pointId)
+        self._dragItem = item
 
-    def removeDataPointItem(self, item):
+    def endDataPointDrag(self):
         '''
-        Remove a data point item.
+        Replace the movable item with its data point.
         '''
-        self.dataPointItems.remove(item)
+        item = self._dragItem
+        self._dragItem = None
         self.removeItem(item)
+        self.dataPointsItem.showPoint(item.pointId)
+
+    @QtCore.Slot(QtCore.QPointF)
+    def _dragItemMoved(self, pos):
+        if self._dragItem is not None:
+            pointId = self._dragItem.pointId
+            self.dataPoints.move(pointId, pos.x(), pos.y())
+            self.pointsMoved.emit(numpy.array([pointId]))
+
+    def dataPointAt(self, pos):
+        '''
+        Returns the id of the data point under pos, or None.
+        '''
+        return self.dataPoints.nearest(pos.x(), pos.y(),
+                                       self.dataPointSize / 2. + 1.)
+
+    def addDataPoint(self, x, y):
+        '''
+        Add a data point, and return its id.
+        '''
+        pointId = self.dataPoints.add(x, y)
+        self.dataPointsItem.includePoints([(x, y)])
+        self.pointsAdded.emit(1)
+        return pointId
 
-    def clearDataPointItems(self):
+    def addDataPoints(self, positions):
         '''
-        Clears the data point items.
+        Add data points at each of the positions in an Nx2 array, and return
+        an array of their ids.
         '''
-        for item in self.dataPointItems:
-            self.removeItem(item)
-        self.dataPointItems = []
+        ids = self.dataPoints.addMany(positions)
+        self.dataPointsItem.pointsChanged()
+        if len(ids):
+            self.pointsAdded.emit(len(ids))
+        return ids
+
+    def removeDataPoint(self, pointId):
+        '''
+        Remove a data point.
+        '''
+        row = self.dataPoints.row(pointId)
+        self.dataPointsItem.updatePoint(pointId)
+        self.dataPoints.remove(pointId)
+        self.dataPointsItem.forgetPoints([pointId])
+        self.pointRemoved.emit(row)
+
+    def removeDataPoints(self, ids):
+        '''
+        Remove the data points with the given ids. The remaining points keep
+        their order.
+        '''
+        ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        if not len(ids):
+            return
+        # The rows are gone from the store once the points are removed
+        rows = numpy.sort(self.dataPoints.rowsOf(ids))
+        self.dataPoints.removeMany(ids)
+        self.dataPointsItem.forgetPoints(ids)
+        self.dataPointsItem.pointsChanged()
+        self.pointsRemoved.emit(rows)
+
+    def refineDataPoints(self, radius=REFINE_RADIUS):
+        '''
+        Move every data point to the centroid of the ink within radius pixels
+        of it, and return the number of points.
+        '''
+        pixels = self.pixelArray()
+        if pixels is None or not len(self.dataPoints):
+            return 0
+        ids = self.dataPoints.ids().copy()
+        positions = refinePositions(pixels, self.dataPoints.positions(),
+                                    radius, RGB_CHANNELS)
+        self.dataPoints.moveMany(ids, positions)
+        self.dataPointsItem.pointsChanged()
+        self.pointsMoved.emit(ids)
+        return len(ids)
+
+    def clearDataPoints(self):
+        '''
+        Clears the data points.
+        '''
+        self.dataPointsItem.forgetPoints(self.dataPoints.ids())
+        self.dataPoints.clear()
+        self.dataPointsItem.pointsChanged()
+        self.pointsReset.emit()
+
+    def getPositions(self):
+        '''
+        Returns an Nx2 array of the data point positions in scene coordinates
+        '''
+        return self.dataPoints.positions().copy()
 
     def getData(self):
         '''
-        Returns a list of (x, y) data tuples (mapped from position)
+        Returns an Nx2 array of (x, y) data (mapped from position)
         '''
-        return [self.mapToData(item.x(), item.y())
-                for item in self.dataPointItems]
+        return self.mapToDataArray(self.getPositions())
+
+    def mapToDataArray(self, points):
+        '''
+        Map an Nx2 array of positions to an Nx2 array of data
+        '''
+        self.flushCalibration()
+        return mapArray(self.dataMatrix, points, self._xLog, self._yLog)
+
+    def cachedExtraction(self, key, extract):
+        '''
+        Returns the Nx2 array of positions cached for key, or calls extract
+        to compute and cache it. The array is read only, since it's shared.
+        '''
+        positions = self._extractionCache.get(key)
+        if positions is None:
+            positions = extract()
+            positions.flags.writeable = False
+            self._extractionCache.put(key, positions, positions.nbytes)
+        return positions
+
+    def extractTrace(self, color, tolerance):
+        '''
+        Returns an Nx2 array of positions tracing the image pixels within
+        tolerance of color, an (r, g, b) tuple, with one point per image
+        column.
+        '''
+        image = self.plotImage()
+        if image is None:
+            return numpy.empty((0, 2))
+
+        def extract():
+            trace = columnTrace(iterImageBands(image), image.width(),
+                                color, tolerance, RGB_CHANNELS)
+            return dropMissing(trace)
+        return self.cachedExtraction(('trace', tuple(color), tolerance),
+                                     extract)
+
+    def extractMarkers(self, color, tolerance, maxSize=MAX_MARKER_SIZE):
+        '''
+        Returns an Nx2 array of the centroid positions of the markers made of
+        image pixels within tolerance of color, an (r, g, b) tuple, and no
+        more than maxSize pixels across.
+        '''
+        pixels = self.pixelArray()
+        if pixels is None:
+            return numpy.empty((0, 2))
+
+        def extract():
+            mask = colorMask(pixels, color, tolerance, RGB_CHANNELS)
+            return detectMarkers(mask, maxSize=maxSize)
+        return self.cachedExtraction(('markers', tuple(color), tolerance,
+                                      maxSize), extract)
 
     def mapToData(self, x, y):
         '''
         Map position to data
         '''
+        self.flushCalibration()
         newx, newy = self.dataTransform.map(x, y)
         if self._xLog:
             newx = exp(newx)
@@ -285,8 +1265,6 @@ if __name__ == '__main__':
     view = QtGui.QGraphicsView(plotScene)
     image = QtGui.QImage('test/test.png')
     plotScene.setPlotImage(image)
-    h = plotScene.pixmapItem.pixmap().height()
-    w = plotScene.pixmapItem.pixmap().width()
 
     view.show()
     view.raise_()
@@ -18,6 +18,9 @@
 #
 #############################################################################
 
+# std lib imports
+from collections import deque
+
 # third party imports
 from PySide import QtGui, QtCore
 from PySide.QtCore import Qt
@@ -38,13 +41,17 @@ class ZoomableGraphicsView(QtGui.QGraphicsView):
             zoomIn, ZoomOut, and actualSize slots
             Control + Mouse Wheel
             Pinch gesture
+        Frame timing
+            framePainted signal, and frameTimes of the recent frames
     '''
+    framePainted = QtCore.Signal(float)
     plotItem = None
     zoomLevels = [0.1, 0.125, 0.15, 0.2, 0.25,
                   0.3,   0.4,  0.5, 0.6,  0.8, 1.,
                  1.25,   1.5,   2., 2.5,   3.,
                    4.,    5.,   6.,  7.,   9.]
     numZoomLevels = len(zoomLevels)
+    numFrameTimes = 100
 
     def __init__(self, scene=None, parent=None):
         if scene is None:
@@ -52,6 +59,9 @@ class ZoomableGraphicsView(QtGui.QGraphicsView):
         else:
             super(ZoomableGraphicsView, self).__init__(scene, parent)
 
+        # Paint times of the recent frames, in ms
+        self.frameTimes = deque(maxlen=self.numFrameTimes)
+
         # Enable pinch to zoom
         self.grabGesture(Qt.PinchGesture)
 
@@ -84,6 +94,14 @@ class ZoomableGraphicsView(QtGui.QGraphicsView):
         viewport_center = (newTargetViewportPos - deltaViewportPos)
         self.centerOn(self.mapToScene(viewport_center.toPoint()))
 
+    def paintEvent(self, event):
+        timer = QtCore.QElapsedTimer()
+        timer.start()
+        super(ZoomableGraphicsView, self).paintEvent(event)
+        frameTime = timer.nsecsElapsed() / 1e6
+        self.frameTimes.append(frameTime)
+        self.framePainted.emit(frameTime)
+
     def event(self, event):
         if event.type() == event.Gesture:
             # Dispatch gesture events
@@ -130,30 +148,83 @@ class ZoomableGraphicsView(QtGui.QGraphicsView):
 class PlotView(ZoomableGraphicsView):
     '''
     A subclass of ZoomableGraphicsView that creates and updates a statusBar
-    widget with the PlotScene's data coordinates.
+    widget with the PlotScene's data coordinates, and optionally another
+    with the frame times.
     '''
     dataCoordLabel = None
+    frameTimeLabel = None
 
     def __init__(self, scene=None, parent=None):
         super(PlotView, self).__init__(scene, parent)
+        self._mouseScenePos = None
         self.dataCoordLabel = QtGui.QLabel('No position')
+        self.frameTimeLabel = QtGui.QLabel()
+        self.frameTimeLabel.hide()
 #         self.parent().statusBar().addWidget(self.dataCoordLabel)
+        self.parent().statusBar().addPermanentWidget(self.frameTimeLabel)
         self.parent().statusBar().addPermanentWidget(self.dataCoordLabel)
+        if scene is not None:
+            scene.calibrationChanged.connect(self.updateDataCoordLabel)
+
+    def setPlotScene(self, scene):
+        '''
+        Show another PlotScene, e.g. of another document.
+        '''
+        if self.scene() is not None:
+            self.scene().calibrationChanged.disconnect(
+                                                self.updateDataCoordLabel)
+        self.setScene(scene)
+        scene.calibrationChanged.connect(self.updateDataCoordLabel)
+        self.updateDataCoordLabel()
+
+    @QtCore.Slot(bool)
+    def setShowFrameTimes(self, show):
+        if show:
+            self.framePainted.connect(self.updateFrameTimeLabel)
+            self.resetFrameTimes()
+            self.frameTimeLabel.show()
+        else:
+            self.framePainted.disconnect(self.updateFrameTimeLabel)
+            self.frameTimeLabel.hide()
+
+    def resetFrameTimes(self):
+        '''
+        Forget the recent frame times, e.g. to compare the frame times
+        before and after a change of drawing settings.
+        '''
+        self.frameTimes.clear()
+        self.frameTimeLabel.setText('No frames')
+
+    @QtCore.Slot(float)
+    def updateFrameTimeLabel(self, frameTime):
+        mean = sum(self.frameTimes) / len(self.frameTimes)
+        self.frameTimeLabel.setText(
+                'frame={:.1f} ms, mean={:.1f} ms, max={:.1f} ms'.format(
+                                frameTime, mean, max(self.frameTimes)))
+
+    @QtCore.Slot()
+    def updateDataCoordLabel(self):
+        '''
+        Show the data coordinates under the mouse, which change when the
+        mouse moves or the calibration changes.
+        '''
+        if self._mouseScenePos is None:
+            return
+        xd, yd = self.scene().mapToData(self._mouseScenePos.x(),
+                                        self._mouseScenePos.y())
+        self.dataCoordLabel.setText('x={:.4g}, y={:.4g}'.format(xd, yd))
 
     def event(self, event):
         if event.type() == event.Leave:
+            self._mouseScenePos = None
             if self.dataCoordLabel is not None:
                 self.dataCoordLabel.setText('No position')
 #                 self.dataCoordLabel.hide()
         return super(PlotView, self).event(event)
 
     def mouseMoveEvent(self, event):
-        # Update dataCoordLabel
-        p = self.mapToScene(event.pos())
-        x = p.x()
-        y = p.y()
-        xd, yd = self.scene().mapToData(x, y)
-        self.dataCoordLabel.setText('x={:.4g}, y={:.4g}'.format(xd, yd))
+        self._mouseScenePos = self.mapToScene(event.pos())
+        self.updateDataCoordLabel()
 
         # Then use QGraphicsView's event handler
         super(PlotView, self).mouseMoveEvent(event)
@@ -0,0 +1,381 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from math import floor, ceil
+
+# third party imports
+import numpy
+
+DEFAULT_CELL_SIZE = 16.
+
+
+def pointsInPolygon(points, polygon):
+    '''
+    Returns a boolean array of whether each of an Nx2 array of points is
+    inside a polygon, given as an Mx2 array of its vertices, by the even-odd
+    rule.
+    '''
+    x = points[:, 0]
+    y = points[:, 1]
+    inside = numpy.zeros(len(points), dtype=bool)
+    # With the points sorted by y, each edge only visits the points in the
+    # rows it spans.
+    order = numpy.argsort(y, kind='mergesort')
+    sortedY = y[order]
+    x1, y1 = polygon[-1]
+    for x2, y2 in polygon.tolist():
+        lo, hi = numpy.searchsorted(sortedY, sorted((y1, y2)))
+        if lo < hi:
+            # Flip the points left of where the edge crosses their row
+            crosses = order[lo:hi]
+            edgeX = x1 + (y[crosses] - y1) * (x2 - x1) / (y2 - y1)
+            inside[crosses[x[crosses] < edgeX]] ^= True
+        x1, y1 = x2, y2
+    return inside
+
+
+class PointStore(object):
+    '''
+    Stores point positions in a contiguous Nx2 array, with O(1) insertion,
+    deletion and lookup by id, and a uniform grid index for nearest point
+    and rectangle queries.
+
+    Points are identified by integer ids, which stay valid until the point
+    is removed. Removing a point moves the last point into its row, so the
+    row order of positions() is not stable.
+
+    The ids of added, moved and removed points are recorded until
+    takeChanges() is called, so that changes can be saved incrementally.
+    '''
+
+    def __init__(self, cellSize=DEFAULT_CELL_SIZE):
+        self._cellSize = float(cellSize)
+        self._nextId = 0
+        self._allocate(16)
+        self._changed = set()
+        self._cleared = False
+
+    def _allocate(self, capacity):
+        self._positions = numpy.empty((capacity, 2))
+        self._ids = numpy.empty(capacity, dtype=numpy.int64)
+        self._count = 0
+        self._rows = {}  # id -> row
+        self._cells = {}  # (column, row) -> set of ids
+
+    def _reserve(self, count):
+        capacity = len(self._ids)
+        if count <= capacity:
+            return
+        while capacity < count:
+            capacity *= 2
+        positions = numpy.empty((capacity, 2))
+        positions[:self._count] = self._positions[:self._count]
+        ids = numpy.empty(capacity, dtype=numpy.int64)
+        ids[:self._count] = self._ids[:self._count]
+        self._positions = positions
+        self._ids = ids
+
+    def _cell(self, x, y):
+        return (int(floor(x / self._cellSize)),
+                int(floor(y / self._cellSize)))
+
+    def _index(self, pointId, x, y):
+        cell = self._cell(x, y)
+        ids = self._cells.get(cell)
+        if ids is None:
+            self._cells[cell] = ids = set()
+        ids.add(pointId)
+
+    def _unindex(self, pointId, x, y):
+        cell = self._cell(x, y)
+        ids = self._cells[cell]
+        ids.discard(pointId)
+        if not ids:
+            del self._cells[cell]
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, pointId):
+        return pointId in self._rows
+
+    def positions(self):
+        '''
+        Returns an Nx2 view of the point positions. The view is only valid
+        until the store is next modified.
+        '''
+        return self._positions[:self._count]
+
+    def ids(self):
+        '''
+        Returns a view of the point ids, in the same order as positions().
+        The view is only valid until the store is next modified.
+        '''
+        return self._ids[:self._count]
+
+    def row(self, pointId):
+        '''
+        Returns the row of a point in positions()
+        '''
+        return self._rows[pointId]
+
+    def rowsOf(self, ids):
+        '''
+        Returns an array of the rows in positions() of each of the ids
+        '''
+        rows = self._rows
+        return numpy.fromiter((rows[pointId] for pointId in ids),
+                              dtype=numpy.int64, count=len(ids))
+
+    def position(self, pointId):
+        '''
+        Returns the (x, y) position of a point
+        '''
+        x, y = self._positions[self._rows[pointId]]
+        return x, y
+
+    def add(self, x, y):
+        '''
+        Add a point, and return its id
+        '''
+        pointId = self._nextId
+        self._nextId += 1
+        self._reserve(self._count + 1)
+        row = self._count
+        self._positions[row] = x, y
+        self._ids[row] = pointId
+        self._rows[pointId] = row
+        self._count += 1
+        self._index(pointId, x, y)
+        self._changed.add(pointId)
+        return pointId
+
+    def addMany(self, positions):
+        '''
+        Add an Nx2 array of points, and return an array of their ids
+        '''
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+        n = len(positions)
+        start = self._count
+        ids = numpy.arange(self._nextId, self._nextId + n, dtype=numpy.int64)
+        self._nextId += n
+        self._reserve(start + n)
+        self._positions[start:start + n] = positions
+        self._ids[start:start + n] = ids
+        self._count += n
+        self._rows.update(zip(ids.tolist(), xrange(start, start + n)))
+        cells = numpy.floor(positions / self._cellSize).astype(numpy.int64)
+        for pointId, column, row in zip(ids.tolist(), cells[:, 0].tolist(),
+                                        cells[:, 1].tolist()):
+            cellIds = self._cells.get((column, row))
+            if cellIds is None:
+                self._cells[(column, row)] = cellIds = set()
+            cellIds.add(pointId)
+        self._changed.update(ids.tolist())
+        return ids
+
+    def move(self, pointId, x, y):
+        '''
+        Move a point to (x, y)
+        '''
+        row = self._rows[pointId]
+        oldX, oldY = self._positions[row]
+        if self._cell(oldX, oldY) != self._cell(x, y):
+            self._unindex(pointId, oldX, oldY)
+            self._index(pointId, x, y)
+        self._positions[row] = x, y
+        self._changed.add(pointId)
+
+    def moveMany(self, ids, positions):
+        '''
+        Move each of the points in an array of ids to the corresponding row
+        of an Nx2 array of positions
+        '''
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        positions = numpy.asarray(positions, dtype=float).reshape(-1, 2)
+        rows = self.rowsOf(ids)
+        oldCells = numpy.floor(self._positions[rows] /
+                               self._cellSize).astype(numpy.int64)
+        newCells = numpy.floor(positions / self._cellSize).astype(numpy.int64)
+        self._positions[rows] = positions
+        # Only reindex the points that changed cells
+        moved = numpy.flatnonzero((oldCells != newCells).any(axis=1))
+        for i in moved.tolist():
+            pointId = int(ids[i])
+            oldCell = tuple(oldCells[i].tolist())
+            cellIds = self._cells[oldCell]
+            cellIds.discard(pointId)
+            if not cellIds:
+                del self._cells[oldCell]
+            newCell = tuple(newCells[i].tolist())
+            cellIds = self._cells.get(newCell)
+            if cellIds is None:
+                self._cells[newCell] = cellIds = set()
+            cellIds.add(pointId)
+        self._changed.update(ids.tolist())
+
+    def remove(self, pointId):
+        '''
+        Remove a point
+        '''
+        row = self._rows.pop(pointId)
+        x, y = self._positions[row]
+        self._unindex(pointId, x, y)
+        last = self._count - 1
+        if row != last:
+            # Fill the gap with the last point
+            lastId = int(self._ids[last])
+            self._positions[row] = self._positions[last]
+            self._ids[row] = lastId
+            self._rows[lastId] = row
+        self._count = last
+        self._changed.add(pointId)
+
+    def removeMany(self, ids):
+        '''
+        Remove each of the points in ids. The remaining points keep their
+        order.
+        '''
+        ids = numpy.unique(numpy.asarray(ids, dtype=numpy.int64))
+        if not len(ids):
+            return
+        rows = self.rowsOf(ids)
+        # Unindex the points one cell at a time
+        cells = numpy.floor(self._positions[rows] /
+                            self._cellSize).astype(numpy.int64)
+        order = numpy.lexsort((cells[:, 1], cells[:, 0]))
+        cells = cells[order]
+        starts = numpy.flatnonzero(numpy.concatenate(
+                    ([True], (cells[1:] != cells[:-1]).any(axis=1))))
+        stops = numpy.append(starts[1:], len(cells))
+        for start, stop in zip(starts.tolist(), stops.tolist()):
+            cell = tuple(cells[start].tolist())
+            cellIds = self._cells[cell]
+            cellIds.difference_update(ids[order[start:stop]].tolist())
+            if not cellIds:
+                del self._cells[cell]
+        for pointId in ids.tolist():
+            del self._rows[pointId]
+        keep = numpy.ones(self._count, dtype=bool)
+        keep[rows] = False
+        kept = numpy.flatnonzero(keep)
+        n = len(kept)
+        self._positions[:n] = self._positions[kept]
+        self._ids[:n] = self._ids[kept]
+        self._count = n
+        # Only the rows after the first removed one have moved
+        first = int(rows.min())
+        self._rows.update(zip(self._ids[first:n].tolist(), xrange(first, n)))
+        self._changed.update(ids.tolist())
+
+    def clear(self):
+        '''
+        Remove all points
+        '''
+        self._allocate(16)
+        self._changed = set()
+        self._cleared = True
+
+    def hasChanges(self):
+        return self._cleared or bool(self._changed)
+
+    def takeChanges(self):
+        '''
+        Returns a (cleared, ids) tuple of whether the store was cleared, and
+        the set of ids added, moved or removed since the last call (or since
+        it was cleared), and starts recording again.
+        '''
+        changes = self._cleared, self._changed
+        self._changed = set()
+        self._cleared = False
+        return changes
+
+    def nearest(self, x, y, maxDistance):
+        '''
+        Returns the id of the nearest point within maxDistance of (x, y),
+        or None if there isn't one.
+        '''
+        r = int(ceil(maxDistance / self._cellSize))
+        column, row = self._cell(x, y)
+        candidates = []
+        for i in xrange(column - r, column + r + 1):
+            for j in xrange(row - r, row + r + 1):
+                ids = self._cells.get((i, j))
+                if ids:
+                    candidates.extend(ids)
+        if not candidates:
+            return None
+        delta = self._positions[self.rowsOf(candidates)] - (x, y)
+        distances = numpy.hypot(delta[:, 0], delta[:, 1])
+        i = distances.argmin()
+        if distances[i] > maxDistance:
+            return None
+        return candidates[i]
+
+    def _candidates(self, left, top, right, bottom):
+        '''
+        Returns the ids and an Nx2 array of the positions of the points in
+        the grid cells that overlap the rectangle, or of all the points if
+        that's cheaper than scanning the cells.
+        '''
+        column0, row0 = self._cell(left, top)
+        column1, row1 = self._cell(right, bottom)
+        ncells = (column1 - column0 + 1) * (row1 - row0 + 1)
+        if ncells > len(self._cells):
+            # Scanning every point is cheaper than scanning the cells
+            return self.ids(), self.positions()
+        candidates = []
+        for i in xrange(column0, column1 + 1):
+            for j in xrange(row0, row1 + 1):
+                ids = self._cells.get((i, j))
+                if ids:
+                    candidates.extend(ids)
+        candidates = numpy.array(candidates, dtype=numpy.int64)
+        if not len(candidates):
+            return candidates, numpy.empty((0, 2))
+        return candidates, self._positions[self.rowsOf(candidates.tolist())]
+
+    def inPolygon(self, polygon):
+        '''
+        Returns an array of the ids of the points inside a polygon, given as
+        an Nx2 array of its vertices. Only the points in the grid cells that
+        overlap the polygon's bounding box are tested.
+        '''
+        polygon = numpy.asarray(polygon, dtype=float).reshape(-1, 2)
+        if len(polygon) < 3:
+            return numpy.empty(0, dtype=numpy.int64)
+        left, top = polygon.min(axis=0)
+        right, bottom = polygon.max(axis=0)
+        ids, positions = self._candidates(left, top, right, bottom)
+        if not len(ids):
+            return numpy.empty(0, dtype=numpy.int64)
+        return ids[pointsInPolygon(positions, polygon)]
+
+    def inRect(self, left, top, right, bottom):
+        '''
+        Returns an array of the ids of the points inside the rectangle.
+        '''
+        ids, positions = self._candidates(left, top, right, bottom)
+        inside = ((positions[:, 0] >= left) &
+                  (positions[:, 0] <= right) &
+                  (positions[:, 1] >= top) &
+                  (positions[:, 1] <= bottom))
+        return ids[inside]
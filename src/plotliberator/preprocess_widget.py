@@ -0,0 +1,123 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+from PySide import QtGui, QtCore
+
+# local imports
+from plotliberator.preprocessing import STAGES
+
+
+class PreprocessWidget(QtGui.QWidget):
+    '''
+    Controls for enabling and configuring the preprocessing stages, and for
+    choosing which stage's output to show. Emits changed() when any of them
+    change.
+    '''
+    changed = QtCore.Signal()
+
+    def __init__(self, parent=None):
+        super(PreprocessWidget, self).__init__(parent)
+
+        self.deskewCheckBox = QtGui.QCheckBox(STAGES['deskew'][0])
+        self.maxAngleSpinBox = QtGui.QDoubleSpinBox()
+        self.maxAngleSpinBox.setRange(0.5, 45.)
+        self.maxAngleSpinBox.setSingleStep(0.5)
+        self.maxAngleSpinBox.setValue(5.)
+        self.maxAngleSpinBox.setSuffix(u'\u00b0')
+        self.maxAngleSpinBox.setToolTip('Largest rotation to correct')
+
+        self.denoiseCheckBox = QtGui.QCheckBox(STAGES['denoise'][0])
+        self.medianSizeSpinBox = QtGui.QSpinBox()
+        self.medianSizeSpinBox.setRange(3, 9)
+        self.medianSizeSpinBox.setSingleStep(2)
+        self.medianSizeSpinBox.setSuffix(' px')
+        self.medianSizeSpinBox.setToolTip('Median window size')
+
+        self.gridlinesCheckBox = QtGui.QCheckBox(STAGES['gridlines'][0])
+        self.lineFractionSpinBox = QtGui.QDoubleSpinBox()
+        self.lineFractionSpinBox.setRange(0.05, 1.)
+        self.lineFractionSpinBox.setSingleStep(0.05)
+        self.lineFractionSpinBox.setValue(0.5)
+        self.lineFractionSpinBox.setToolTip(
+                'Fraction of a row or column that must be ink for it to be a '
+                'gridline')
+
+        self.thresholdCheckBox = QtGui.QCheckBox(STAGES['threshold'][0])
+        self.levelSpinBox = QtGui.QSpinBox()
+        self.levelSpinBox.setRange(0, 255)
+        self.levelSpinBox.setSpecialValueText('Auto')
+        self.levelSpinBox.setToolTip('Gray level below which pixels are ink')
+
+        self.showComboBox = QtGui.QComboBox()
+        self.showComboBox.addItem('Original', None)
+        self.showComboBox.addItem('Grayscale', 'grayscale')
+        for name, (label, _function) in STAGES.iteritems():
+            self.showComboBox.addItem(label, name)
+
+        # Layout
+        grid = QtGui.QGridLayout()
+        grid.addWidget(self.deskewCheckBox, 0, 0)
+        grid.addWidget(self.maxAngleSpinBox, 0, 1)
+        grid.addWidget(self.denoiseCheckBox, 1, 0)
+        grid.addWidget(self.medianSizeSpinBox, 1, 1)
+        grid.addWidget(self.gridlinesCheckBox, 2, 0)
+        grid.addWidget(self.lineFractionSpinBox, 2, 1)
+        grid.addWidget(self.thresholdCheckBox, 3, 0)
+        grid.addWidget(self.levelSpinBox, 3, 1)
+        grid.addWidget(QtGui.QLabel('Show'), 4, 0)
+        grid.addWidget(self.showComboBox, 4, 1)
+        grid.setRowStretch(5, 1)
+        self.setLayout(grid)
+
+        # Connect signals and slots
+        for checkBox in (self.deskewCheckBox, self.denoiseCheckBox,
+                         self.gridlinesCheckBox, self.thresholdCheckBox):
+            checkBox.toggled.connect(self.changed)
+        self.maxAngleSpinBox.valueChanged.connect(self.changed)
+        self.medianSizeSpinBox.valueChanged.connect(self.changed)
+        self.lineFractionSpinBox.valueChanged.connect(self.changed)
+        self.levelSpinBox.valueChanged.connect(self.changed)
+        self.showComboBox.currentIndexChanged.connect(self.changed)
+
+    def parameters(self):
+        '''
+        Returns the keyword arguments of the enabled stages, by name.
+        '''
+        parameters = {}
+        if self.deskewCheckBox.isChecked():
+            parameters['deskew'] = dict(maxAngle=self.maxAngleSpinBox.value())
+        if self.denoiseCheckBox.isChecked():
+            # Median windows must have odd sizes
+            size = self.medianSizeSpinBox.value() | 1
+            parameters['denoise'] = dict(size=size)
+        if self.gridlinesCheckBox.isChecked():
+            parameters['gridlines'] = dict(
+                            lineFraction=self.lineFractionSpinBox.value())
+        if self.thresholdCheckBox.isChecked():
+            parameters['threshold'] = dict(level=self.levelSpinBox.value())
+        return parameters
+
+    def shownStage(self):
+        '''
+        Returns 'grayscale', the name of the stage to show, or None to show
+        the original image.
+        '''
+        return self.showComboBox.itemData(self.showComboBox.currentIndex())
@@ -0,0 +1,381 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from collections import OrderedDict
+from math import radians, tan, sin
+import hashlib
+import threading
+
+# third party imports
+import numpy
+from PySide import QtGui, QtCore
+
+# local imports
+from plotliberator.tiled_image import TileCache, DEFAULT_CACHE_BUDGET
+from plotliberator.image_array import toArgb32, bufferArray, RGB_CHANNELS
+
+# Rows processed at a time, to bound the size of temporary arrays
+BAND_HEIGHT = 256
+
+# Pixels darker than this are ink for deskewing and gridline removal
+INK_LEVEL = 200
+
+# Gridlines thicker than this are left alone
+MAX_GRIDLINE_WIDTH = 4
+
+
+def grayscale(pixels, channels=(0, 1, 2)):
+    '''
+    Returns a (height, width) uint8 array of the luma of an array of pixels
+    '''
+    height, width = pixels.shape[:2]
+    gray = numpy.empty((height, width), dtype=numpy.uint8)
+    r, g, b = channels
+    for y0 in xrange(0, height, BAND_HEIGHT):
+        band = pixels[y0:y0 + BAND_HEIGHT]
+        # Widen before multiplying, since a uint8 array times a small
+        # numpy scalar stays uint16 and wraps around
+        luma = (band[..., r].astype(numpy.uint32) * 299 +
+                band[..., g].astype(numpy.uint32) * 587 +
+                band[..., b].astype(numpy.uint32) * 114 + 500) // 1000
+        gray[y0:y0 + BAND_HEIGHT] = luma
+    return gray
+
+
+def _skewScore(rows, columns, angle):
+    '''
+    Shear the ink back by the angle, and measure how peaked its row profile
+    is.
+    '''
+    sheared = (rows - columns * tan(radians(angle)) + 0.5).astype(numpy.intp)
+    profile = numpy.bincount(sheared - sheared.min())
+    return numpy.dot(profile, profile)
+
+
+def estimateSkew(gray, maxAngle=5., step=0.1, maxPixels=1000000,
+                 maxInk=100000):
+    '''
+    Returns the angle in degrees, within maxAngle, at which the rows of ink
+    line up best. Rows that slope down to the right have positive angles.
+
+    The search is coarse to fine, on at most maxPixels of the image and
+    maxInk of its ink pixels.
+    '''
+    height, width = gray.shape
+    stride = max(int((height * width / float(maxPixels)) ** 0.5), 1)
+    rows, columns = numpy.nonzero(gray[::stride, ::stride] < INK_LEVEL)
+    if len(rows) < 2:
+        return 0.
+    if len(rows) > maxInk:
+        rows = rows[::len(rows) // maxInk + 1]
+        columns = columns[::len(columns) // maxInk + 1]
+    # Add enough rows that the sheared rows are never negative
+    rows = rows + int(width * tan(radians(maxAngle))) + 1
+    center = 0.
+    span = maxAngle
+    coarseStep = max(step, maxAngle / 10.)
+    while True:
+        angles = numpy.arange(center - span, center + span + coarseStep / 2.,
+                              coarseStep).clip(-maxAngle, maxAngle)
+        scores = [_skewScore(rows, columns, angle) for angle in angles]
+        center = float(angles[int(numpy.argmax(scores))])
+        if coarseStep <= step:
+            return center
+        span = coarseStep
+        coarseStep = max(coarseStep / 5., step)
+
+
+def _shearRows(gray, factor, fill):
+    '''
+    Returns the image with each row shifted right by factor times its
+    distance below the center, rounded to whole pixels.
+    '''
+    height, width = gray.shape
+    sheared = numpy.empty_like(gray)
+    center = height / 2.
+    for y in xrange(height):
+        shift = int(round(factor * (y + 0.5 - center)))
+        row = sheared[y]
+        if abs(shift) >= width:
+            row[:] = fill
+        elif shift >= 0:
+            row[:shift] = fill
+            row[shift:] = gray[y, :width - shift]
+        else:
+            row[shift:] = fill
+            row[:shift] = gray[y, -shift:]
+    return sheared
+
+
+def rotate(gray, angle, fill=255):
+    '''
+    Returns the image rotated by -angle degrees about its center, so that
+    rows sloping at angle become level.
+
+    The rotation is done as three shears, which only shift whole rows and
+    columns, instead of sampling every pixel through the rotation.
+    '''
+    a = -radians(angle)
+    sheared = _shearRows(gray, -tan(a / 2.), fill)
+    sheared = _shearRows(numpy.ascontiguousarray(sheared.T), sin(a), fill)
+    sheared = numpy.ascontiguousarray(sheared.T)
+    return _shearRows(sheared, -tan(a / 2.), fill)
+
+
+def deskew(gray, maxAngle=5.):
+    '''
+    Rotate the image so that its rows of ink are level
+    '''
+    angle = estimateSkew(gray, maxAngle)
+    if abs(angle) < 0.05:
+        return gray
+    return rotate(gray, angle)
+
+
+def _median3(a, b, c):
+    return numpy.maximum(numpy.minimum(a, b),
+                         numpy.minimum(numpy.maximum(a, b), c))
+
+
+def medianFilter(gray, size=3):
+    '''
+    Returns the median of the size x size window around each pixel, with
+    the edge pixels repeated.
+    '''
+    height, width = gray.shape
+    radius = size // 2
+    padded = numpy.pad(gray, radius, 'edge')
+    filtered = numpy.empty_like(gray)
+    for y0 in xrange(0, height, BAND_HEIGHT):
+        y1 = min(y0 + BAND_HEIGHT, height)
+        rows = [padded[y0 + i:y1 + i] for i in xrange(2 * radius + 1)]
+        if size == 3:
+            # Sort each column of three, then combine the neighboring
+            # columns: the median is the median of the largest low, the
+            # median middle, and the smallest high.
+            low = numpy.minimum(numpy.minimum(rows[0], rows[1]), rows[2])
+            high = numpy.maximum(numpy.maximum(rows[0], rows[1]), rows[2])
+            middle = _median3(*rows)
+            maxLow = numpy.maximum(numpy.maximum(low[:, :-2], low[:, 1:-1]),
+                                   low[:, 2:])
+            minHigh = numpy.minimum(numpy.minimum(high[:, :-2],
+                                                  high[:, 1:-1]), high[:, 2:])
+            midMiddle = _median3(middle[:, :-2], middle[:, 1:-1],
+                                 middle[:, 2:])
+            filtered[y0:y1] = _median3(maxLow, midMiddle, minHigh)
+        else:
+            window = numpy.stack([row[:, j:j + width] for row in rows
+                                  for j in xrange(2 * radius + 1)])
+            middle = len(window) // 2
+            filtered[y0:y1] = numpy.partition(window, middle, axis=0)[middle]
+    return filtered
+
+
+def _lineGroups(fill, lineFraction, maxWidth):
+    '''
+    Returns the (start, stop) ranges of thin lines in a fill profile
+    '''
+    strong = (fill >= lineFraction).astype(numpy.int8)
+    edges = numpy.diff(numpy.concatenate(([0], strong, [0])))
+    starts = numpy.flatnonzero(edges == 1)
+    stops = numpy.flatnonzero(edges == -1)
+    return [(start, stop) for start, stop in zip(starts, stops)
+            if stop - start <= maxWidth]
+
+
+def removeGridlines(gray, lineFraction=0.5, maxWidth=MAX_GRIDLINE_WIDTH):
+    '''
+    Paint over the thin rows and columns that are mostly ink.
+
+    Each line is replaced by the brighter of the pixels on either side of
+    it, so that curves crossing the line are kept while the line itself
+    becomes background.
+    '''
+    cleaned = gray.copy()
+    height, width = gray.shape
+    ink = gray < INK_LEVEL
+    for start, stop in _lineGroups(ink.mean(axis=1), lineFraction, maxWidth):
+        above = gray[max(start - 1, 0)]
+        below = gray[min(stop, height - 1)]
+        cleaned[start:stop] = numpy.maximum(above, below)
+    for start, stop in _lineGroups(ink.mean(axis=0), lineFraction, maxWidth):
+        left = cleaned[:, max(start - 1, 0)]
+        right = cleaned[:, min(stop, width - 1)]
+        cleaned[:, start:stop] = numpy.maximum(left, right)[:, None]
+    return cleaned
+
+
+def otsuLevel(gray):
+    '''
+    Returns the level that best separates the image into two classes
+    '''
+    counts = numpy.bincount(gray.ravel(), minlength=256).astype(numpy.float64)
+    levels = numpy.arange(256)
+    weight = counts.cumsum()
+    total = weight[-1]
+    mean = (counts * levels).cumsum()
+    between = numpy.zeros(256)
+    valid = (weight > 0) & (weight < total)
+    w0 = weight[valid]
+    m0 = mean[valid]
+    between[valid] = (mean[-1] * w0 - total * m0) ** 2 / (w0 * (total - w0))
+    # Pixels below the level are ink
+    return int(between.argmax()) + 1
+
+
+def threshold(gray, level=0):
+    '''
+    Returns an image that is black where gray is below level, and white
+    elsewhere. If level is 0, it's chosen with Otsu's method.
+    '''
+    if not level:
+        level = otsuLevel(gray)
+    return numpy.where(gray < level, 0, 255).astype(numpy.uint8)
+
+
+# The stages, in the order they're applied, as name: (label, function)
+STAGES = OrderedDict([
+    ('deskew', ('Deskew', deskew)),
+    ('denoise', ('Median Denoise', medianFilter)),
+    ('gridlines', ('Remove Gridlines', removeGridlines)),
+    ('threshold', ('Threshold', threshold)),
+])
+
+
+def imageHash(pixels):
+    '''
+    Returns a hex digest of the contents of an array of pixels
+    '''
+    return hashlib.sha1(numpy.ascontiguousarray(pixels)).hexdigest()
+
+
+class Pipeline(object):
+    '''
+    Applies the preprocessing stages to an image, caching the output of
+    each stage by the image hash and the parameters of it and every stage
+    before it. Changing a stage's parameters only recomputes the stages
+    from it on.
+    '''
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        self._cache = TileCache(budget)
+        self._lock = threading.Lock()
+
+    def cache(self):
+        return self._cache
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def run(self, pixels, parameters, channels=(0, 1, 2), imageHash=None,
+            isCanceled=None):
+        '''
+        Parameters
+        ----------
+        pixels : ndarray
+            (height, width, nchannels) uint8 array of image pixels
+        parameters : dict
+            keyword arguments of the enabled stages, by name. Stages that
+            aren't included are skipped.
+        channels : tuple
+            the indices of the r, g, and b channels in pixels
+        imageHash : str
+            identifies the image in the cache
+        isCanceled : callable or None
+            checked between stages. If it returns True, None is returned.
+
+        Returns an OrderedDict of the grayscale image, by the name
+        'grayscale', followed by the output of each stage, by name. Skipped
+        stages output their input.
+        '''
+        key = (imageHash,)
+        output = self._cached(key, lambda: grayscale(pixels, channels))
+        outputs = OrderedDict([('grayscale', output)])
+        for name, (_label, function) in STAGES.iteritems():
+            if isCanceled is not None and isCanceled():
+                return None
+            kwargs = parameters.get(name)
+            if kwargs is not None:
+                key += ((name, tuple(sorted(kwargs.iteritems()))),)
+                output = self._cached(key, lambda: function(output,
+                                                            **kwargs))
+            outputs[name] = output
+        return outputs
+
+    def _cached(self, key, compute):
+        with self._lock:
+            output = self._cache.get(key)
+        if output is None:
+            output = compute()
+            with self._lock:
+                self._cache.put(key, output, output.nbytes)
+        return output
+
+
+class PreprocessWorker(QtCore.QThread):
+    '''
+    Runs a Pipeline on a QImage or ImageSource in the background, and emits
+    ready(worker, imageHash, outputs) when it's done. An ImageSource is
+    decoded in the background too, and the decoded QImage is kept as
+    image(). If imageHash is None, it's computed from the image.
+    '''
+    ready = QtCore.Signal(object, object, object)
+
+    def __init__(self, pipeline, image, parameters, imageHash=None,
+                 parent=None):
+        super(PreprocessWorker, self).__init__(parent)
+        self._pipeline = pipeline
+        if isinstance(image, QtGui.QImage):
+            self._source = None
+            self._image = image
+        else:
+            self._source = image
+            self._image = None
+        self._parameters = parameters
+        self._imageHash = imageHash
+        self._canceled = False
+
+    def cancel(self):
+        self._canceled = True
+
+    def isCanceled(self):
+        return self._canceled
+
+    def image(self):
+        '''
+        Returns the QImage the pipeline runs on, or None if the source
+        hasn't been decoded yet.
+        '''
+        return self._image
+
+    def run(self):
+        if self._image is None:
+            self._image = self._source.image()
+        if self._canceled or self._image.isNull():
+            return
+        pixels = bufferArray(toArgb32(self._image))
+        if self._imageHash is None:
+            self._imageHash = imageHash(pixels)
+        outputs = self._pipeline.run(pixels, self._parameters, RGB_CHANNELS,
+                                     self._imageHash, self.isCanceled)
+        if outputs is not None and not self._canceled:
+            self.ready.emit(self, self._imageHash, outputs)
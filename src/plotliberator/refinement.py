@@ -0,0 +1,104 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+import numpy
+
+# Half the size of the window around each point, in pixels
+REFINE_RADIUS = 3
+
+
+def pointWindows(pixels, positions, radius=REFINE_RADIUS):
+    '''
+    Gather the square window of pixels around each point.
+
+    Returns (windows, left, top), where windows is an
+    (npoints, 2 * radius + 1, 2 * radius + 1, nchannels) array, and left and
+    top are arrays of the pixel column and row of each window's corner.
+    Windows that extend past the image edge repeat the edge pixels.
+    '''
+    height, width = pixels.shape[:2]
+    size = 2 * radius + 1
+    left = numpy.floor(positions[:, 0]).astype(numpy.intp) - radius
+    top = numpy.floor(positions[:, 1]).astype(numpy.intp) - radius
+    offsets = numpy.arange(size)
+    rows = (top[:, None] + offsets).clip(0, height - 1)
+    columns = (left[:, None] + offsets).clip(0, width - 1)
+    windows = pixels[rows[:, :, None], columns[:, None, :]]
+    return windows, left, top
+
+
+def inkWeights(windows, channels=(0, 1, 2), color=None, tolerance=0):
+    '''
+    Returns the centroid weight of each pixel in an array of windows.
+
+    By default, pixels are weighted by how much darker they are than the
+    brightest pixel in their window, so that the background doesn't pull on
+    the centroid. If color is given, pixels are weighted by how close they
+    are to it, and pixels further than tolerance have no weight.
+    '''
+    rgb = windows[..., list(channels)].astype(numpy.int32)
+    if color is not None:
+        difference = numpy.abs(rgb - numpy.asarray(color,
+                                                   numpy.int32)).max(axis=-1)
+        return (tolerance + 1 - difference).clip(0)
+    brightness = rgb.sum(axis=-1)
+    background = brightness.max(axis=2).max(axis=1)
+    return background[:, None, None] - brightness
+
+
+def refinePositions(pixels, positions, radius=REFINE_RADIUS,
+                    channels=(0, 1, 2), color=None, tolerance=0):
+    '''
+    Move each point to the weighted centroid of the pixels in a window
+    around it, all points at once.
+
+    Parameters
+    ----------
+    pixels : ndarray
+        (height, width, nchannels) uint8 array of image pixels
+    positions : ndarray
+        Nx2 array of (x, y) pixel coordinates
+    radius : int
+        half the size of the window around each point
+    channels : tuple
+        the indices of the r, g, and b channels in pixels
+    color, tolerance :
+        see `inkWeights`
+
+    Returns an Nx2 array of the refined positions. Points with nothing to
+    center on are left where they are.
+    '''
+    positions = numpy.asarray(positions, dtype=numpy.float64).reshape(-1, 2)
+    if not len(positions):
+        return positions.copy()
+    windows, left, top = pointWindows(pixels, positions, radius)
+    weights = inkWeights(windows, channels, color,
+                         tolerance).astype(numpy.float64)
+    total = weights.sum(axis=2).sum(axis=1)
+    # Pixel centers are at +0.5
+    centers = numpy.arange(2 * radius + 1) + 0.5
+    x = weights.sum(axis=1).dot(centers)
+    y = weights.sum(axis=2).dot(centers)
+    refined = positions.copy()
+    found = total > 0
+    refined[found, 0] = left[found] + x[found] / total[found]
+    refined[found, 1] = top[found] + y[found] / total[found]
+    return refined
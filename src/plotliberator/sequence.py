@@ -0,0 +1,350 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import sys
+import os.path
+import argparse
+import threading
+import time
+from Queue import Queue
+
+# third party imports
+import numpy
+from numpy.lib.format import open_memmap
+from PySide import QtCore
+
+# local imports
+
+# If being run as a script, make sure the plotliberator package is
+# is on the path
+if __name__ == '__main__':
+    try:
+        import plotliberator
+    except ImportError:
+        sys.path.append(
+            os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        import plotliberator
+from plotliberator.data_mapping import (calibrationTransform,
+                                        transformToArray, mapArray)
+from plotliberator.image_array import (iterImageBands, toArgb32,
+                                       bufferArray, RGB_CHANNELS)
+from plotliberator.extraction import columnTrace
+from plotliberator.tiled_image import openImageSource
+from plotliberator.refinement import refinePositions
+from plotliberator.batch import loadCalibration, expandPaths
+
+# Frames decoded ahead of extraction, and results waiting to be written
+QUEUE_DEPTH = 2
+
+# Ends the items put on a stage's queue
+_DONE = object()
+
+
+def calibrationMatrix(calibration):
+    '''
+    Returns the data transform of a calibration spec as a 3x3 array.
+    '''
+    transform = calibrationTransform(calibration['corners'],
+                                     calibration['x1'], calibration['x2'],
+                                     calibration['y1'], calibration['y2'],
+                                     calibration['xLog'], calibration['yLog'])
+    if transform is None:
+        raise ValueError('degenerate axis corners')
+    return transformToArray(transform)
+
+
+def frameData(image, calibration, matrix, refineRadius=0):
+    '''
+    Extract the calibrated data of a curve from one frame.
+
+    Returns a (width, 2) array of (x, y) data, with a row per image column,
+    so the frames of a sequence can be stacked. Rows are NaN for columns
+    without the curve.
+    '''
+    trace = columnTrace(iterImageBands(image), image.width(),
+                        calibration['color'], calibration['tolerance'],
+                        RGB_CHANNELS)
+    found = ~numpy.isnan(trace).any(axis=1)
+    positions = trace[found]
+    if refineRadius and len(positions):
+        positions = refinePositions(bufferArray(toArgb32(image)),
+                                    positions, refineRadius, RGB_CHANNELS,
+                                    calibration['color'],
+                                    calibration['tolerance'])
+    data = numpy.empty_like(trace)
+    data.fill(numpy.nan)
+    data[found] = mapArray(matrix, positions,
+                           calibration['xLog'], calibration['yLog'])
+    return data
+
+
+def _decodeFrames(imagePaths, frames, stop):
+    '''
+    Decoding stage. Puts an (index, image, error) tuple on the frames queue
+    for each path, then _DONE.
+    '''
+    for index, path in enumerate(imagePaths):
+        if stop.is_set():
+            break
+        try:
+            image = openImageSource(path).image()
+            if image.isNull():
+                raise IOError('cannot load {}'.format(path))
+            frames.put((index, toArgb32(image), None))
+        except Exception as e:
+            frames.put((index, None, str(e)))
+    frames.put(_DONE)
+
+
+class _StackWriter(object):
+    '''
+    Writing stage. Copies each frame's data into the stacked array, which
+    is allocated once the frame width is known, and memory mapped to the
+    output file if there is one.
+    '''
+
+    def __init__(self, count, savePath=None):
+        self.count = count
+        self.savePath = savePath
+        self.stack = None
+        self.error = None
+
+    def allocate(self, width):
+        shape = (self.count, width, 2)
+        if self.savePath is None:
+            self.stack = numpy.empty(shape)
+        else:
+            self.stack = open_memmap(self.savePath, mode='w+',
+                                     dtype=numpy.float64, shape=shape)
+        # Frames that fail are left as NaN
+        self.stack.fill(numpy.nan)
+
+    def __call__(self, results):
+        while True:
+            item = results.get()
+            if item is _DONE:
+                break
+            if self.error is not None:
+                # Keep draining, so the extraction stage never blocks
+                continue
+            index, data = item
+            try:
+                if self.stack is None:
+                    self.allocate(len(data))
+                self.stack[index] = data
+            except Exception as e:
+                self.error = e
+        if self.error is None:
+            if self.stack is None:
+                self.allocate(0)
+            if isinstance(self.stack, numpy.memmap):
+                self.stack.flush()
+
+
+def digitizeSequence(imagePaths, calibration, savePath=None, refineRadius=0,
+                     progress=None, isCanceled=None):
+    '''
+    Extract the calibrated data of a curve from a sequence of frames of
+    the same plot, which share one calibration. Decoding, extraction and
+    writing overlap: frame N+1 is decoded while frame N is extracted and
+    frame N-1 is written.
+
+    Parameters
+    ----------
+    imagePaths : list of str
+        the frame image files, in order
+    calibration : dict
+        calibration spec, as returned by `batch.loadCalibration`
+    savePath : str or None
+        .npy file to write the stacked data to as it's extracted
+    refineRadius : int
+        if nonzero, move each point to the centroid of the curve pixels
+        within this many pixels of it
+    progress : callable or None
+        called with (index, path, data, seconds, error) after each frame is
+        extracted. data is None if the frame failed.
+    isCanceled : callable or None
+        polled between frames to stop early
+
+    Returns
+    -------
+    stack : ndarray
+        (frames, width, 2) array of (x, y) data, with NaN rows for image
+        columns without the curve. Every row of a failed frame is NaN. The
+        width is that of the first frame, and frames of another width fail.
+    failures : int
+        the number of failed frames
+    '''
+    matrix = calibrationMatrix(calibration)
+    stop = threading.Event()
+    frames = Queue(QUEUE_DEPTH)
+    results = Queue(QUEUE_DEPTH)
+    writer = _StackWriter(len(imagePaths), savePath)
+    stages = [threading.Thread(target=_decodeFrames,
+                               args=(imagePaths, frames, stop)),
+              threading.Thread(target=writer, args=(results,))]
+    for stage in stages:
+        stage.daemon = True
+        stage.start()
+
+    width = None
+    failures = 0
+    decoding = True
+    try:
+        while True:
+            item = frames.get()
+            if item is _DONE:
+                decoding = False
+                break
+            index, image, error = item
+            if isCanceled is not None and isCanceled():
+                stop.set()
+            if stop.is_set():
+                continue
+            start = time.time()
+            data = None
+            if error is None:
+                try:
+                    if width is None:
+                        width = image.width()
+                    if image.width() != width:
+                        raise ValueError('frame is {} pixels wide, not {}'
+                                         .format(image.width(), width))
+                    data = frameData(image, calibration, matrix,
+                                     refineRadius)
+                except Exception as e:
+                    error = str(e)
+            if data is None:
+                failures += 1
+            else:
+                results.put((index, data))
+            if progress is not None:
+                progress(index, imagePaths[index], data,
+                         time.time() - start, error)
+    finally:
+        # Let the decoder finish, and wait for the pending writes
+        stop.set()
+        while decoding:
+            decoding = frames.get() is not _DONE
+        results.put(_DONE)
+        for stage in stages:
+            stage.join()
+    if writer.error is not None:
+        raise writer.error
+    return writer.stack, failures
+
+
+class SequenceWorker(QtCore.QThread):
+    '''
+    Digitizes an image sequence in the background. Each signal passes the
+    worker as its first argument.
+    '''
+    progress = QtCore.Signal(object, int, int)  # frames done, frame count
+    done = QtCore.Signal(object, int, float, int)  # frames, seconds, failed
+    failed = QtCore.Signal(object, unicode)  # message
+
+    def __init__(self, imagePaths, calibration, savePath, refineRadius=0,
+                 parent=None):
+        super(SequenceWorker, self).__init__(parent)
+        self._imagePaths = imagePaths
+        self._calibration = calibration
+        self._savePath = savePath
+        self._refineRadius = refineRadius
+        self._canceled = False
+        self._frames = 0
+
+    def cancel(self):
+        self._canceled = True
+
+    def isCanceled(self):
+        return self._canceled
+
+    def _frameDone(self, index, path, data, seconds, error):
+        self._frames += 1
+        self.progress.emit(self, self._frames, len(self._imagePaths))
+
+    def run(self):
+        start = time.time()
+        try:
+            _stack, failures = digitizeSequence(
+                                self._imagePaths, self._calibration,
+                                self._savePath, self._refineRadius,
+                                self._frameDone, self.isCanceled)
+        except Exception as e:
+            self.failed.emit(self, unicode(e))
+            return
+        self.done.emit(self, self._frames, time.time() - start, failures)
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Extract curve data from a sequence of frames of the '
+                    'same plot into one stacked array.')
+    parser.add_argument('calibration',
+                        help='JSON calibration spec')
+    parser.add_argument('images', nargs='+',
+                        help='frame image files or glob patterns, in order')
+    parser.add_argument('-o', '--output', required=True,
+                        help='output .npy file, holding a (frames, width, 2) '
+                             'array of (x, y) data')
+    parser.add_argument('-r', '--refine', type=int, default=0,
+                        metavar='RADIUS',
+                        help='move each point to the centroid of the curve '
+                             'pixels within RADIUS pixels (default: off)')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="don't report each frame")
+    args = parser.parse_args(argv)
+
+    try:
+        calibration = loadCalibration(args.calibration)
+        calibrationMatrix(calibration)
+    except (IOError, ValueError) as e:
+        parser.error('invalid calibration: {}'.format(e))
+    imagePaths = expandPaths(args.images)
+
+    def progress(index, path, data, seconds, error):
+        if error is not None:
+            sys.stdout.write('{}: failed: {}\n'.format(path, error))
+        elif not args.quiet:
+            npoints = int((~numpy.isnan(data[:, 1])).sum())
+            sys.stdout.write('{}: {} points in {:.3f} s\n'.format(
+                                                path, npoints, seconds))
+
+    start = time.time()
+    try:
+        stack, failures = digitizeSequence(imagePaths, calibration,
+                                           args.output, args.refine,
+                                           progress)
+    except (IOError, OSError) as e:
+        sys.stderr.write('cannot write {}: {}\n'.format(args.output, e))
+        return 1
+    seconds = time.time() - start
+    sys.stdout.write('Processed {} frames in {:.3f} s ({:.1f} fps, {} '
+                     'failed)\n'.format(len(imagePaths), seconds,
+                                        len(imagePaths) / max(seconds, 1e-9),
+                                        failures))
+    sys.stdout.write('Wrote a {} array to {}\n'.format(
+                            'x'.join(str(n) for n in stack.shape),
+                            args.output))
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,164 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os
+import json
+import struct
+
+# third party imports
+import numpy
+
+MAGIC = b'PLSESS\x00\x01'
+HEADER_LENGTH = struct.Struct('<I')
+
+# Each record sets the position of a point, or removes it if the position
+# is NaN. Later records override earlier ones with the same id.
+RECORD_DTYPE = numpy.dtype([('id', '<i8'), ('x', '<f8'), ('y', '<f8')])
+
+# Rewrite the file once it holds this many more records than live points
+COMPACT_SLACK = 4096
+
+
+class SessionFormatError(ValueError):
+    pass
+
+
+class SessionWriter(object):
+    '''
+    Writes a session file: a small JSON metadata header, followed by a block
+    of fixed-size point records.
+
+    The first save, and any save after the metadata changes, rewrites the
+    whole file. Otherwise, only records for the points that changed since
+    the last save are appended, so frequent autosaves stay cheap.
+    '''
+
+    def __init__(self, path):
+        self._path = path
+        self._header = None
+        self._nrecords = 0
+
+    def path(self):
+        return self._path
+
+    def needsSave(self, metadata, store):
+        return _encode(metadata) != self._header or store.hasChanges()
+
+    def save(self, metadata, store):
+        '''
+        Save the metadata (a JSON serializable dict) and the points of a
+        PointStore.
+        '''
+        header = _encode(metadata)
+        cleared, changed = store.takeChanges()
+        try:
+            if (cleared or header != self._header or
+                    self._nrecords > 2 * len(store) + COMPACT_SLACK or
+                    not os.path.exists(self._path)):
+                self._rewrite(header, store)
+            elif changed:
+                self._append(store, changed)
+        except:
+            # The file no longer matches what we think it holds
+            self._header = None
+            raise
+
+    def _rewrite(self, header, store):
+        records = numpy.empty(len(store), dtype=RECORD_DTYPE)
+        records['id'] = store.ids()
+        positions = store.positions()
+        records['x'] = positions[:, 0]
+        records['y'] = positions[:, 1]
+        tmpPath = self._path + '.tmp'
+        with open(tmpPath, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            records.tofile(f)
+        _replace(tmpPath, self._path)
+        self._header = header
+        self._nrecords = len(records)
+
+    def _append(self, store, changed):
+        ids = numpy.array(sorted(changed), dtype=numpy.int64)
+        records = numpy.empty(len(ids), dtype=RECORD_DTYPE)
+        records['id'] = ids
+        records['x'] = numpy.nan
+        records['y'] = numpy.nan
+        live = numpy.array([pointId in store for pointId in ids.tolist()],
+                           dtype=bool)
+        if live.any():
+            rows = store.rowsOf(ids[live].tolist())
+            positions = store.positions()[rows]
+            records['x'][live] = positions[:, 0]
+            records['y'][live] = positions[:, 1]
+        with open(self._path, 'ab') as f:
+            records.tofile(f)
+        self._nrecords += len(records)
+
+
+def _encode(metadata):
+    return json.dumps(metadata, sort_keys=True).encode('utf-8')
+
+
+def _replace(src, dst):
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Windows won't rename over an existing file
+        os.remove(dst)
+        os.rename(src, dst)
+
+
+def loadSession(path):
+    '''
+    Read a session file. Returns a (metadata, positions) tuple, where
+    positions is an Nx2 array of the points, in the order they were added.
+    A partially written trailing record is ignored, but a truncated header
+    raises a SessionFormatError.
+    '''
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SessionFormatError('not a session file: {}'.format(path))
+        data = f.read(HEADER_LENGTH.size)
+        if len(data) < HEADER_LENGTH.size:
+            raise SessionFormatError('truncated session file: {}'.format(
+                                                                    path))
+        length, = HEADER_LENGTH.unpack(data)
+        header = f.read(length)
+        if len(header) < length:
+            raise SessionFormatError('truncated session file: {}'.format(
+                                                                    path))
+        try:
+            metadata = json.loads(header.decode('utf-8'))
+        except ValueError as e:
+            raise SessionFormatError('invalid session metadata in {}: {}'
+                                     .format(path, e))
+        data = f.read()
+    nrecords = len(data) // RECORD_DTYPE.itemsize
+    records = numpy.frombuffer(data, dtype=RECORD_DTYPE, count=nrecords)
+    # Keep the last record for each id, in id order
+    reversedIds = records['id'][::-1]
+    ids, lastIndex = numpy.unique(reversedIds, return_index=True)
+    last = records[::-1][lastIndex]
+    live = ~(numpy.isnan(last['x']) | numpy.isnan(last['y']))
+    positions = numpy.column_stack((last['x'][live], last['y'][live]))
+    return metadata, positions
@@ -0,0 +1,220 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# third party imports
+import numpy
+from PySide import QtGui, QtCore
+
+# local imports
+from plotliberator.image_array import toArgb32, bufferArray, RGB_CHANNELS
+from plotliberator.extraction import colorMask
+from plotliberator.axis_detection import DARK_THRESHOLD
+
+# Points only snap to features within this many pixels
+MAX_SNAP_DISTANCE = 16
+
+# Offset of pixels without a feature within MAX_SNAP_DISTANCE
+NO_FEATURE = -128
+
+
+def nearestOffsets(mask, maxDistance=MAX_SNAP_DISTANCE):
+    '''
+    Computes the exact Euclidean distance transform of a boolean feature
+    mask, bounded to maxDistance, as two separable passes of shifted array
+    comparisons.
+
+    Returns (offsetX, offsetY) int8 arrays of the offset from each pixel to
+    its nearest feature pixel, or NO_FEATURE if there's none within
+    maxDistance.
+    '''
+    height, width = mask.shape
+    none = numpy.int16(numpy.iinfo(numpy.int16).max)
+    # Squared distance and offset to the nearest feature in the same column
+    columnDist2 = numpy.where(mask, 0, none).astype(numpy.int16)
+    columnOffset = numpy.zeros((height, width), dtype=numpy.int8)
+    for d in xrange(1, maxDistance + 1):
+        d2 = numpy.int16(d * d)
+        for shift in (d, -d):
+            if shift > 0:
+                source = mask[shift:]
+                target = slice(0, height - shift)
+            else:
+                source = mask[:height + shift]
+                target = slice(-shift, height)
+            better = source & (columnDist2[target] > d2)
+            columnDist2[target][better] = d2
+            columnOffset[target][better] = shift
+    # Combine the columns within maxDistance of each pixel
+    dist2 = columnDist2.copy()
+    offsetX = numpy.zeros((height, width), dtype=numpy.int8)
+    offsetY = columnOffset.copy()
+    for d in xrange(1, maxDistance + 1):
+        d2 = numpy.int16(d * d)
+        for shift in (d, -d):
+            if shift > 0:
+                source = slice(shift, width)
+                target = slice(0, width - shift)
+            else:
+                source = slice(0, width + shift)
+                target = slice(-shift, width)
+            sourceDist2 = columnDist2[:, source]
+            candidate = sourceDist2 + d2
+            candidate[sourceDist2 == none] = none
+            better = candidate < dist2[:, target]
+            dist2[:, target][better] = candidate[better]
+            offsetX[:, target][better] = shift
+            offsetY[:, target][better] = columnOffset[:, source][better]
+    missing = dist2 > maxDistance * maxDistance
+    offsetX[missing] = NO_FEATURE
+    offsetY[missing] = NO_FEATURE
+    return offsetX, offsetY
+
+
+class SnapMap(object):
+    '''
+    The offset from each pixel to its nearest feature pixel, for O(1)
+    snapping.
+    '''
+
+    def __init__(self, offsetX, offsetY):
+        self._offsetX = offsetX
+        self._offsetY = offsetY
+
+    def nbytes(self):
+        return self._offsetX.nbytes + self._offsetY.nbytes
+
+    def snap(self, x, y):
+        '''
+        Returns the (x, y) center of the feature pixel nearest to (x, y), or
+        None if there's none within MAX_SNAP_DISTANCE.
+        '''
+        height, width = self._offsetX.shape
+        column = int(x)
+        row = int(y)
+        if x < 0 or y < 0 or column >= width or row >= height:
+            return None
+        dx = int(self._offsetX[row, column])
+        if dx == NO_FEATURE:
+            return None
+        dy = int(self._offsetY[row, column])
+        return column + dx + 0.5, row + dy + 0.5
+
+
+def buildSnapMap(pixels, maskFunction, maxDistance=MAX_SNAP_DISTANCE,
+                 bandHeight=256, isCanceled=None):
+    '''
+    Build a SnapMap one band of rows at a time, so that the temporary
+    arrays stay small.
+
+    Parameters
+    ----------
+    pixels : ndarray
+        (height, width, 4) array of 32-bit image pixels
+    maskFunction : callable
+        returns the boolean feature mask of a band of pixels
+    maxDistance : int
+        features further than this are ignored
+    bandHeight : int
+        rows per band. Each band is processed with maxDistance rows of
+        overlap on either side.
+    isCanceled : callable or None
+        checked between bands. If it returns True, None is returned.
+    '''
+    height, width = pixels.shape[:2]
+    offsetX = numpy.empty((height, width), dtype=numpy.int8)
+    offsetY = numpy.empty((height, width), dtype=numpy.int8)
+    for y0 in xrange(0, height, bandHeight):
+        if isCanceled is not None and isCanceled():
+            return None
+        y1 = min(y0 + bandHeight, height)
+        top = max(y0 - maxDistance, 0)
+        bottom = min(y1 + maxDistance, height)
+        bandX, bandY = nearestOffsets(maskFunction(pixels[top:bottom]),
+                                      maxDistance)
+        offsetX[y0:y1] = bandX[y0 - top:y1 - top]
+        offsetY[y0:y1] = bandY[y0 - top:y1 - top]
+    return SnapMap(offsetX, offsetY)
+
+
+def darkPixelMask(pixels):
+    '''
+    Returns a mask of the pixels that are dark in every channel
+    '''
+    return pixels[..., list(RGB_CHANNELS)].max(axis=-1) < DARK_THRESHOLD
+
+
+class SnapMapBuilder(QtCore.QThread):
+    '''
+    Builds the SnapMap of a QImage or ImageSource in the background, and
+    emits ready(builder, snapMap) when it's done. An ImageSource is decoded
+    in the background too, and the decoded QImage is kept as image().
+
+    If color is None, the features are the dark pixels. Otherwise, they
+    are the pixels within tolerance of color, an (r, g, b) tuple.
+
+    Changing the color or the image changes the mask everywhere, so the
+    whole map is rebuilt, one band of rows at a time, and can be canceled
+    between bands.
+    '''
+    ready = QtCore.Signal(object, object)
+
+    def __init__(self, image, color=None, tolerance=0, parent=None):
+        super(SnapMapBuilder, self).__init__(parent)
+        if isinstance(image, QtGui.QImage):
+            self._source = None
+            self._image = image
+        else:
+            self._source = image
+            self._image = None
+        self._color = color
+        self._tolerance = tolerance
+        self._canceled = False
+
+    def cancel(self):
+        self._canceled = True
+
+    def isCanceled(self):
+        return self._canceled
+
+    def image(self):
+        '''
+        Returns the QImage the map is built from, or None if the source
+        hasn't been decoded yet.
+        '''
+        return self._image
+
+    def maskFunction(self):
+        if self._color is None:
+            return darkPixelMask
+        color = self._color
+        tolerance = self._tolerance
+        return lambda pixels: colorMask(pixels, color, tolerance,
+                                        RGB_CHANNELS)
+
+    def run(self):
+        if self._image is None:
+            self._image = self._source.image()
+        if self._canceled or self._image.isNull():
+            return
+        pixels = bufferArray(toArgb32(self._image))
+        snapMap = buildSnapMap(pixels, self.maskFunction(),
+                               isCanceled=self.isCanceled)
+        if snapMap is not None and not self._canceled:
+            self.ready.emit(self, snapMap)
@@ -0,0 +1,434 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import re
+import gzip
+import os.path
+import threading
+from math import radians, tan, cos, sin
+from xml.parsers import expat
+
+# third party imports
+import numpy
+from PySide import QtGui, QtCore, QtSvg
+from PySide.QtCore import Qt
+
+# local imports
+from plotliberator.tiled_image import ImageSource
+
+SVG_EXTENSIONS = ('.svg', '.svgz')
+
+# Elements that are read as paths
+SHAPE_TAGS = frozenset(['path', 'polyline', 'polygon', 'line'])
+
+# Elements whose contents aren't drawn where they are
+UNDRAWN_TAGS = frozenset(['defs', 'clipPath', 'mask', 'marker', 'symbol',
+                          'pattern'])
+
+# Bytes fed to the XML parser at a time. Expat rescans an incomplete
+# element from its start on every feed, so small chunks are quadratic in
+# the size of large path elements.
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Number of arguments of each path command
+_COMMAND_ARGS = dict(M=2, L=2, H=1, V=1, C=6, S=4, Q=4, T=2, A=7)
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+_SEGMENT = re.compile(r'([MmZzLlHhVvCcSsQqTtAa])([^MmZzLlHhVvCcSsQqTtAa]*)')
+_TRANSFORM = re.compile(r'(\w+)\s*\(([^)]*)\)')
+_STROKE = re.compile(r'(?:^|;)\s*stroke\s*:\s*([^;]+)')
+
+# Path data with only absolute moves and lines, and closes before moves
+_ABSOLUTE_LINES = re.compile(r'^[\s,0-9.eE+\-MLZ]*$')
+_CLOSE_WITHOUT_MOVE = re.compile(r'Z[\s,]*[^\sM]')
+
+# Numbers written without a separator, e.g. "1-2" or "0.5.5"
+_PACKED_SIGN = re.compile(r'[-+](?<=[0-9.][-+])')
+_PACKED_POINT = re.compile(r'\.[0-9]*\.')
+
+
+def _plainNumbers(text):
+    '''
+    Returns an array of the numbers in text, if they're all separated by
+    whitespace or commas, or None. numpy parses these in one pass.
+    '''
+    if _PACKED_SIGN.search(text) or _PACKED_POINT.search(text):
+        return None
+    text = text.replace(',', ' ')
+    # numpy stops early at anything that isn't a number
+    values = numpy.fromstring(text, sep=' ')
+    if len(values) != len(text.split()):
+        return None
+    return values
+
+
+def parseNumbers(text):
+    '''
+    Returns an array of the numbers in an SVG attribute value, e.g. a list
+    of points.
+    '''
+    values = _plainNumbers(text)
+    if values is None:
+        values = numpy.array(_NUMBER.findall(text), dtype=float)
+    return values
+
+
+def parsePathData(d):
+    '''
+    Returns an Nx2 array of the vertices of SVG path data, with a row of
+    NaNs between subpaths. Curves and arcs contribute their end points, and
+    closing a subpath doesn't repeat its first vertex.
+    '''
+    if _ABSOLUTE_LINES.match(d) and not _CLOSE_WITHOUT_MOVE.search(d):
+        # Lines only, as written by most plotting libraries, which can be
+        # parsed in one pass. Each move becomes a NaN break.
+        values = _plainNumbers(d.replace('M', ' nan nan ').replace('L', ' ')
+                                .replace('Z', ' '))
+        if values is not None and len(values) % 2 == 0:
+            vertices = values.reshape(-1, 2)
+            start = 0
+            while start < len(vertices) and numpy.isnan(vertices[start, 0]):
+                start += 1
+            return vertices[start:]
+
+    pieces = []
+    x = y = 0.
+    startX = startY = 0.
+    for command, arguments in _SEGMENT.findall(d):
+        upper = command.upper()
+        if upper == 'Z':
+            x, y = startX, startY
+            continue
+        count = _COMMAND_ARGS[upper]
+        values = parseNumbers(arguments)
+        values = values[:len(values) // count * count].reshape(-1, count)
+        if not len(values):
+            continue
+        relative = command != upper
+        if upper in 'HV':
+            coordinates = values[:, 0]
+            if relative:
+                coordinates = numpy.cumsum(coordinates) + (x if upper == 'H'
+                                                           else y)
+            ends = numpy.empty((len(coordinates), 2))
+            if upper == 'H':
+                ends[:, 0] = coordinates
+                ends[:, 1] = y
+            else:
+                ends[:, 0] = x
+                ends[:, 1] = coordinates
+        else:
+            ends = values[:, -2:]
+            if relative:
+                ends = numpy.cumsum(ends, axis=0) + (x, y)
+        if upper == 'M':
+            if pieces:
+                pieces.append(numpy.array([[numpy.nan, numpy.nan]]))
+            startX, startY = ends[0]
+        pieces.append(ends)
+        x, y = ends[-1]
+    if not pieces:
+        return numpy.empty((0, 2))
+    return numpy.concatenate(pieces)
+
+
+def parseTransform(text):
+    '''
+    Returns the 3x3 matrix of an SVG transform attribute.
+    '''
+    matrix = numpy.identity(3)
+    for name, arguments in _TRANSFORM.findall(text):
+        values = parseNumbers(arguments).tolist()
+        step = numpy.identity(3)
+        if name == 'matrix' and len(values) == 6:
+            a, b, c, d, e, f = values
+            step[:2] = [[a, c, e], [b, d, f]]
+        elif name == 'translate' and values:
+            step[0, 2] = values[0]
+            step[1, 2] = values[1] if len(values) > 1 else 0.
+        elif name == 'scale' and values:
+            step[0, 0] = values[0]
+            step[1, 1] = values[1] if len(values) > 1 else values[0]
+        elif name == 'rotate' and values:
+            angle = radians(values[0])
+            step[:2, :2] = [[cos(angle), -sin(angle)],
+                            [sin(angle), cos(angle)]]
+            if len(values) == 3:
+                # Rotate about (cx, cy)
+                cx, cy = values[1:]
+                step[:2, 2] = (cx, cy) - step[:2, :2].dot((cx, cy))
+        elif name == 'skewX' and values:
+            step[0, 1] = tan(radians(values[0]))
+        elif name == 'skewY' and values:
+            step[1, 0] = tan(radians(values[0]))
+        matrix = matrix.dot(step)
+    return matrix
+
+
+def shapeVertices(tag, attributes):
+    '''
+    Returns an Nx2 array of the vertices of a path, polyline, polygon or
+    line element, given its attributes, in its own user units.
+    '''
+    if tag == 'path':
+        return parsePathData(attributes.get('d', ''))
+    if tag == 'line':
+        return numpy.array([[float(attributes.get('x1', 0)),
+                             float(attributes.get('y1', 0))],
+                            [float(attributes.get('x2', 0)),
+                             float(attributes.get('y2', 0))]])
+    values = parseNumbers(attributes.get('points', ''))
+    return values[:len(values) // 2 * 2].reshape(-1, 2)
+
+
+def _stroke(attributes):
+    stroke = attributes.get('stroke')
+    if stroke is None:
+        match = _STROKE.search(attributes.get('style', ''))
+        if match is not None:
+            stroke = match.group(1).strip()
+    return stroke
+
+
+class SvgPath(object):
+    '''
+    A path, polyline, polygon or line of an SVG file.
+
+    Attributes
+    ----------
+    index : int
+        the index of the path in document order
+    elementId : str or None
+        the element's id attribute
+    stroke : str or None
+        the stroke color, as written in the file, or None if it's unset
+    vertices : ndarray
+        Nx2 array of the vertices, in the root element's user units, with
+        a row of NaNs between subpaths
+    '''
+
+    def __init__(self, index, elementId, stroke, vertices):
+        self.index = index
+        self.elementId = elementId
+        self.stroke = stroke
+        self.vertices = vertices
+
+    def label(self):
+        name = self.elementId or 'path {}'.format(self.index + 1)
+        return '{} ({} vertices)'.format(name, self.vertexCount())
+
+    def vertexCount(self):
+        return int((~numpy.isnan(self.vertices[:, 0])).sum())
+
+
+class _PathCollector(object):
+    '''
+    Expat handlers that track the transforms and strokes of the open
+    elements, and collect an SvgPath for each drawn shape.
+    '''
+
+    def __init__(self):
+        self.transforms = [numpy.identity(3)]
+        self.strokes = [None]
+        self.hidden = 0
+        self.paths = []
+        self.count = 0
+
+    def start(self, name, attributes):
+        tag = name.rpartition(' ')[2]
+        transform = self.transforms[-1]
+        if attributes.get('transform'):
+            transform = transform.dot(parseTransform(attributes['transform']))
+        self.transforms.append(transform)
+        self.strokes.append(_stroke(attributes) or self.strokes[-1])
+        if self.hidden or tag in UNDRAWN_TAGS:
+            self.hidden += 1
+        elif tag in SHAPE_TAGS:
+            vertices = shapeVertices(tag, attributes)
+            if len(vertices):
+                vertices = (vertices.dot(transform[:2, :2].T) +
+                            transform[:2, 2])
+                self.paths.append(SvgPath(self.count, attributes.get('id'),
+                                          self.strokes[-1], vertices))
+                self.count += 1
+
+    def end(self, name):
+        self.transforms.pop()
+        self.strokes.pop()
+        if self.hidden:
+            self.hidden -= 1
+
+
+def iterSvgPaths(f, progress=None, isCanceled=None, chunkSize=CHUNK_SIZE):
+    '''
+    Parse an SVG file object incrementally, yielding an SvgPath for each
+    drawn path, polyline, polygon or line. Only the paths are kept, so the
+    document is never held in memory.
+
+    Parameters
+    ----------
+    f : file
+        the SVG file
+    progress : callable or None
+        called with no arguments after each chunk is parsed
+    isCanceled : callable or None
+        polled after each chunk, to stop parsing early
+    chunkSize : int
+        bytes parsed at a time
+    '''
+    collector = _PathCollector()
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.StartElementHandler = collector.start
+    parser.EndElementHandler = collector.end
+    while True:
+        chunk = f.read(chunkSize)
+        parser.Parse(chunk, not chunk)
+        for path in collector.paths:
+            yield path
+        del collector.paths[:]
+        if not chunk:
+            return
+        if progress is not None:
+            progress()
+        if isCanceled is not None and isCanceled():
+            return
+
+
+def readSvgPaths(path, progress=None, isCanceled=None):
+    '''
+    Returns a list of the SvgPaths of an .svg or gzipped .svgz file.
+
+    progress is called with the percentage of the file read so far.
+    '''
+    size = max(os.path.getsize(path), 1)
+    with open(path, 'rb') as raw:
+        f = raw
+        if os.path.splitext(path)[1].lower() == '.svgz':
+            f = gzip.GzipFile(fileobj=raw)
+        report = None
+        if progress is not None:
+            report = lambda: progress(min(100 * raw.tell() // size, 100))
+        try:
+            return list(iterSvgPaths(f, report, isCanceled))
+        except (expat.ExpatError, ValueError) as e:
+            raise ValueError('Cannot read {}: {}'.format(path, e))
+
+
+class SvgImageSource(ImageSource):
+    '''
+    An ImageSource for an SVG file, along with the file's paths. Use
+    mapToImage to map the paths' vertices to image coordinates, without any
+    pixel quantization.
+
+    The drawing is shown rasterized, as tiles of a TiledImageItem, rather
+    than as a QGraphicsPathItem per path. Rendering strokes every path, so
+    the full size image is rendered once, the first time a tile is needed,
+    and the tiles are cut from it. Scaled copies, e.g. mipmap levels, are
+    rendered once each at their own size.
+    '''
+
+    def __init__(self, path, progress=None, isCanceled=None):
+        '''
+        progress and isCanceled are passed on to readSvgPaths.
+        '''
+        self._path = path
+        self._paths = readSvgPaths(path, progress, isCanceled)
+        with open(path, 'rb') as f:
+            self._data = QtCore.QByteArray(f.read())
+        # QSvgRenderer isn't thread safe, and tiles and mipmap levels are
+        # rendered from different threads, so each thread gets its own
+        self._local = threading.local()
+        self._image = None
+        self._imageLock = threading.Lock()
+        renderer = self.renderer()
+        if not renderer.isValid():
+            raise ValueError('Cannot render {}'.format(path))
+        self._size = renderer.defaultSize()
+        self._viewBox = renderer.viewBoxF()
+
+    def path(self):
+        return self._path
+
+    def paths(self):
+        '''
+        Returns the list of SvgPaths, in document order.
+        '''
+        return self._paths
+
+    def nbytes(self):
+        nbytes = self._data.size() + sum(path.vertices.nbytes
+                                         for path in self._paths)
+        if self._image is not None:
+            nbytes += self._image.byteCount()
+        return nbytes
+
+    def isDecoded(self):
+        return self._image is not None
+
+    def renderer(self):
+        renderer = getattr(self._local, 'renderer', None)
+        if renderer is None:
+            renderer = QtSvg.QSvgRenderer(self._data)
+            self._local.renderer = renderer
+        return renderer
+
+    def size(self):
+        return self._size
+
+    def mapToImage(self, vertices):
+        '''
+        Map an Nx2 array of vertices from user units to image coordinates.
+        '''
+        viewBox = self._viewBox
+        if viewBox.isEmpty():
+            return vertices.copy()
+        scale = (self._size.width() / viewBox.width(),
+                 self._size.height() / viewBox.height())
+        return (vertices - (viewBox.x(), viewBox.y())) * scale
+
+    def render(self, size, rect):
+        '''
+        Returns a QImage of the given QSize, with the drawing scaled to fill
+        the image rect, a QRectF, on white.
+        '''
+        image = QtGui.QImage(size, QtGui.QImage.Format_ARGB32)
+        image.fill(QtGui.QColor(Qt.white).rgb())
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        self.renderer().render(painter, rect)
+        painter.end()
+        return image
+
+    def image(self):
+        '''
+        Returns the full size rendering, rendering it the first time
+        '''
+        with self._imageLock:
+            if self._image is None:
+                self._image = self.scaled(self._size)
+        return self._image
+
+    def region(self, rect):
+        return self.image().copy(rect)
+
+    def scaled(self, size):
+        return self.render(size, QtCore.QRectF(0., 0., size.width(),
+                                               size.height()))
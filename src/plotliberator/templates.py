@@ -0,0 +1,267 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import json
+import os.path
+from itertools import combinations
+
+# third party imports
+import numpy
+from PySide import QtCore
+
+# local imports
+from plotliberator.image_array import imageToArray
+
+HASH_BITS = 64
+# Each hash is indexed by this many substrings of HASH_BITS // CHUNKS bits
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+# Largest Hamming distance between the hashes of images of one template
+MAX_HASH_DISTANCE = 10
+# Largest relative difference between the aspect ratios of images of one
+# template
+ASPECT_TOLERANCE = 0.02
+
+
+def dHash(gray):
+    '''
+    Returns the 64-bit difference hash of an (8, 9) grayscale array: one
+    bit per horizontally adjacent pair of pixels, set where the left one is
+    brighter.
+    '''
+    bits = numpy.asarray(gray, dtype=float)
+    bits = (bits[:, :-1] > bits[:, 1:]).ravel()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def imageHash(source):
+    '''
+    Returns the difference hash of an ImageSource, from a 9x8 scaled copy,
+    so similar images hash to nearby values whatever their resolution.
+    '''
+    pixels = imageToArray(source.scaled(QtCore.QSize(9, 8)))
+    return dHash(pixels.dot([0.299, 0.587, 0.114]))
+
+
+# Number of set bits in each byte value
+_POPCOUNT = numpy.array([bin(i).count('1') for i in xrange(256)],
+                        dtype=numpy.uint8)
+
+
+def hammingDistances(hashes, hashValue):
+    '''
+    Returns the number of bits in which each of an array of uint64 hashes
+    differs from hashValue.
+    '''
+    diff = numpy.bitwise_xor(hashes, numpy.uint64(hashValue))
+    return _POPCOUNT[diff.view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class HashIndex(object):
+    '''
+    An index of 64-bit hashes, for finding the ones near a query hash
+    without comparing it to all of them (multi-index hashing). Each hash is
+    split into CHUNKS substrings, with a table for each. A hash within
+    maxDistance bits of the query matches it within
+    maxDistance // CHUNKS bits in at least one substring, so only those
+    table entries are looked up, and only their hashes are compared.
+
+    The hashes are keyed by the order they were added in.
+    '''
+
+    def __init__(self, maxDistance=MAX_HASH_DISTANCE):
+        self._maxDistance = maxDistance
+        self._hashes = numpy.empty(1024, dtype=numpy.uint64)
+        self._count = 0
+        self._tables = [{} for _ in xrange(CHUNKS)]  # substring -> keys
+        # XOR masks of the substrings near a substring
+        radius = maxDistance // CHUNKS
+        self._masks = [sum(1 << bit for bit in bits)
+                       for distance in xrange(radius + 1)
+                       for bits in combinations(xrange(CHUNK_BITS),
+                                                distance)]
+
+    def __len__(self):
+        return self._count
+
+    def maxDistance(self):
+        return self._maxDistance
+
+    @staticmethod
+    def substrings(hashValue):
+        mask = (1 << CHUNK_BITS) - 1
+        return [(hashValue >> (i * CHUNK_BITS)) & mask
+                for i in xrange(CHUNKS)]
+
+    def add(self, hashValue):
+        '''
+        Add a hash, and return its key.
+        '''
+        return self.extend([hashValue])[0]
+
+    def extend(self, hashValues):
+        '''
+        Add a list of hashes, and return a list of their keys.
+        '''
+        start = self._count
+        self._count += len(hashValues)
+        if self._count > len(self._hashes):
+            hashes = numpy.empty(max(self._count, 2 * len(self._hashes)),
+                                 dtype=numpy.uint64)
+            hashes[:start] = self._hashes[:start]
+            self._hashes = hashes
+        self._hashes[start:self._count] = hashValues
+        keys = range(start, self._count)
+        mask = (1 << CHUNK_BITS) - 1
+        for i, table in enumerate(self._tables):
+            shift = i * CHUNK_BITS
+            for key, hashValue in zip(keys, hashValues):
+                substring = (hashValue >> shift) & mask
+                if substring in table:
+                    table[substring].append(key)
+                else:
+                    table[substring] = [key]
+        return keys
+
+    def query(self, hashValue):
+        '''
+        Returns a list of (distance, key) tuples of the hashes within
+        maxDistance of hashValue, nearest first.
+        '''
+        candidates = set()
+        for table, substring in zip(self._tables,
+                                    self.substrings(hashValue)):
+            probes = map(table.get, [substring ^ mask
+                                     for mask in self._masks])
+            candidates.update(*filter(None, probes))
+        if not candidates:
+            return []
+        keys = numpy.fromiter(candidates, dtype=numpy.int64,
+                              count=len(candidates))
+        distances = hammingDistances(self._hashes[keys], hashValue)
+        near = distances <= self._maxDistance
+        keys = keys[near]
+        distances = distances[near]
+        order = numpy.lexsort((keys, distances))
+        return zip(distances[order].tolist(), keys[order].tolist())
+
+
+class TemplateLibrary(object):
+    '''
+    Saved calibrations, looked up by the hash and aspect ratio of their
+    images. Axis corners are kept as fractions of the image size, so a
+    template applies to other resolutions of the same layout.
+
+    The templates are stored one per line, as the image hash in hex, the
+    aspect ratio and the calibration as JSON. Saving one only appends to
+    the file, and the calibrations are only parsed when they're matched.
+    The file is read the first time it's needed.
+    '''
+
+    def __init__(self, path):
+        self._path = path
+        self._index = None
+        self._aspects = None
+        self._calibrations = None  # JSON text
+
+    def path(self):
+        return self._path
+
+    def __len__(self):
+        self.load()
+        return len(self._calibrations)
+
+    def load(self):
+        if self._index is not None:
+            return
+        self._index = HashIndex()
+        self._aspects = []
+        self._calibrations = []
+        if not os.path.exists(self._path):
+            return
+        hashes = []
+        with open(self._path, 'rb') as f:
+            for line in f:
+                fields = line.split(None, 2)
+                if len(fields) < 3 or not line.endswith('\n'):
+                    # e.g. a line cut short by a crash
+                    continue
+                try:
+                    hashValue = int(fields[0], 16)
+                    aspect = float(fields[1])
+                except ValueError:
+                    continue
+                hashes.append(hashValue)
+                self._aspects.append(aspect)
+                self._calibrations.append(fields[2])
+        self._index.extend(hashes)
+
+    def add(self, hashValue, size, calibration):
+        '''
+        Save a calibration, as returned by PlotScene.calibration, for an
+        image with the given hash and (width, height).
+        '''
+        self.load()
+        width, height = size
+        calibration = dict(calibration)
+        calibration['corners'] = [[float(x) / width, float(y) / height]
+                                  for x, y in calibration['corners']]
+        aspect = float(width) / height
+        text = json.dumps(calibration)
+        directory = os.path.dirname(self._path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self._path, 'ab+') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != '\n':
+                    # Don't join a line that was cut short
+                    f.write('\n')
+            f.write('{:016x} {!r} {}\n'.format(hashValue, aspect, text))
+        self._index.add(hashValue)
+        self._aspects.append(aspect)
+        self._calibrations.append(text)
+
+    def match(self, hashValue, size):
+        '''
+        Returns the calibration of the nearest template for an image with
+        the given hash and (width, height), with its corners scaled to that
+        size, or None if there's no template close enough. Of equally near
+        templates, the newest one wins.
+        '''
+        self.load()
+        width, height = size
+        aspect = float(width) / height
+        matches = [(distance, -key)
+                   for distance, key in self._index.query(hashValue)
+                   if abs(self._aspects[key] / aspect - 1.) <=
+                   ASPECT_TOLERANCE]
+        for distance, key in sorted(matches):
+            try:
+                calibration = json.loads(self._calibrations[-key])
+            except ValueError:
+                # A line cut short by a crash, and ended by a later add
+                continue
+            calibration['corners'] = [(x * width, y * height)
+                                      for x, y in calibration['corners']]
+            return calibration
+        return None
@@ -0,0 +1,524 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import abc
+import os.path
+from collections import OrderedDict
+
+# third party imports
+import numpy
+from PySide import QtGui, QtCore
+from PySide.QtCore import Qt
+
+# local imports
+from plotliberator.image_array import arrayToImage
+
+DEFAULT_TILE_SIZE = 512
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024  # bytes
+
+# Pre-scaled mipmap levels. Together with the full resolution image, these
+# cover ZoomableGraphicsView.zoomLevels with a pre-scaled level no more than
+# twice the size of the painted image.
+MIPMAP_SCALES = (0.5, 0.25, 0.125)
+
+# The mipmap levels count against the tile cache budget, and only the
+# smallest levels that fit in this fraction of it are built
+MIPMAP_BUDGET_FRACTION = 0.5
+
+
+class TileCache(object):
+    '''
+    A least recently used cache of decoded tiles, which evicts the oldest
+    tiles when the total size exceeds the memory budget (in bytes). Memory
+    reserved for something else, e.g. mipmap levels, counts against the
+    budget too.
+    '''
+
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        self._tiles = OrderedDict()
+        self._nbytes = 0
+        self._reserved = 0
+        self._budget = budget
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+    def budget(self):
+        return self._budget
+
+    def setBudget(self, budget):
+        self._budget = budget
+        self._evict()
+
+    def nbytes(self):
+        return self._nbytes
+
+    def reserved(self):
+        return self._reserved
+
+    def setReserved(self, nbytes):
+        '''
+        Set the memory held outside the cache that counts against its
+        budget, in bytes.
+        '''
+        self._reserved = nbytes
+        self._evict()
+
+    def get(self, key):
+        '''
+        Returns the tile for key, or None if it isn't cached.
+        '''
+        try:
+            tile, nbytes = self._tiles.pop(key)
+        except KeyError:
+            return None
+        self._tiles[key] = tile, nbytes  # mark as most recently used
+        return tile
+
+    def put(self, key, tile, nbytes):
+        if key in self._tiles:
+            self._nbytes -= self._tiles.pop(key)[1]
+        self._tiles[key] = tile, nbytes
+        self._nbytes += nbytes
+        self._evict()
+
+    def clear(self):
+        self._tiles.clear()
+        self._nbytes = 0
+
+    def _evict(self):
+        # Always keep the most recent tile, even if it's over budget
+        while (self._nbytes + self._reserved > self._budget and
+               len(self._tiles) > 1):
+            _key, (_tile, nbytes) = self._tiles.popitem(last=False)
+            self._nbytes -= nbytes
+
+
+class ImageSource(object):
+    '''
+    Base class for images that are decoded a region at a time. Subclasses
+    implement size() and region().
+    '''
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def size(self):
+        '''Returns the full image size as a QSize'''
+
+    def width(self):
+        return self.size().width()
+
+    def height(self):
+        return self.size().height()
+
+    def isNull(self):
+        return self.size().isEmpty()
+
+    def nbytes(self):
+        '''Returns the memory held by decoded pixels, in bytes'''
+        return 0
+
+    def isDecoded(self):
+        '''
+        Returns True if the full image is kept decoded, so image() is cheap
+        '''
+        return False
+
+    @abc.abstractmethod
+    def region(self, rect):
+        '''Returns a QImage of the given QRect of the image'''
+
+    def image(self):
+        '''
+        Returns the full image as a QImage. Unless isDecoded(), this decodes
+        (or renders) the whole image on every call, so callers that need it
+        more than once should keep it.
+        '''
+        return self.region(QtCore.QRect(QtCore.QPoint(0, 0), self.size()))
+
+    def scaled(self, size):
+        '''Returns the full image smoothly scaled to the given QSize'''
+        return self.image().scaled(size, Qt.IgnoreAspectRatio,
+                                   Qt.SmoothTransformation)
+
+
+class MemoryImageSource(ImageSource):
+    '''
+    An ImageSource for an already decoded QImage.
+    '''
+
+    def __init__(self, image):
+        self._image = image
+
+    def size(self):
+        return self._image.size()
+
+    def region(self, rect):
+        return self._image.copy(rect)
+
+    def image(self):
+        return self._image
+
+    def nbytes(self):
+        return self._image.byteCount()
+
+    def isDecoded(self):
+        return True
+
+
+class FileImageSource(ImageSource):
+    '''
+    An ImageSource for an image file. If the file format supports clip
+    rects, only the requested regions are decoded. Otherwise, the image is
+    decoded once and kept as a QImage (but never as a full QPixmap).
+    '''
+
+    def __init__(self, path, image=None):
+        '''
+        If the file has already been decoded, pass the QImage as image.
+        '''
+        self._path = path
+        self._image = image
+        if image is not None:
+            self._size = image.size()
+            return
+        reader = QtGui.QImageReader(path)
+        self._size = reader.size()
+        if not self.isLazy(reader):
+            self._image = reader.read()
+            self._size = self._image.size()
+
+    @staticmethod
+    def isLazy(reader):
+        '''
+        Returns True if a QImageReader's file can be decoded a region at a
+        time, without decoding the full image.
+        '''
+        return (reader.supportsOption(QtGui.QImageIOHandler.ClipRect) and
+                reader.size().isValid())
+
+    def path(self):
+        return self._path
+
+    def size(self):
+        return self._size
+
+    def region(self, rect):
+        if self._image is not None:
+            return self._image.copy(rect)
+        reader = QtGui.QImageReader(self._path)
+        reader.setClipRect(rect)
+        return reader.read()
+
+    def image(self):
+        if self._image is not None:
+            return self._image
+        return QtGui.QImageReader(self._path).read()
+
+    def nbytes(self):
+        if self._image is None:
+            return 0
+        return self._image.byteCount()
+
+    def isDecoded(self):
+        return self._image is not None
+
+    def scaled(self, size):
+        if self._image is None:
+            reader = QtGui.QImageReader(self._path)
+            if reader.supportsOption(QtGui.QImageIOHandler.ScaledSize):
+                # Let the decoder downsample, e.g. JPEG DCT scaling
+                reader.setScaledSize(size)
+                return reader.read()
+        return super(FileImageSource, self).scaled(size)
+
+
+class ArrayImageSource(ImageSource):
+    '''
+    An ImageSource for a (height, width) grayscale or
+    (height, width, 3 or 4) RGB(A) uint8 array. If given a path to a .npy
+    file, the array is memory-mapped, so only the requested regions are
+    read from disk.
+    '''
+
+    def __init__(self, pixels):
+        if isinstance(pixels, basestring):
+            pixels = numpy.load(pixels, mmap_mode='r')
+        if pixels.dtype != numpy.uint8 or pixels.ndim not in (2, 3):
+            raise ValueError('expected a 2D or 3D uint8 array')
+        self._pixels = pixels
+
+    def size(self):
+        height, width = self._pixels.shape[:2]
+        return QtCore.QSize(width, height)
+
+    def nbytes(self):
+        if isinstance(self._pixels, numpy.memmap):
+            return 0
+        return self._pixels.nbytes
+
+    def region(self, rect):
+        return arrayToImage(self._pixels[rect.top():rect.bottom() + 1,
+                                         rect.left():rect.right() + 1])
+
+    def scaled(self, size):
+        # Subsample before converting, so the full array is never copied
+        step = max(min(self.width() // max(size.width(), 1),
+                       self.height() // max(size.height(), 1)), 1)
+        image = arrayToImage(self._pixels[::step, ::step])
+        return image.scaled(size, Qt.IgnoreAspectRatio,
+                            Qt.SmoothTransformation)
+
+
+def openImageSource(path):
+    '''
+    Returns an ImageSource for the given file path.
+    '''
+    if os.path.splitext(path)[1].lower() == '.npy':
+        return ArrayImageSource(path)
+    return FileImageSource(path)
+
+
+class MipmapBuilder(QtCore.QThread):
+    '''
+    Builds the mipmap levels of an ImageSource in the background, emitting
+    levelReady(source, scale, image) as each level is finished.
+    '''
+    levelReady = QtCore.Signal(object, float, object)
+
+    def __init__(self, source, scales=MIPMAP_SCALES, parent=None):
+        super(MipmapBuilder, self).__init__(parent)
+        self._source = source
+        self._scales = sorted(scales, reverse=True)
+        self._canceled = False
+
+    def cancel(self):
+        self._canceled = True
+
+    def run(self):
+        width = self._source.width()
+        height = self._source.height()
+        previous = None
+        for scale in self._scales:
+            if self._canceled:
+                return
+            size = QtCore.QSize(max(int(round(width * scale)), 1),
+                                max(int(round(height * scale)), 1))
+            if previous is None:
+                level = self._source.scaled(size)
+            else:
+                # Each level is filtered from the previous (larger) one
+                level = previous.scaled(size, Qt.IgnoreAspectRatio,
+                                        Qt.SmoothTransformation)
+            if level.isNull():
+                return
+            self.levelReady.emit(self._source, scale, level)
+            previous = level
+
+
+class TiledImageItem(QtGui.QGraphicsObject):
+    '''
+    A QGraphicsItem that draws an ImageSource as a grid of tiles. Tiles are
+    only decoded when they intersect the exposed area, and are kept as
+    pixmaps in a TileCache.
+
+    When zoomed out, tiles are drawn from the smallest mipmap level that is
+    at least as large as the painted image. The mipmap levels are built in
+    the background whenever the source changes, and are charged to the tile
+    cache's budget.
+    '''
+
+    _source = None
+    _builder = None
+
+    def __init__(self, tileSize=DEFAULT_TILE_SIZE,
+                 cacheBudget=DEFAULT_CACHE_BUDGET, parent=None, scene=None):
+        if parent is not None and scene is not None:
+            raise ValueError("Either parent or scene must be None")
+        super(TiledImageItem, self).__init__(parent)
+        self._tileSize = tileSize
+        self._cache = TileCache(cacheBudget)
+        self._levels = {}
+        self._mipmapsEnabled = True
+        self._retiredBuilders = set()
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
+        if scene is not None:
+            scene.addItem(self)
+
+    def source(self):
+        return self._source
+
+    def setSource(self, source):
+        self.prepareGeometryChange()
+        self._source = source
+        self._levels = {}
+        self._cache.clear()
+        self._cache.setReserved(0)
+        self._startBuilder()
+        self.update()
+
+    def cache(self):
+        return self._cache
+
+    def nbytes(self):
+        '''
+        Returns the memory held by cached tiles and mipmap levels, in bytes.
+        '''
+        return self._cache.nbytes() + sum(level.nbytes()
+                                          for level in self._levels.values())
+
+    def mipmapScales(self):
+        '''
+        Returns the scales of the mipmap levels to build for the source:
+        the smallest of MIPMAP_SCALES whose levels together fit in
+        MIPMAP_BUDGET_FRACTION of the cache budget. Zooms that would use a
+        larger level are drawn from full resolution tiles instead.
+        '''
+        pixels = self._source.width() * self._source.height()
+        budget = self._cache.budget() * MIPMAP_BUDGET_FRACTION
+        scales = []
+        nbytes = 0
+        for scale in sorted(MIPMAP_SCALES):
+            nbytes += 4 * pixels * scale * scale
+            if nbytes > budget:
+                break
+            scales.append(scale)
+        return scales
+
+    def mipmapsEnabled(self):
+        return self._mipmapsEnabled
+
+    def setMipmapsEnabled(self, enabled):
+        self._mipmapsEnabled = enabled
+        self.update()
+
+    def _startBuilder(self):
+        if self._builder is not None:
+            # Let the old builder finish in the background. Its levels are
+            # ignored, since they're for a different source.
+            builder = self._builder
+            builder.cancel()
+            self._retiredBuilders.add(builder)
+            builder.finished.connect(
+                        lambda: self._retiredBuilders.discard(builder))
+            self._builder = None
+        if self._source is None or self._source.isNull():
+            return
+        scales = self.mipmapScales()
+        if not scales:
+            return
+        self._builder = MipmapBuilder(self._source, scales)
+        self._builder.levelReady.connect(self._addLevel)
+        self._builder.start(QtCore.QThread.LowPriority)
+
+    @QtCore.Slot(object, float, object)
+    def _addLevel(self, source, scale, image):
+        if source is not self._source:
+            return
+        self._levels[scale] = MemoryImageSource(image)
+        self._cache.setReserved(sum(level.nbytes()
+                                    for level in self._levels.values()))
+        self.update()
+
+    def levelScale(self, levelOfDetail):
+        '''
+        Returns the scale of the smallest available level that is at least
+        as large as the painted image, or 1. for the full resolution image.
+        '''
+        if not self._mipmapsEnabled:
+            return 1.
+        scales = [scale for scale in self._levels if scale >= levelOfDetail]
+        if not scales:
+            return 1.
+        return min(scales)
+
+    def boundingRect(self):
+        if self._source is None:
+            return QtCore.QRectF()
+        return QtCore.QRectF(0., 0., self._source.width(),
+                             self._source.height())
+
+    def levelSource(self, scale):
+        if scale == 1.:
+            return self._source
+        return self._levels[scale]
+
+    def tileRect(self, column, row, scale=1.):
+        '''
+        Returns the QRect of a level's image covered by a tile
+        '''
+        size = self._tileSize
+        rect = QtCore.QRect(column * size, row * size, size, size)
+        return rect.intersected(QtCore.QRect(QtCore.QPoint(0, 0),
+                                        self.levelSource(scale).size()))
+
+    def tile(self, column, row, scale=1.):
+        '''
+        Returns a level's tile pixmap, decoding it if it's not cached.
+        '''
+        key = (scale, column, row)
+        pixmap = self._cache.get(key)
+        if pixmap is None:
+            image = self.levelSource(scale).region(
+                                        self.tileRect(column, row, scale))
+            pixmap = QtGui.QPixmap.fromImage(image)
+            nbytes = pixmap.width() * pixmap.height() * pixmap.depth() // 8
+            self._cache.put(key, pixmap, nbytes)
+        return pixmap
+
+    def paint(self, painter, option, widget=None):
+        if self._source is None:
+            return
+        exposed = option.exposedRect.intersected(self.boundingRect())
+        if exposed.isEmpty():
+            return
+        # Make pixmap zooming look pretty. When zoomed out, the chosen
+        # level is less than twice the painted size, so filtering is cheap.
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+        scale = self.levelScale(
+                option.levelOfDetailFromTransform(painter.worldTransform()))
+        if scale != 1.:
+            # Map level pixels onto the full resolution image
+            levelSize = self.levelSource(scale).size()
+            sx = levelSize.width() / float(self._source.width())
+            sy = levelSize.height() / float(self._source.height())
+            painter.save()
+            painter.scale(1. / sx, 1. / sy)
+            exposed = QtCore.QRectF(exposed.left() * sx, exposed.top() * sy,
+                                    exposed.width() * sx,
+                                    exposed.height() * sy)
+        size = self._tileSize
+        firstColumn = int(exposed.left()) // size
+        lastColumn = int(exposed.right()) // size
+        firstRow = int(exposed.top()) // size
+        lastRow = int(exposed.bottom()) // size
+        for row in xrange(firstRow, lastRow + 1):
+            for column in xrange(firstColumn, lastColumn + 1):
+                rect = self.tileRect(column, row, scale)
+                if rect.isEmpty():
+                    continue
+                painter.drawPixmap(rect.topLeft(),
+                                   self.tile(column, row, scale))
+        if scale != 1.:
+            painter.restore()
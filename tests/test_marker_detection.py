@@ -0,0 +1,107 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from collections import deque
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.marker_detection import maskRuns, labelRuns, detectMarkers
+
+
+def floodLabels(mask):
+    '''
+    Returns a (height, width) array of the 8-connected component of each
+    pixel, numbered from 1 in scan order, or 0 for background.
+    '''
+    height, width = mask.shape
+    labels = numpy.zeros((height, width), dtype=int)
+    count = 0
+    for y, x in zip(*numpy.nonzero(mask)):
+        if labels[y, x]:
+            continue
+        count += 1
+        labels[y, x] = count
+        queue = deque([(y, x)])
+        while queue:
+            cy, cx = queue.popleft()
+            for ny in xrange(max(cy - 1, 0), min(cy + 2, height)):
+                for nx in xrange(max(cx - 1, 0), min(cx + 2, width)):
+                    if mask[ny, nx] and not labels[ny, nx]:
+                        labels[ny, nx] = count
+                        queue.append((ny, nx))
+    return labels
+
+
+class TestLabelRuns(unittest.TestCase):
+
+    def test_runs(self):
+        mask = numpy.array([[0, 1, 1, 0, 1],
+                            [1, 0, 0, 0, 1]], dtype=bool)
+        rows, starts, stops = maskRuns(mask)
+        self.assertEqual(rows.tolist(), [0, 0, 1, 1])
+        self.assertEqual(starts.tolist(), [1, 4, 0, 4])
+        self.assertEqual(stops.tolist(), [3, 5, 1, 5])
+
+    def test_diagonal_and_u_shapes(self):
+        # A diagonal is 8-connected, and a U only joins at the bottom
+        mask = numpy.array([[1, 0, 0, 1, 0, 1],
+                            [0, 1, 0, 1, 0, 1],
+                            [0, 0, 0, 1, 1, 1]], dtype=bool)
+        rows, starts, stops = maskRuns(mask)
+        labels = labelRuns(rows, starts, stops, mask.shape[1])
+        self.assertEqual(len(numpy.unique(labels)), 2)
+
+    def test_matches_flood_fill(self):
+        state = numpy.random.RandomState(0)
+        for density in (0.3, 0.5, 0.6):
+            mask = state.uniform(size=(40, 50)) < density
+            rows, starts, stops = maskRuns(mask)
+            labels = labelRuns(rows, starts, stops, mask.shape[1])
+            expected = floodLabels(mask)
+            # Both labelings must split the runs the same way
+            runLabels = expected[rows, starts]
+            pairs = set(zip(labels.tolist(), runLabels.tolist()))
+            self.assertEqual(len(pairs), len(numpy.unique(labels)))
+            self.assertEqual(len(pairs), expected.max())
+
+
+class TestDetectMarkers(unittest.TestCase):
+
+    def test_markers(self):
+        mask = numpy.zeros((60, 80), dtype=bool)
+        mask[10:15, 20:25] = True  # a marker centered at (22.5, 12.5)
+        mask[30:34, 50:54] = True  # a marker centered at (52, 32)
+        mask[50, 5:75] = True  # a line
+        mask[2, 2] = True  # noise
+        centers = detectMarkers(mask)
+        self.assertEqual(sorted(map(tuple, centers.tolist())),
+                         [(22.5, 12.5), (52., 32.)])
+
+    def test_empty(self):
+        mask = numpy.zeros((5, 5), dtype=bool)
+        self.assertEqual(detectMarkers(mask).shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
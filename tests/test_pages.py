@@ -0,0 +1,121 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+from PySide import QtCore
+
+# local imports
+from plotliberator.pages import tiffDirectories, pageCount, readPage
+from plotliberator.image_array import imageToArray
+
+
+def writeTiff(path, pages, order='<'):
+    '''
+    Write (height, width) uint8 arrays as the grayscale pages of an
+    uncompressed TIFF file.
+    '''
+    data = bytearray(('II*\x00' if order == '<' else 'MM\x00*') +
+                     struct.pack(order + 'I', 0))
+    # Where the offset of the next directory goes
+    link = 4
+    for pixels in pages:
+        height, width = pixels.shape
+        pixelOffset = len(data)
+        data += numpy.ascontiguousarray(pixels, dtype=numpy.uint8).tostring()
+        if len(data) % 2:
+            data += '\x00'  # directories start on a word boundary
+        struct.pack_into(order + 'I', data, link, len(data))
+        # (tag, type, value), with type 3 for SHORT and 4 for LONG
+        entries = [(256, 3, width), (257, 3, height), (258, 3, 8),
+                   (259, 3, 1), (262, 3, 1), (273, 4, pixelOffset),
+                   (277, 3, 1), (278, 3, height), (279, 4, height * width)]
+        data += struct.pack(order + 'H', len(entries))
+        for tag, kind, value in entries:
+            if kind == 3:
+                data += struct.pack(order + 'HHIHH', tag, kind, 1, value, 0)
+            else:
+                data += struct.pack(order + 'HHII', tag, kind, 1, value)
+        link = len(data)
+        data += struct.pack(order + 'I', 0)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class TestPages(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Image format plugins are loaded through the application
+        cls.app = (QtCore.QCoreApplication.instance() or
+                   QtCore.QCoreApplication([]))
+        cls.tempdir = tempfile.mkdtemp()
+        cls.pages = [numpy.full((3, 4), 20 + 100 * i, dtype=numpy.uint8)
+                     for i in xrange(3)]
+        for pixels in cls.pages:
+            pixels[0, 0] = 255
+        cls.little = os.path.join(cls.tempdir, 'little.tif')
+        cls.big = os.path.join(cls.tempdir, 'big.tif')
+        writeTiff(cls.little, cls.pages, '<')
+        writeTiff(cls.big, cls.pages, '>')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tempdir)
+
+    def test_directories(self):
+        for path, order in ((self.little, '<'), (self.big, '>')):
+            directories = tiffDirectories(path)
+            self.assertEqual(directories[0], order)
+            self.assertEqual(len(directories[1]), 3)
+
+    def test_not_tiff(self):
+        path = os.path.join(self.tempdir, 'plot.txt')
+        with open(path, 'w') as f:
+            f.write('not an image')
+        self.assertIs(tiffDirectories(path), None)
+        self.assertEqual(pageCount(path), 1)
+        self.assertIs(tiffDirectories(path + '.missing'), None)
+
+    def test_page_count(self):
+        self.assertEqual(pageCount(self.little), 3)
+        self.assertEqual(pageCount(self.big), 3)
+
+    def test_read_pages(self):
+        for path in (self.little, self.big):
+            for page, pixels in enumerate(self.pages):
+                image = readPage(path, page)
+                self.assertEqual((image.width(), image.height()), (4, 3))
+                gray = imageToArray(image)[..., 0]
+                self.assertEqual(gray.tolist(), pixels.tolist())
+
+    def test_missing_page(self):
+        self.assertRaises(IOError, readPage, self.little, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
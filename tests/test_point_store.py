@@ -0,0 +1,170 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.point_store import PointStore, pointsInPolygon
+
+
+def evenOdd(x, y, polygon):
+    '''
+    Returns whether (x, y) is inside a polygon, by counting the edges that
+    cross its row to the right of it.
+    '''
+    inside = False
+    x1, y1 = polygon[-1]
+    for x2, y2 in polygon:
+        if (y1 <= y) != (y2 <= y):
+            if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class TestPointStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = PointStore(cellSize=10.)
+        self.ids = self.store.addMany([(1., 1.), (15., 5.), (32., 40.)])
+
+    def assertConsistent(self):
+        '''
+        Check the rows, ids and spatial index against each other
+        '''
+        store = self.store
+        ids = store.ids().tolist()
+        self.assertEqual(sorted(store._rows.items()),
+                         sorted((pointId, row)
+                                for row, pointId in enumerate(ids)))
+        indexed = sorted(pointId for cellIds in store._cells.values()
+                         for pointId in cellIds)
+        self.assertEqual(indexed, sorted(ids))
+        for pointId in ids:
+            x, y = store.position(pointId)
+            self.assertIn(pointId, store._cells[store._cell(x, y)])
+
+    def test_add(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.ids.tolist(), [0, 1, 2])
+        pointId = self.store.add(50., 50.)
+        self.assertEqual(pointId, 3)
+        self.assertEqual(self.store.position(pointId), (50., 50.))
+        self.assertIn(pointId, self.store)
+        self.assertConsistent()
+
+    def test_grows(self):
+        ids = self.store.addMany(numpy.random.RandomState(0).uniform(
+                                                    0, 100, (1000, 2)))
+        self.assertEqual(len(self.store), 1003)
+        self.assertEqual(self.store.rowsOf(ids.tolist()).tolist(),
+                         range(3, 1003))
+        self.assertConsistent()
+
+    def test_move(self):
+        self.store.move(0, 2., 2.)
+        self.store.moveMany([1, 2], [(55., 5.), (33., 41.)])
+        self.assertEqual(self.store.positions().tolist(),
+                         [[2, 2], [55, 5], [33, 41]])
+        self.assertConsistent()
+
+    def test_remove(self):
+        self.store.remove(0)
+        self.assertNotIn(0, self.store)
+        self.assertEqual(len(self.store), 2)
+        self.assertConsistent()
+
+    def test_remove_many_keeps_order(self):
+        ids = self.store.addMany([(5., 5.), (6., 6.)])
+        self.store.removeMany([1, int(ids[0])])
+        self.assertEqual(self.store.ids().tolist(), [0, 2, 4])
+        self.assertConsistent()
+
+    def test_clear(self):
+        self.store.clear()
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.takeChanges(), (True, set()))
+        # Ids aren't reused
+        self.assertEqual(self.store.add(0., 0.), 3)
+
+    def test_changes(self):
+        self.assertEqual(self.store.takeChanges(), (False, set([0, 1, 2])))
+        self.assertFalse(self.store.hasChanges())
+        self.store.move(1, 0., 0.)
+        self.store.remove(2)
+        self.assertTrue(self.store.hasChanges())
+        self.assertEqual(self.store.takeChanges(), (False, set([1, 2])))
+
+    def test_nearest(self):
+        self.assertEqual(self.store.nearest(14., 6., 5.), 1)
+        self.assertEqual(self.store.nearest(30., 38., 5.), 2)
+        self.assertIs(self.store.nearest(70., 70., 5.), None)
+        # The nearest of several points a few cells away
+        self.assertEqual(self.store.nearest(20., 20., 30.), 1)
+
+    def test_in_rect(self):
+        self.assertEqual(sorted(self.store.inRect(0., 0., 20., 10.).tolist()),
+                         [0, 1])
+        self.assertEqual(self.store.inRect(100., 100., 200., 200.).tolist(),
+                         [])
+
+
+
+class TestPolygons(unittest.TestCase):
+
+    # A concave "C", and a self-intersecting star whose center is outside
+    # by the even-odd rule
+    shapes = [[(0., 0.), (90., 0.), (90., 20.), (20., 20.), (20., 70.),
+               (90., 70.), (90., 90.), (0., 90.)],
+              [(50., 0.), (79., 90.), (2., 35.), (98., 35.), (21., 90.)]]
+
+    def setUp(self):
+        state = numpy.random.RandomState(0)
+        self.points = state.uniform(-5., 95., size=(2000, 2))
+
+    def test_points_in_polygon(self):
+        for polygon in self.shapes:
+            expected = [evenOdd(x, y, polygon)
+                        for x, y in self.points.tolist()]
+            inside = pointsInPolygon(self.points, numpy.array(polygon))
+            self.assertEqual(inside.tolist(), expected)
+        inside = pointsInPolygon(numpy.array([[50., 50.], [50., 10.]]),
+                                 numpy.array(self.shapes[1]))
+        self.assertEqual(inside.tolist(), [False, True])
+
+    def test_in_polygon(self):
+        store = PointStore(cellSize=7.)
+        ids = store.addMany(self.points)
+        for polygon in self.shapes:
+            inside = pointsInPolygon(self.points, numpy.array(polygon))
+            self.assertEqual(sorted(store.inPolygon(polygon).tolist()),
+                             ids[inside].tolist())
+        self.assertEqual(store.inPolygon([(0., 0.), (50., 50.)]).tolist(),
+                         [])
+        self.assertEqual(store.inPolygon([(200., 200.), (300., 200.),
+                                          (250., 300.)]).tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
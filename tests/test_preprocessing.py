@@ -0,0 +1,139 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from math import radians, tan
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.preprocessing import (grayscale, medianFilter,
+                                         removeGridlines, otsuLevel,
+                                         threshold, estimateSkew, Pipeline,
+                                         BAND_HEIGHT)
+
+
+def ruledImage(angle, size=200):
+    '''
+    Returns a white image with dark rows of ink sloping at angle degrees
+    '''
+    gray = numpy.full((size, size), 255, dtype=numpy.uint8)
+    x = numpy.arange(size)
+    for y0 in xrange(20, size - 20, 20):
+        y = numpy.round(y0 + x * tan(radians(angle))).astype(int)
+        inside = (y >= 0) & (y < size)
+        gray[y[inside], x[inside]] = 0
+    return gray
+
+
+class TestGrayscale(unittest.TestCase):
+
+    def test_luma(self):
+        pixels = numpy.array([[[255, 255, 255], [200, 100, 50],
+                               [0, 0, 0]]], dtype=numpy.uint8)
+        self.assertEqual(grayscale(pixels).tolist(), [[255, 124, 0]])
+
+    def test_channels(self):
+        pixels = numpy.array([[[50, 100, 200, 255]]], dtype=numpy.uint8)
+        self.assertEqual(grayscale(pixels, (2, 1, 0)).tolist(), [[124]])
+
+    def test_bands(self):
+        pixels = numpy.full((BAND_HEIGHT * 2 + 3, 5, 3), 255,
+                            dtype=numpy.uint8)
+        gray = grayscale(pixels)
+        self.assertEqual(gray.dtype, numpy.uint8)
+        self.assertTrue((gray == 255).all())
+
+
+class TestMedianFilter(unittest.TestCase):
+
+    def test_removes_speckle(self):
+        gray = numpy.full((10, 10), 255, dtype=numpy.uint8)
+        gray[4, 6] = 0
+        self.assertTrue((medianFilter(gray) == 255).all())
+
+    def test_matches_sorting(self):
+        gray = numpy.random.RandomState(0).randint(0, 256, (40, 30))
+        gray = gray.astype(numpy.uint8)
+        for size in (3, 5):
+            radius = size // 2
+            padded = numpy.pad(gray, radius, 'edge')
+            windows = numpy.stack([padded[i:i + 40, j:j + 30]
+                                   for i in xrange(size)
+                                   for j in xrange(size)])
+            expected = numpy.median(windows, axis=0)
+            self.assertTrue((medianFilter(gray, size) == expected).all())
+
+
+class TestRemoveGridlines(unittest.TestCase):
+
+    def test_removes_lines_and_keeps_curve(self):
+        gray = numpy.full((50, 60), 255, dtype=numpy.uint8)
+        gray[20] = 0
+        gray[:, 30:32] = 0
+        gray[5:15, 10] = 0
+        cleaned = removeGridlines(gray)
+        self.assertTrue((cleaned[20] == 255).all())
+        self.assertTrue((cleaned[:, 30:32] == 255).all())
+        self.assertTrue((cleaned[5:15, 10] == 0).all())
+
+
+class TestThreshold(unittest.TestCase):
+
+    def test_otsu(self):
+        gray = numpy.full((20, 20), 220, dtype=numpy.uint8)
+        gray[5:10] = 30
+        level = otsuLevel(gray)
+        self.assertTrue(30 < level <= 220)
+        binary = threshold(gray)
+        self.assertEqual(sorted(numpy.unique(binary).tolist()), [0, 255])
+        self.assertTrue((binary[5:10] == 0).all())
+        self.assertTrue((binary[10:] == 255).all())
+
+
+class TestDeskew(unittest.TestCase):
+
+    def test_estimate_skew(self):
+        for angle in (-2., 0., 3.):
+            self.assertAlmostEqual(estimateSkew(ruledImage(angle)), angle,
+                                   delta=0.2)
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_caches_stages(self):
+        pixels = numpy.random.RandomState(1).randint(0, 256, (30, 30, 3))
+        pixels = pixels.astype(numpy.uint8)
+        pipeline = Pipeline()
+        first = pipeline.run(pixels, {'denoise': {}, 'threshold': {}},
+                             imageHash='a')
+        second = pipeline.run(pixels,
+                              {'denoise': {}, 'threshold': {'level': 100}},
+                              imageHash='a')
+        self.assertIs(first['denoise'], second['denoise'])
+        self.assertIsNot(first['threshold'], second['threshold'])
+        # Skipped stages pass their input through
+        self.assertIs(first['deskew'], first['grayscale'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+
+# local imports
+from plotliberator.point_store import PointStore
+from plotliberator.session import (SessionWriter, SessionFormatError,
+                                   loadSession, MAGIC, HEADER_LENGTH,
+                                   RECORD_DTYPE)
+
+METADATA = {'calibration': {'x1': 0., 'x2': 1.}, 'imagePath': 'plot.png'}
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'test.plsession')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_round_trip(self):
+        store = PointStore()
+        store.addMany([(1., 2.), (3., 4.), (5., 6.)])
+        SessionWriter(self.path).save(METADATA, store)
+        metadata, positions = loadSession(self.path)
+        self.assertEqual(metadata, METADATA)
+        self.assertEqual(positions.tolist(), [[1, 2], [3, 4], [5, 6]])
+
+    def test_incremental_saves(self):
+        store = PointStore()
+        ids = store.addMany([(1., 2.), (3., 4.), (5., 6.)])
+        writer = SessionWriter(self.path)
+        writer.save(METADATA, store)
+        size = os.path.getsize(self.path)
+        self.assertFalse(writer.needsSave(METADATA, store))
+
+        store.move(int(ids[0]), 7., 8.)
+        store.remove(int(ids[1]))
+        store.add(9., 10.)
+        self.assertTrue(writer.needsSave(METADATA, store))
+        writer.save(METADATA, store)
+        # Only the three changed points were appended
+        self.assertEqual(os.path.getsize(self.path),
+                         size + 3 * RECORD_DTYPE.itemsize)
+        _metadata, positions = loadSession(self.path)
+        self.assertEqual(positions.tolist(), [[7, 8], [5, 6], [9, 10]])
+
+    def test_metadata_change_rewrites(self):
+        store = PointStore()
+        store.addMany([(1., 2.)])
+        writer = SessionWriter(self.path)
+        writer.save(METADATA, store)
+        metadata = dict(METADATA, imagePath='other.png')
+        self.assertTrue(writer.needsSave(metadata, store))
+        writer.save(metadata, store)
+        self.assertEqual(loadSession(self.path)[0], metadata)
+
+    def test_partial_record(self):
+        store = PointStore()
+        store.addMany([(1., 2.), (3., 4.)])
+        SessionWriter(self.path).save(METADATA, store)
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00' * (RECORD_DTYPE.itemsize - 1))
+        self.assertEqual(loadSession(self.path)[1].tolist(),
+                         [[1, 2], [3, 4]])
+
+    def assertFormatError(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        self.assertRaises(SessionFormatError, loadSession, self.path)
+
+    def test_format_errors(self):
+        self.assertFormatError(b'not a session')
+        self.assertFormatError(MAGIC + b'\x01')
+        self.assertFormatError(MAGIC + HEADER_LENGTH.pack(100) + b'{"cal')
+        self.assertFormatError(MAGIC + HEADER_LENGTH.pack(5) + b'{"cal')
+
+
+if __name__ == '__main__':
+    unittest.main()
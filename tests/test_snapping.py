@@ -0,0 +1,111 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.snapping import (nearestOffsets, buildSnapMap, SnapMap,
+                                    NO_FEATURE)
+
+
+def bruteDistances(mask, maxDistance):
+    '''
+    Returns the squared distance from each pixel to its nearest feature, or
+    -1 if there's none within maxDistance.
+    '''
+    height, width = mask.shape
+    ys, xs = numpy.nonzero(mask)
+    result = numpy.empty((height, width), dtype=int)
+    for y in xrange(height):
+        for x in xrange(width):
+            dist2 = (xs - x) ** 2 + (ys - y) ** 2
+            nearest = dist2.min() if len(dist2) else -1
+            if nearest > maxDistance * maxDistance:
+                nearest = -1
+            result[y, x] = nearest
+    return result
+
+
+class TestNearestOffsets(unittest.TestCase):
+
+    def assertNearest(self, mask, offsetX, offsetY, maxDistance):
+        expected = bruteDistances(mask, maxDistance)
+        height, width = mask.shape
+        for y in xrange(height):
+            for x in xrange(width):
+                dx = int(offsetX[y, x])
+                dy = int(offsetY[y, x])
+                if expected[y, x] < 0:
+                    self.assertEqual((dx, dy), (NO_FEATURE, NO_FEATURE))
+                    continue
+                # Ties may pick any nearest feature
+                self.assertTrue(mask[y + dy, x + dx])
+                self.assertEqual(dx * dx + dy * dy, expected[y, x])
+
+    def test_matches_brute_force(self):
+        state = numpy.random.RandomState(0)
+        for density in (0.002, 0.02, 0.2):
+            mask = state.uniform(size=(30, 40)) < density
+            offsetX, offsetY = nearestOffsets(mask, 8)
+            self.assertEqual(offsetX.dtype, numpy.int8)
+            self.assertNearest(mask, offsetX, offsetY, 8)
+
+    def test_empty(self):
+        offsetX, offsetY = nearestOffsets(numpy.zeros((4, 5), bool), 3)
+        self.assertTrue((offsetX == NO_FEATURE).all())
+        self.assertTrue((offsetY == NO_FEATURE).all())
+
+
+class TestSnapMap(unittest.TestCase):
+
+    def test_bands_match_single_pass(self):
+        state = numpy.random.RandomState(1)
+        pixels = state.randint(0, 256, size=(70, 30, 4)).astype(numpy.uint8)
+        maskFunction = lambda band: band[..., 0] < 8
+        whole = buildSnapMap(pixels, maskFunction, 6, bandHeight=70)
+        banded = buildSnapMap(pixels, maskFunction, 6, bandHeight=16)
+        self.assertTrue((whole._offsetX == banded._offsetX).all())
+        self.assertTrue((whole._offsetY == banded._offsetY).all())
+        offsetX, offsetY = nearestOffsets(maskFunction(pixels), 6)
+        self.assertTrue((whole._offsetX == offsetX).all())
+        self.assertTrue((whole._offsetY == offsetY).all())
+
+    def test_canceled(self):
+        pixels = numpy.zeros((8, 8, 4), dtype=numpy.uint8)
+        self.assertIsNone(buildSnapMap(pixels, lambda band: band[..., 0] > 0,
+                                       isCanceled=lambda: True))
+
+    def test_snap(self):
+        mask = numpy.zeros((20, 20), dtype=bool)
+        mask[5, 7] = True
+        snapMap = SnapMap(*nearestOffsets(mask, 4))
+        self.assertEqual(snapMap.snap(9.3, 6.8), (7.5, 5.5))
+        self.assertEqual(snapMap.snap(7.5, 5.5), (7.5, 5.5))
+        self.assertIsNone(snapMap.snap(15, 15))
+        self.assertIsNone(snapMap.snap(-1, 5))
+        self.assertIsNone(snapMap.snap(5, 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+from cStringIO import StringIO
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.svg_import import (parseNumbers, parsePathData,
+                                      parseTransform, iterSvgPaths)
+
+nan = numpy.nan
+
+
+class TestParseNumbers(unittest.TestCase):
+
+    def test_separators(self):
+        self.assertEqual(parseNumbers('1,2 3\n4.5e1').tolist(),
+                         [1., 2., 3., 45.])
+
+    def test_packed(self):
+        self.assertEqual(parseNumbers('1-2.5.5+3').tolist(),
+                         [1., -2.5, .5, 3.])
+
+
+class TestParsePathData(unittest.TestCase):
+
+    def assertVertices(self, d, expected):
+        vertices = parsePathData(d)
+        self.assertEqual(vertices.shape, (len(expected), 2))
+        self.assertTrue(numpy.allclose(vertices, expected, equal_nan=True))
+
+    def test_absolute_lines(self):
+        self.assertVertices('M 1 2 L 3 4 L 5 6 M 7 8 L 9 10',
+                            [[1, 2], [3, 4], [5, 6], [nan, nan], [7, 8],
+                             [9, 10]])
+
+    def test_relative_commands(self):
+        self.assertVertices('m1,2 l1,1 h2 v-3 z l1 1',
+                            [[1, 2], [2, 3], [4, 3], [4, 0], [2, 3]])
+
+    def test_curve_end_points(self):
+        self.assertVertices('M0 0C1 1 2 2 3 3S4 4 5 5Q6 6 7 7T8 8'
+                            'A1 1 0 0 1 9 9',
+                            [[0, 0], [3, 3], [5, 5], [7, 7], [8, 8], [9, 9]])
+
+    def test_packed_numbers(self):
+        self.assertVertices('M1-2L3.5.5', [[1, -2], [3.5, .5]])
+
+    def test_implicit_lines(self):
+        self.assertVertices('M0 0 1 1 2 0', [[0, 0], [1, 1], [2, 0]])
+
+    def test_empty(self):
+        self.assertEqual(parsePathData('').shape, (0, 2))
+
+
+class TestParseTransform(unittest.TestCase):
+
+    def test_composition(self):
+        matrix = parseTransform('translate(10, 20) scale(2)')
+        self.assertTrue(numpy.allclose(matrix.dot([1, 1, 1]), [12, 22, 1]))
+
+    def test_rotate_about_point(self):
+        matrix = parseTransform('rotate(90 1 1)')
+        self.assertTrue(numpy.allclose(matrix.dot([2, 1, 1]), [1, 2, 1]))
+
+
+class TestIterSvgPaths(unittest.TestCase):
+
+    def test_paths(self):
+        svg = ('<svg xmlns="http://www.w3.org/2000/svg">'
+               '<defs><path d="M0 0L1 1"/></defs>'
+               '<g transform="translate(10 0)" style="stroke: red">'
+               '<path id="curve" d="M0 0L1 1"/>'
+               '<polyline points="0,0 2,2" stroke="blue"/>'
+               '</g>'
+               '<line x1="0" y1="0" x2="3" y2="4"/>'
+               '</svg>')
+        paths = list(iterSvgPaths(StringIO(svg), chunkSize=16))
+        self.assertEqual([path.index for path in paths], [0, 1, 2])
+        self.assertEqual(paths[0].elementId, 'curve')
+        self.assertEqual([path.stroke for path in paths],
+                         ['red', 'blue', None])
+        self.assertEqual(paths[0].vertices.tolist(), [[10, 0], [11, 1]])
+        self.assertEqual(paths[1].vertices.tolist(), [[10, 0], [12, 2]])
+        self.assertEqual(paths[2].vertexCount(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
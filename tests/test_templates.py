@@ -0,0 +1,124 @@
+#
+#   Copyright (c) 2014, Scott J Maddox
+#
+#   This file is part of Plot Liberator.
+#
+#   Plot Liberator is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU Affero General Public License as published
+#   by the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   Plot Liberator is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU Affero General Public License for more details.
+#
+#   You should have received a copy of the GNU Affero General Public License
+#   along with Plot Liberator.  If not, see <http://www.gnu.org/licenses/>.
+#
+#############################################################################
+
+# std lib imports
+import os.path
+import shutil
+import tempfile
+import unittest
+
+# third party imports
+import numpy
+
+# local imports
+from plotliberator.templates import (dHash, hammingDistances, HashIndex,
+                                     TemplateLibrary)
+
+
+def randomHashes(state, count):
+    return [int(value) for value in
+            state.randint(0, 1 << 32, size=count).astype(numpy.uint64) << 32 |
+            state.randint(0, 1 << 32, size=count).astype(numpy.uint64)]
+
+
+def flipBits(state, hashValue, count):
+    for bit in state.choice(64, count, replace=False):
+        hashValue ^= 1 << int(bit)
+    return hashValue
+
+
+class TestHashes(unittest.TestCase):
+
+    def test_dhash(self):
+        gray = numpy.tile(numpy.arange(9, 0, -1), (8, 1))
+        self.assertEqual(dHash(gray), (1 << 64) - 1)
+        self.assertEqual(dHash(gray[:, ::-1]), 0)
+        gray = numpy.zeros((8, 9))
+        gray[0, 0] = 1
+        self.assertEqual(dHash(gray), 1 << 63)
+
+    def test_hamming_distances(self):
+        state = numpy.random.RandomState(0)
+        hashes = randomHashes(state, 50)
+        query = hashes[0]
+        expected = [bin(h ^ query).count('1') for h in hashes]
+        distances = hammingDistances(numpy.array(hashes, numpy.uint64),
+                                     query)
+        self.assertEqual(distances.tolist(), expected)
+
+
+class TestHashIndex(unittest.TestCase):
+
+    def test_query_matches_brute_force(self):
+        state = numpy.random.RandomState(1)
+        query = randomHashes(state, 1)[0]
+        hashes = randomHashes(state, 1500)
+        hashes += [flipBits(state, query, count) for count in xrange(16)]
+        index = HashIndex(10)
+        # More than the initial capacity, added in two batches
+        self.assertEqual(index.extend(hashes[:700]), range(700))
+        self.assertEqual(index.extend(hashes[700:]), range(700, len(hashes)))
+        self.assertEqual(len(index), len(hashes))
+        expected = sorted((bin(h ^ query).count('1'), key)
+                          for key, h in enumerate(hashes))
+        expected = [match for match in expected if match[0] <= 10]
+        self.assertEqual(len(expected), 11)
+        self.assertEqual(index.query(query), expected)
+
+    def test_empty(self):
+        self.assertEqual(HashIndex().query(12345), [])
+
+
+class TestTemplateLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'templates', 'lib.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        calibration = {'corners': [[10, 20], [90, 20], [90, 70], [10, 70]],
+                       'xRange': [0, 1]}
+        library = TemplateLibrary(self.path)
+        library.add(0x0f0f, (100, 80), calibration)
+        library.add(0xffff0000, (100, 80), calibration)
+        # A line cut short by a crash is skipped
+        with open(self.path, 'ab') as f:
+            f.write('ffffffff00000000 1.25 {"corn')
+        library = TemplateLibrary(self.path)
+        self.assertEqual(len(library), 2)
+        match = library.match(0x0f0e, (200, 160))
+        self.assertEqual(match['corners'],
+                         [(20, 40), (180, 40), (180, 140), (20, 140)])
+        self.assertEqual(match['xRange'], [0, 1])
+        # Wrong aspect ratio
+        self.assertIsNone(library.match(0x0f0f, (200, 100)))
+        # Appending ends the cut line, which is loaded but never matched
+        library.add(0x1, (100, 80), calibration)
+        library = TemplateLibrary(self.path)
+        self.assertEqual(len(library), 4)
+        self.assertIsNone(library.match(0xffffffff00000000, (125, 100)))
+        self.assertEqual(library.match(0x1, (100, 80))['xRange'], [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()